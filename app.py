@@ -1,14 +1,25 @@
 from flask import Flask
-from datetime import timedelta
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
-from flask_jwt_extended import JWTManager
 
 from routes.members import members_bp
 from routes.auth import auth_bp
 from routes.teams import teams_bp
 from routes.team_members import teams_members_bp
+from routes.admin import admin_bp
+from routes.metrics import metrics_bp
+from routes.events import events_bp
+from core.auth import init_auth
+from core.config import ServerConfig
+from core.database import init_db
+from core.instrumentation import init_instrumentation
+from core.log import init_logging
+from core.metrics import init_metrics
+from core.json_provider import DTOJSONProvider
+from migrations.cli import db_cli
+from services.team_registry import init_team_registry
 
 load_dotenv()
 
@@ -18,7 +29,16 @@ cors_credentials = os.getenv("CORS_CREDENTIALS", "true").lower() == True
 
 
 def create_app():
+    init_logging()
     app = Flask(__name__)
+    app.json = DTOJSONProvider(app)
+    if ServerConfig.PROXY_HOPS:
+        # Client addresses (login rate limits) come from the proxies' headers
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app,
+            x_for=ServerConfig.PROXY_HOPS,
+            x_proto=ServerConfig.PROXY_HOPS,
+        )
     app.url_map.strict_slashes = False
     CORS(
         app,
@@ -30,15 +50,22 @@ def create_app():
             }
         },
     )
-    app.config["JWT_SECRET_KEY"] = "super-secret"
-    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=1)
-    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=30)
-    JWTManager(app)
+    init_auth(app)
+
+    init_db(app)
+    init_instrumentation(app)
+    init_metrics(app)
+    init_team_registry(app)
 
     app.register_blueprint(members_bp, url_prefix="/members")
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(teams_bp, url_prefix="/teams")
     app.register_blueprint(teams_members_bp, url_prefix="/team-members")
+    app.register_blueprint(admin_bp, url_prefix="/admin")
+    app.register_blueprint(metrics_bp, url_prefix="/metrics")
+    app.register_blueprint(events_bp, url_prefix="/events")
+
+    app.cli.add_command(db_cli)
 
     app.config["DEBUG"] = False
 
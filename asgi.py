@@ -0,0 +1,61 @@
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount
+
+from app import allowed_headers, cors_credentials, cors_origins
+from app import application as wsgi_application
+from core.async_database import create_async_pool
+from routes.async_api import async_routes
+
+
+def create_asgi_app(wsgi_app=wsgi_application):
+    """
+    ASGI app serving the hot read and assignment routes on aiomysql, with
+    the Flask app mounted behind them for every other route
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        pool = create_async_pool()
+        await pool.open()
+        app.state.db_pool = pool
+        try:
+            yield
+        finally:
+            await pool.close()
+
+    app = Starlette(
+        routes=async_routes + [Mount("", app=WSGIMiddleware(wsgi_app))],
+        middleware=[
+            Middleware(
+                CORSMiddleware,
+                allow_origins=cors_origins,
+                allow_headers=allowed_headers,
+                allow_credentials=cors_credentials,
+                allow_methods=["*"],
+            )
+        ],
+        lifespan=lifespan,
+    )
+    app.state.jwt_secret = wsgi_app.config["JWT_SECRET_KEY"]
+    app.state.jwt_algorithm = wsgi_app.config["JWT_ALGORITHM"]
+
+    return app
+
+
+application = create_asgi_app()
+
+if __name__ == "__main__":
+    import os
+
+    import uvicorn
+
+    uvicorn.run(
+        application,
+        host=os.getenv("APP_HOST", "0.0.0.0"),
+        port=int(os.getenv("APP_PORT", 8000)),
+    )
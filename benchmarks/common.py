@@ -0,0 +1,77 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Metrics where a lower value is better, every other one is higher-better
+LOWER_IS_BETTER = {"mean", "p50", "p95", "p99", "max", "errors", "spread"}
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(fraction * len(sorted_values))))
+    return sorted_values[rank]
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """mean/p50/p95/p99/max of durations in seconds, reported in ms"""
+    values = sorted(durations)
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "mean": sum(values) / len(values) * 1000,
+        "p50": percentile(values, 0.50) * 1000,
+        "p95": percentile(values, 0.95) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "max": values[-1] * 1000,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(
+    kind: str, params: Dict, results: Dict, output: Optional[str] = None
+) -> str:
+    """
+    Store a run as JSON, by default in benchmarks/results/
+
+    Returns:
+        str: Path of the written file
+    """
+    document = {
+        "kind": kind,
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "params": params,
+        },
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return output
@@ -0,0 +1,79 @@
+"""
+Compare two benchmark result files and flag regressions
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Exits with status 1 when a metric got worse by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.common import LOWER_IS_BETTER
+
+COMPARED = ("p50", "p95", "p99", "rps", "errors", "spread")
+
+
+def compare(baseline: dict, candidate: dict, threshold: float, min_ms: float):
+    """
+    Returns:
+        tuple: (rows of (name, metric, old, new, change, regressed), whether
+        any metric regressed)
+    """
+    rows = []
+    regressed_any = False
+    for name in sorted(set(baseline["results"]) & set(candidate["results"])):
+        old_metrics = baseline["results"][name]
+        new_metrics = candidate["results"][name]
+        for metric in COMPARED:
+            if metric not in old_metrics or metric not in new_metrics:
+                continue
+            old, new = old_metrics[metric], new_metrics[metric]
+            change = (new - old) / old if old else (0.0 if new == old else 1.0)
+            worse = change > 0 if metric in LOWER_IS_BETTER else change < 0
+            regressed = worse and abs(change) > threshold
+            # Sub-millisecond timings are too noisy to gate on
+            if metric.startswith("p") and max(old, new) < min_ms:
+                regressed = False
+            rows.append((name, metric, old, new, change, regressed))
+            regressed_any = regressed_any or regressed
+    return rows, regressed_any
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="relative change, 0.1 = 10%%"
+    )
+    parser.add_argument(
+        "--min-ms", type=float, default=1.0, help="ignore latencies below this"
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["kind"] != candidate["kind"]:
+        parser.error(f"cannot compare {baseline['kind']} with {candidate['kind']}")
+
+    rows, regressed = compare(baseline, candidate, args.threshold, args.min_ms)
+    for name, metric, old, new, change, is_regression in rows:
+        flag = "  REGRESSION" if is_regression else ""
+        print(
+            f"{name:45} {metric:7} {old:12.3f} -> {new:12.3f} "
+            f"({change:+7.1%}){flag}"
+        )
+
+    missing = set(baseline["results"]) - set(candidate["results"])
+    for name in sorted(missing):
+        print(f"{name:45} missing from the candidate run")
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Drive the API routes with concurrent clients and report latency percentiles
+
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 16
+
+Logs in with APP_USERNAME/APP_PASSWORD. Write scenarios change the data,
+run them against a seeded database (python -m benchmarks.seed).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from benchmarks.common import summarize, write_results
+
+load_dotenv()
+
+Request = Tuple[str, str, Optional[Dict]]
+
+
+class Client:
+    """Keep-alive HTTP client for one benchmark thread"""
+
+    def __init__(self, url: str, token: Optional[str] = None):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None):
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.conn.request(method, path, payload, self.headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server dropped the keep-alive connection, retry once
+            self.conn.close()
+            self.conn.request(method, path, payload, self.headers)
+            response = self.conn.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self.conn.close()
+
+
+def login(url: str) -> str:
+    client = Client(url)
+    status, body = client.request(
+        "POST",
+        "/auth/login",
+        {
+            "username": os.getenv("APP_USERNAME"),
+            "password": os.getenv("APP_PASSWORD"),
+        },
+    )
+    client.close()
+    if status != 200:
+        raise SystemExit(f"login failed with {status}: {body[:200]!r}")
+    return json.loads(body)["access_token"]
+
+
+def load_ids(url: str, token: str) -> Tuple[List[int], List[int]]:
+    """Member ids and playing team ids, for the write scenarios"""
+    client = Client(url, token)
+    _, body = client.request("GET", "/members?fields=id&limit=500")
+    member_ids = [member["id"] for member in json.loads(body)["data"]]
+    _, body = client.request("GET", "/teams")
+    team_ids = [
+        team["team_id"] for team in json.loads(body)["data"] if team["is_playing"]
+    ]
+    client.close()
+    return member_ids, team_ids
+
+
+def scenarios(member_ids: List[int], team_ids: List[int]) -> Dict[str, Callable]:
+    """Scenario name -> function of a Random returning (method, path, body)"""
+
+    def team_members(rng: random.Random) -> Request:
+        members = rng.sample(member_ids, min(10, len(member_ids)))
+        return (
+            "PATCH",
+            "/team-members",
+            {"teams": [{"id": rng.choice(team_ids), "members": members}]},
+        )
+
+    return {
+        "members": lambda rng: ("GET", "/members", None),
+        "members_page": lambda rng: ("GET", "/members?limit=50", None),
+        "teams": lambda rng: ("GET", "/teams", None),
+        "teams_players": lambda rng: ("GET", "/teams/players", None),
+        "teams_generate": lambda rng: ("POST", "/teams/generate", {}),
+        "team_members": team_members,
+        "members_connection": lambda rng: (
+            "PATCH",
+            "/members/connection",
+            {"is_logged_in": 1},
+        ),
+        # Dominated by PLG_PASSWORD_HASH_METHOD; raise the PLG_LOGIN_* limits
+        # of the server first or most attempts are answered with 429
+        "login": lambda rng: (
+            "POST",
+            "/auth/login",
+            {
+                "username": os.getenv("APP_USERNAME"),
+                "password": os.getenv("APP_PASSWORD"),
+            },
+        ),
+    }
+
+
+def run_scenario(
+    url: str,
+    token: str,
+    build: Callable[[random.Random], Request],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+) -> Dict:
+    durations: List[List[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def worker(index: int):
+        rng = random.Random(seed + index)
+        client = Client(url, token)
+        try:
+            while True:
+                method, path, body = build(rng)
+                started = time.monotonic()
+                if started >= stop_at:
+                    return
+                try:
+                    status, _ = client.request(method, path, body)
+                except (http.client.HTTPException, OSError):
+                    status = 0
+                if started < start_at:
+                    continue
+                durations[index].append(time.monotonic() - started)
+                if not 200 <= status < 400:
+                    errors[index] += 1
+        finally:
+            client.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(index,)) for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_durations = [value for values in durations for value in values]
+    return dict(
+        summarize(all_durations),
+        requests=len(all_durations),
+        errors=sum(errors),
+        rps=len(all_durations) / duration,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds")
+    parser.add_argument(
+        "--scenarios", help="comma separated, default: every scenario but login"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file, default benchmarks/results/")
+    args = parser.parse_args()
+
+    token = login(args.url)
+    member_ids, team_ids = load_ids(args.url, token)
+    available = scenarios(member_ids, team_ids)
+    names = (
+        args.scenarios.split(",")
+        if args.scenarios
+        else [name for name in available if name != "login"]
+    )
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(
+            args.url,
+            token,
+            available[name],
+            args.concurrency,
+            args.duration,
+            args.warmup,
+            args.seed,
+        )
+        metrics = results[name]
+        print(
+            f"{name:20} {metrics['rps']:8.1f} req/s  p50 {metrics['p50']:8.2f} ms  "
+            f"p95 {metrics['p95']:8.2f} ms  p99 {metrics['p99']:8.2f} ms  "
+            f"errors {metrics['errors']}"
+        )
+
+    params = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "sampled_members": len(member_ids),
+        "teams": len(team_ids),
+    }
+    print(f"results written to {write_results('load', params, results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Micro-benchmarks of the balancer and of the team rows aggregation
+
+    python -m benchmarks.micro [--quick] [--output results.json]
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.common import summarize, write_results
+from repositories.team import TeamRepository
+from services.team_balancer import TeamBalancer
+
+
+def _time(run: Callable[[], object], repeat: int) -> List[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _players(count: int, rng: random.Random) -> List[Dict]:
+    return [
+        {"id": i, "name": f"player{i}", "weight": rng.randint(1, 100)}
+        for i in range(count)
+    ]
+
+
+def _teams(count: int) -> List[Dict]:
+    sides = ("CounterTerrorist", "Terrorist")
+    return [
+        {"team_id": i + 1, "name": f"Team {i + 1}", "side": sides[i % 2]}
+        for i in range(count)
+    ]
+
+
+def bench_balancer(
+    player_counts, team_counts, time_budget: float, repeat: int, seed: int
+) -> Dict:
+    results = {}
+    rng = random.Random(seed)
+    for player_count in player_counts:
+        players = _players(player_count, rng)
+        for team_count in team_counts:
+            if team_count > player_count:
+                continue
+            teams = _teams(team_count)
+            for strategy in TeamBalancer.STRATEGIES:
+                outcome = {}
+
+                def run():
+                    outcome["result"] = TeamBalancer(teams).balance(
+                        players, strategy, time_budget
+                    )
+
+                durations = _time(run, repeat)
+                name = f"balancer/{strategy}/{player_count}p/{team_count}t"
+                results[name] = dict(
+                    summarize(durations), spread=outcome["result"].spread
+                )
+    return results
+
+
+def _team_rows(member_count: int, team_count: int, rng: random.Random) -> List[Dict]:
+    """TEAMS_WITH_PLAYERS_QUERY rows, ordered by team"""
+    rows = []
+    for member_id in range(member_count):
+        team_id = member_id % team_count + 1
+        rows.append(
+            {
+                "team_id": team_id,
+                "name": f"Team {team_id}",
+                "channel_id": None,
+                "side": None,
+                "is_playing": 1,
+                "hostname": None,
+                "player_id": member_id,
+                "player_name": f"player{member_id}",
+                "player_weight": rng.randint(1, 100),
+            }
+        )
+    rows.sort(key=lambda row: row["team_id"])
+    return rows
+
+
+def bench_aggregate(member_counts, team_count: int, repeat: int, seed: int) -> Dict:
+    results = {}
+    rng = random.Random(seed)
+    repo = TeamRepository(cursor=None)
+    for member_count in member_counts:
+        rows = _team_rows(member_count, team_count, rng)
+        durations = _time(lambda: repo._aggregate_team_data(rows), repeat)
+        results[f"aggregate_team_data/{member_count}m/{team_count}t"] = summarize(
+            durations
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--time-budget", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file, default benchmarks/results/")
+    args = parser.parse_args()
+
+    if args.quick:
+        player_counts, team_counts, member_counts = [10, 40], [2, 4], [1000]
+    else:
+        player_counts = [10, 20, 40, 100, 1000]
+        team_counts = [2, 4, 8, 16, 32]
+        member_counts = [1000, 10000, 100000]
+
+    results = bench_balancer(
+        player_counts, team_counts, args.time_budget, args.repeat, args.seed
+    )
+    results.update(bench_aggregate(member_counts, 8, args.repeat, args.seed))
+
+    for name, metrics in sorted(results.items()):
+        spread = f"  spread {metrics['spread']:g}" if "spread" in metrics else ""
+        print(
+            f"{name:45} p50 {metrics['p50']:9.3f} ms  "
+            f"p95 {metrics['p95']:9.3f} ms{spread}"
+        )
+
+    params = {
+        "repeat": args.repeat,
+        "time_budget": args.time_budget,
+        "seed": args.seed,
+        "quick": args.quick,
+    }
+    print(f"results written to {write_results('micro', params, results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
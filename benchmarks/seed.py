@@ -0,0 +1,117 @@
+"""
+Fill the database configured by PLG_* with benchmark data
+
+    python -m benchmarks.seed --members 10000 --teams 8 --reset
+
+Run `flask --app app db upgrade` first. --reset deletes every member, team
+and assignment, never point it at a database holding real data.
+"""
+
+import argparse
+import os
+import random
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from core.config import TeamConfig
+from repositories.member import MemberRepository
+from repositories.team import TeamRepository
+from repositories.team_member import TeamMemberRepository
+
+load_dotenv()
+
+SIDES = ("CounterTerrorist", "Terrorist")
+
+
+def seed(cursor, members: int, teams: int, logged_in: float, seed_value: int):
+    rng = random.Random(seed_value)
+    team_repo = TeamRepository(cursor)
+
+    team_ids = [
+        team_repo.add_team(
+            {
+                "name": TeamConfig.NO_TEAM_NAME,
+                "side": None,
+                "channel_id": None,
+                "is_playing": 0,
+                "hostname": None,
+            }
+        )
+    ]
+    for i in range(teams):
+        team_ids.append(
+            team_repo.add_team(
+                {
+                    "name": f"Team {i + 1}",
+                    "side": SIDES[i % 2],
+                    "channel_id": str(10**17 + i),
+                    "is_playing": 1,
+                    "hostname": None,
+                }
+            )
+        )
+
+    member_ids = MemberRepository(cursor).add_members(
+        [
+            {
+                "discord_id": str(2 * 10**17 + i),
+                "name": f"player{i}",
+                "steam_id": str(76561197960265728 + i),
+                "weight": rng.randint(1, 100),
+                "smoke_color": "#{:06x}".format(rng.randrange(0x1000000)),
+                "is_logged_in": rng.random() < logged_in,
+            }
+            for i in range(members)
+        ]
+    )
+
+    # Everyone starts in a team, a quarter of them in NoTeam
+    TeamMemberRepository(cursor).assign_many(
+        (member_id, team_ids[0] if rng.random() < 0.25 else rng.choice(team_ids[1:]))
+        for member_id in member_ids
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=8, help="playing teams")
+    parser.add_argument(
+        "--logged-in", type=float, default=0.8, help="share of connected members"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--reset", action="store_true", help="delete existing data first"
+    )
+    args = parser.parse_args()
+
+    db = mysql.connector.connect(
+        host=os.getenv("PLG_HOST"),
+        user=os.getenv("PLG_USERNAME"),
+        password=os.getenv("PLG_PASSWORD"),
+        database=os.getenv("PLG_DATABASE"),
+        port=os.getenv("PLG_PORT"),
+        charset="utf8mb4",
+        collation="utf8mb4_general_ci",
+    )
+    cursor = db.cursor(dictionary=True)
+    try:
+        if args.reset:
+            for table in ("team_stats", "team_members", "members", "teams"):
+                cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.execute("SELECT COUNT(*) AS count FROM teams")
+            if cursor.fetchone()["count"]:
+                parser.error("the database already has teams, use --reset")
+        seed(cursor, args.members, args.teams, args.logged_in, args.seed)
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+
+    print(f"seeded {args.members} members in {args.teams} playing teams")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+from dotenv import load_dotenv
+
+from core.cache import begin_invalidations, end_invalidations
+from core.events import begin_events, end_events
+from core.config import PoolConfig
+from core.database import PoolTimeoutError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncConnectionPool:
+    """
+    aiomysql pool for the ASGI app, sized and recycled like ConnectionPool.
+
+    Connections are opened lazily up to `size` and reopened once older than
+    `recycle` seconds. Waiting for a free connection suspends the request
+    instead of blocking the worker, so a single worker can keep many slow
+    clients in flight.
+    """
+
+    def __init__(
+        self,
+        size: int = PoolConfig.SIZE,
+        timeout: float = PoolConfig.TIMEOUT,
+        recycle: float = PoolConfig.RECYCLE,
+        **connect_args,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._connect_args = connect_args
+        self._pool = None
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def open(self) -> None:
+        self._pool = await aiomysql.create_pool(
+            minsize=0,
+            maxsize=self.size,
+            pool_recycle=int(self.recycle),
+            autocommit=False,
+            **self._connect_args,
+        )
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection, waiting at most `timeout` seconds"""
+        start = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeoutError(
+                f"No database connection available after {self.timeout}s"
+            )
+
+        waited = time.monotonic() - start
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+        try:
+            yield conn
+        finally:
+            self._pool.release(conn)
+
+    def stats(self) -> dict:
+        pool = self._pool
+        return {
+            "size": self.size,
+            "opened": pool.size if pool else 0,
+            "in_use": pool.size - pool.freesize if pool else 0,
+            "idle": pool.freesize if pool else 0,
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+            "wait_avg_ms": (
+                self._wait_total / self._checkouts * 1000 if self._checkouts else 0.0
+            ),
+            "wait_max_ms": self._wait_max * 1000,
+        }
+
+
+def create_async_pool() -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        host=os.getenv("PLG_HOST"),
+        user=os.getenv("PLG_USERNAME"),
+        password=os.getenv("PLG_PASSWORD"),
+        db=os.getenv("PLG_DATABASE"),
+        port=int(os.getenv("PLG_PORT", 3306)),
+        charset="utf8mb4",
+    )
+
+
+@asynccontextmanager
+async def async_transaction(pool: AsyncConnectionPool):
+    """Async counterpart of database_transaction, yields (db, cursor)"""
+    async with pool.connection() as db:
+        token = begin_invalidations()
+        events_token = begin_events()
+        committed = False
+        try:
+            async with db.cursor(aiomysql.DictCursor) as cursor:
+                yield db, cursor
+            await db.commit()
+            committed = True
+        except Exception as e:
+            logger.error(f"db transaction error : {str(e)}")
+            await db.rollback()
+            raise
+        finally:
+            end_invalidations(token, committed)
+            end_events(events_token, committed)
+
+
+@asynccontextmanager
+async def async_streaming_cursor(pool: AsyncConnectionPool):
+    """
+    Unbuffered cursor on a connection of its own, for results streamed to
+    the client; the connection is dropped when the stream is abandoned
+    """
+    async with pool.connection() as db:
+        cursor = await db.cursor(aiomysql.SSDictCursor)
+        finished = False
+        try:
+            yield cursor
+            finished = True
+        finally:
+            if finished:
+                await cursor.close()
+            else:
+                # Closing the cursor would read the rest of the result first;
+                # a closed connection is dropped by the pool on release
+                db.close()
@@ -0,0 +1,233 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional
+
+from flask_jwt_extended import JWTManager
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from core.config import AuthConfig, LoginConfig, SharedStateConfig
+from core.versioning import _LockF
+
+
+def _token_key(encoded_token) -> bytes:
+    if isinstance(encoded_token, str):
+        encoded_token = encoded_token.encode()
+    return hashlib.sha256(encoded_token).digest()
+
+
+class ClaimsCache:
+    """
+    Bounded LRU cache of the claims of verified tokens, keyed by the hash of
+    the token. A token is only found again if it is byte for byte the one
+    that was verified, so its signature holds; expired entries are misses.
+    """
+
+    def __init__(self, max_size: int = AuthConfig.CLAIMS_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, encoded_token) -> Optional[dict]:
+        key = _token_key(encoded_token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None and claims.get("exp", float("inf")) > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(claims)
+            if claims is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, encoded_token, claims: dict) -> None:
+        if self.max_size <= 0:
+            return
+        key = _token_key(encoded_token)
+        with self._lock:
+            self._entries[key] = dict(claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RevocationList:
+    """
+    Ids (jti) of revoked tokens, kept until the tokens expire.
+
+    With a `directory` every revocation is appended to a file there, which
+    the worker processes read again when it grew; otherwise the list is
+    local to this process. Checking a token is a dict lookup.
+    """
+
+    FILE_NAME = "revoked_tokens"
+
+    def __init__(self, directory: Optional[str] = SharedStateConfig.DIR):
+        self._lock = threading.Lock()
+        # jti -> expiry timestamp
+        self._revoked: Dict[str, float] = {}
+        self._fd = None
+        self._offset = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(
+                os.path.join(directory, self.FILE_NAME),
+                os.O_RDWR | os.O_CREAT | os.O_APPEND,
+            )
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._prune()
+            self._revoked[jti] = expires_at
+            if self._fd is not None:
+                with _LockF(self._fd):
+                    os.write(self._fd, f"{jti} {expires_at}\n".encode())
+
+    def is_revoked(self, jti: str) -> bool:
+        if self._fd is not None and os.fstat(self._fd).st_size > self._offset:
+            self._read_new_entries()
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def _read_new_entries(self) -> None:
+        with self._lock:
+            with _LockF(self._fd):
+                size = os.fstat(self._fd).st_size
+                data = os.pread(self._fd, size - self._offset, self._offset)
+                self._offset = size
+            for line in data.decode().splitlines():
+                jti, _, expires_at = line.partition(" ")
+                self._revoked[jti] = float(expires_at)
+            self._prune()
+
+    def _prune(self) -> None:
+        # Expired tokens are refused anyway
+        now = time.time()
+        for jti in [jti for jti, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[jti]
+
+
+class RedisRevocationList:
+    """
+    Revocation list kept in a Redis compatible server, one key per token
+    expiring with it, shared by every process using the same server
+    """
+
+    PREFIX = "plg:revoked:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("PLG_REDIS_URL requires the redis package") from e
+        self._client = redis.Redis.from_url(url)
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        ttl = int(expires_at - time.time()) + 1
+        if ttl > 0:
+            self._client.set(self.PREFIX + jti, 1, ex=ttl)
+
+    def is_revoked(self, jti: str) -> bool:
+        return bool(self._client.exists(self.PREFIX + jti))
+
+
+def create_revocation_list():
+    if AuthConfig.REDIS_URL:
+        return RedisRevocationList(AuthConfig.REDIS_URL)
+    return RevocationList()
+
+
+claims_cache = ClaimsCache()
+revoked_tokens = create_revocation_list()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager verifying a token once, then reading its claims from cache"""
+
+    def _decode_jwt_from_config(
+        self, encoded_token: str, csrf_value=None, allow_expired: bool = False
+    ) -> dict:
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(
+                encoded_token, csrf_value, allow_expired
+            )
+        claims = claims_cache.get(encoded_token)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token)
+            claims_cache.put(encoded_token, claims)
+        return claims
+
+
+class Credentials:
+    """The API account, its password kept as a hash only"""
+
+    def __init__(self, username: Optional[str], password_hash: Optional[str]):
+        self.username = username
+        self.password_hash = password_hash
+
+    @classmethod
+    def from_env(cls) -> "Credentials":
+        """APP_USERNAME, and APP_PASSWORD_HASH or else APP_PASSWORD"""
+        password_hash = os.getenv("APP_PASSWORD_HASH")
+        password = os.getenv("APP_PASSWORD")
+        if not password_hash and password is not None:
+            password_hash = generate_password_hash(
+                password, LoginConfig.PASSWORD_HASH_METHOD
+            )
+        return cls(os.getenv("APP_USERNAME"), password_hash)
+
+    def check(self, username: str, password: str) -> bool:
+        if self.username is None or self.password_hash is None:
+            return False
+        username_ok = hmac.compare_digest(
+            username.encode("utf-8"), self.username.encode("utf-8")
+        )
+        # Hash the password even for a wrong username, so both failures take
+        # as long and the username is not revealed by the timing
+        password_ok = check_password_hash(self.password_hash, password)
+        return username_ok and password_ok
+
+
+def revoke_token(claims: dict) -> None:
+    revoked_tokens.revoke(claims["jti"], claims.get("exp", time.time()))
+
+
+def init_auth(app):
+    """Configure token signing and verification"""
+    app.config["JWT_SECRET_KEY"] = AuthConfig.SECRET_KEY
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(
+        seconds=AuthConfig.ACCESS_EXPIRES
+    )
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(
+        seconds=AuthConfig.REFRESH_EXPIRES
+    )
+    jwt_manager = CachingJWTManager(app)
+    app.extensions["credentials"] = Credentials.from_env()
+
+    @jwt_manager.token_in_blocklist_loader
+    def is_revoked(jwt_header, jwt_payload):
+        return revoked_tokens.is_revoked(jwt_payload["jti"])
+
+    return jwt_manager
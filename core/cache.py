@@ -0,0 +1,214 @@
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from flask import g, has_app_context
+
+from core.config import CacheConfig
+from core.versioning import data_versions
+
+
+_MISS = object()
+
+
+class ReadCache:
+    """
+    Bounded LRU cache of repository reads with a TTL.
+
+    Every entry is tagged with the tables it was read from and the data
+    versions they had when it was loaded. `invalidate()` bumps the versions
+    of the tables a write touched and drops their entries; entries whose
+    versions were bumped by another worker process are treated as misses.
+    A read that raced with a write never stores its stale result.
+    """
+
+    def __init__(
+        self, max_size: int = CacheConfig.MAX_SIZE, ttl: float = CacheConfig.TTL
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._keys_by_table: Dict[str, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(
+        self, key: Hashable, tables: Tuple[str, ...], loader: Callable[[], Any]
+    ) -> Any:
+        now, versions, value = self._lookup(key, tables)
+        if value is _MISS:
+            value = loader()
+            self._store_if_current(key, tables, versions, value, now)
+        return value
+
+    async def get_or_load_async(
+        self,
+        key: Hashable,
+        tables: Tuple[str, ...],
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        now, versions, value = self._lookup(key, tables)
+        if value is _MISS:
+            value = await loader()
+            self._store_if_current(key, tables, versions, value, now)
+        return value
+
+    def invalidate(self, *tables: str) -> None:
+        data_versions.bump(*tables)
+        with self._lock:
+            for table in tables:
+                for key in self._keys_by_table.pop(table, ()):
+                    if self._drop(key):
+                        self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _lookup(self, key, tables):
+        now = time.monotonic()
+        versions = data_versions.get(*tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[2] == versions:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return now, versions, entry[3]
+            self.misses += 1
+        return now, versions, _MISS
+
+    def _store_if_current(self, key, tables, versions, value, loaded_at) -> None:
+        if data_versions.get(*tables) == versions:
+            with self._lock:
+                self._store(key, tables, versions, value, loaded_at + self.ttl)
+
+    def _store(self, key, tables, versions, value, expires_at) -> None:
+        self._drop(key)
+        self._entries[key] = (expires_at, tables, versions, value)
+        for table in tables:
+            self._keys_by_table.setdefault(table, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for table in entry[1]:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+        return True
+
+
+read_cache = ReadCache()
+
+# Tables written by the current async transaction, outside of Flask
+_pending_tables: ContextVar[Optional[Set[str]]] = ContextVar(
+    "pending_tables", default=None
+)
+
+
+def _dirty_tables() -> Optional[Set[str]]:
+    if has_app_context():
+        return g.get("dirty_tables")
+    return _pending_tables.get()
+
+
+def invalidate_on_commit(*tables: str) -> None:
+    """Mark tables as written; their cached reads are dropped on commit"""
+    if has_app_context():
+        g.setdefault("dirty_tables", set()).update(tables)
+    elif _pending_tables.get() is not None:
+        _pending_tables.get().update(tables)
+    else:
+        read_cache.invalidate(*tables)
+
+
+def flush_invalidations() -> None:
+    """Called once the transaction is committed"""
+    tables = g.pop("dirty_tables", None)
+    if tables:
+        read_cache.invalidate(*tables)
+
+
+def discard_invalidations() -> None:
+    """Called when the transaction is rolled back"""
+    g.pop("dirty_tables", None)
+
+
+def begin_invalidations() -> Token:
+    """Start collecting the tables written by an async transaction"""
+    return _pending_tables.set(set())
+
+
+def end_invalidations(token: Token, committed: bool) -> None:
+    """Invalidate the collected tables if the async transaction committed"""
+    tables = _pending_tables.get()
+    _pending_tables.reset(token)
+    if committed and tables:
+        read_cache.invalidate(*tables)
+
+
+def cached_read(*tables: str):
+    """
+    Cache a repository read method, keyed by its name and arguments.
+
+    The cache is bypassed when the current transaction already wrote to one
+    of `tables`, so a request always reads its own writes. Callers must not
+    mutate the returned rows. Coroutine methods are cached the same way.
+    """
+
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+
+            @wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                if (_dirty_tables() or set()) & set(tables):
+                    return await method(self, *args, **kwargs)
+
+                key = (method.__qualname__, args, tuple(sorted(kwargs.items())))
+                return await read_cache.get_or_load_async(
+                    key, tables, lambda: method(self, *args, **kwargs)
+                )
+
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if (_dirty_tables() or set()) & set(tables):
+                return method(self, *args, **kwargs)
+
+            key = (method.__qualname__, args, tuple(sorted(kwargs.items())))
+            return read_cache.get_or_load(
+                key, tables, lambda: method(self, *args, **kwargs)
+            )
+
+        return wrapper
+
+    return decorator
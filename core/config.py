@@ -1,4 +1,9 @@
 from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
 
 
 @dataclass
@@ -9,6 +14,164 @@ class TeamConfig:
     MIN_WEIGHT: int = 0
 
 
+@dataclass
+class PoolConfig:
+    SIZE: int = int(os.getenv("PLG_POOL_SIZE", 8))
+    # Seconds to wait for a free connection before giving up
+    TIMEOUT: float = float(os.getenv("PLG_POOL_TIMEOUT", 5))
+    # Connections older than this many seconds are reopened on checkout
+    RECYCLE: float = float(os.getenv("PLG_POOL_RECYCLE", 3600))
+    # Connections idle for longer than this are pinged before being reused
+    PING_AFTER: float = float(os.getenv("PLG_POOL_PING_AFTER", 30))
+
+
+@dataclass
+class BatchConfig:
+    # Rows per multi-row statement for bulk writes
+    CHUNK_SIZE: int = int(os.getenv("PLG_BATCH_CHUNK_SIZE", 500))
+    # Rows fetched from the server at a time when streaming exports
+    STREAM_FETCH_SIZE: int = int(os.getenv("PLG_STREAM_FETCH_SIZE", 500))
+
+
+@dataclass
+class PaginationConfig:
+    DEFAULT_LIMIT: int = 50
+    MAX_LIMIT: int = 500
+
+
+@dataclass
+class BalancerConfig:
+    DEFAULT_STRATEGY: str = os.getenv("PLG_BALANCER_STRATEGY", "local_search")
+    # Seconds a strategy may spend refining its solution
+    TIME_BUDGET: float = float(os.getenv("PLG_BALANCER_TIME_BUDGET", 0.2))
+    MAX_TIME_BUDGET: float = 5.0
+    # Seconds the constrained solver may spend finding a first feasible
+    # assignment, whatever the time budget of the request
+    FEASIBLE_TIME_BUDGET: float = float(
+        os.getenv("PLG_BALANCER_FEASIBLE_TIME_BUDGET", 2.0)
+    )
+    # Rosters up to this size are searched exhaustively by "local_search" and
+    # the constrained solver, within the time budget
+    EXACT_MAX_PLAYERS: int = 24
+
+
+@dataclass
+class CacheConfig:
+    # Seconds a cached read stays valid when no write invalidates it
+    TTL: float = float(os.getenv("PLG_CACHE_TTL", 5))
+    MAX_SIZE: int = int(os.getenv("PLG_CACHE_MAX_SIZE", 256))
+
+
+@dataclass
+class SharedStateConfig:
+    # Directory holding state shared by worker processes (data versions).
+    # Leave unset for a single process server.
+    DIR: Optional[str] = os.getenv("PLG_SHARED_STATE_DIR")
+
+
+@dataclass
+class QueryLogConfig:
+    # Statements slower than this many milliseconds go to the slow query log
+    SLOW_QUERY_MS: float = float(os.getenv("PLG_SLOW_QUERY_MS", 100))
+    # Number of slow statements kept, the oldest are dropped first
+    SLOW_QUERY_LOG_SIZE: int = int(os.getenv("PLG_SLOW_QUERY_LOG_SIZE", 200))
+    # Requests running more statements than this are logged as warnings
+    MAX_QUERIES_PER_REQUEST: int = int(os.getenv("PLG_MAX_QUERIES_PER_REQUEST", 20))
+
+
+@dataclass
+class MetricsConfig:
+    # Seconds between two writes of a worker's metrics to the shared directory
+    FLUSH_INTERVAL: float = float(os.getenv("PLG_METRICS_FLUSH_INTERVAL", 1))
+    # Bearer token GET /metrics requires, open to anyone when unset
+    TOKEN: Optional[str] = os.getenv("PLG_METRICS_TOKEN")
+
+
+@dataclass
+class AuthConfig:
+    # Key signing the tokens, set it in production
+    SECRET_KEY: str = os.getenv("PLG_JWT_SECRET_KEY", "super-secret")
+    # Lifetimes of access and refresh tokens, in seconds
+    ACCESS_EXPIRES: int = int(os.getenv("PLG_JWT_ACCESS_EXPIRES", 86400))
+    REFRESH_EXPIRES: int = int(os.getenv("PLG_JWT_REFRESH_EXPIRES", 30 * 86400))
+    # Verified tokens whose claims are kept, 0 verifies every request
+    CLAIMS_CACHE_SIZE: int = int(os.getenv("PLG_JWT_CACHE_SIZE", 1024))
+    # Redis compatible server holding revoked tokens, instead of
+    # PLG_SHARED_STATE_DIR or the memory of this process
+    REDIS_URL: Optional[str] = os.getenv("PLG_REDIS_URL")
+
+
+@dataclass
+class LoginConfig:
+    # werkzeug method hashing APP_PASSWORD when APP_PASSWORD_HASH is unset,
+    # e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000; the cost of every login
+    PASSWORD_HASH_METHOD: str = os.getenv(
+        "PLG_PASSWORD_HASH_METHOD", "scrypt:32768:8:1"
+    )
+    # Login attempts allowed at once, then per second, for each client IP
+    IP_BURST: int = int(os.getenv("PLG_LOGIN_IP_BURST", 10))
+    IP_RATE: float = float(os.getenv("PLG_LOGIN_IP_RATE", 1))
+    # Same for each username
+    USER_BURST: int = int(os.getenv("PLG_LOGIN_USER_BURST", 5))
+    USER_RATE: float = float(os.getenv("PLG_LOGIN_USER_RATE", 0.2))
+    # Clients remembered by each limiter, the least recently seen go first
+    MAX_CLIENTS: int = int(os.getenv("PLG_LOGIN_MAX_CLIENTS", 10000))
+
+
+@dataclass
+class EventsConfig:
+    # Recent events kept for clients reconnecting with Last-Event-ID
+    BUFFER_SIZE: int = int(os.getenv("PLG_EVENTS_BUFFER_SIZE", 1000))
+    # Clients streamed to by one process, see gunicorn.conf.py for gthread
+    MAX_SUBSCRIBERS: int = int(os.getenv("PLG_EVENTS_MAX_SUBSCRIBERS", 1000))
+    # Seconds between two reads of the events of the other workers
+    POLL_INTERVAL: float = float(os.getenv("PLG_EVENTS_POLL_INTERVAL", 0.1))
+    # Seconds of silence after which a keepalive comment is sent
+    HEARTBEAT: float = float(os.getenv("PLG_EVENTS_HEARTBEAT", 15))
+    # Delay before a disconnected client reconnects, sent to the clients
+    RETRY_MS: int = int(os.getenv("PLG_EVENTS_RETRY_MS", 3000))
+
+
+@dataclass
+class LogConfig:
+    # Level of every logger without a level of its own
+    LEVEL: str = os.getenv("PLG_LOG_LEVEL", "INFO").upper()
+    # Per logger levels, "routes.teams=DEBUG,plg.db=WARNING"
+    LEVELS: str = os.getenv("PLG_LOG_LEVELS", "")
+    # json, one object per line, or text
+    FORMAT: str = os.getenv("PLG_LOG_FORMAT", "json")
+    # Only one in this many debug records of each call site is written
+    DEBUG_SAMPLE: int = int(os.getenv("PLG_LOG_DEBUG_SAMPLE", 1))
+    # Records waiting for the writer thread; more are dropped, never waited on
+    QUEUE_SIZE: int = int(os.getenv("PLG_LOG_QUEUE_SIZE", 10000))
+
+
+@dataclass
+class ServerConfig:
+    # Production server settings read by gunicorn.conf.py
+    BIND: str = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '8000')}"
+    # sync, gthread, gevent or uvicorn.workers.UvicornWorker for asgi.py
+    # (gevent and uvicorn have to be installed separately)
+    WORKER_CLASS: str = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+    # Derived from the CPU count when unset
+    WORKERS: Optional[int] = (
+        int(os.environ["GUNICORN_WORKERS"])
+        if "GUNICORN_WORKERS" in os.environ
+        else None
+    )
+    THREADS: int = int(os.getenv("GUNICORN_THREADS", 4))
+    # Concurrent clients per gevent worker
+    WORKER_CONNECTIONS: int = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+    # Workers are recycled after this many requests, plus up to the jitter
+    MAX_REQUESTS: int = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+    MAX_REQUESTS_JITTER: int = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+    TIMEOUT: int = int(os.getenv("GUNICORN_TIMEOUT", 30))
+    # Reverse proxies in front of the app whose X-Forwarded-For and
+    # X-Forwarded-Proto are trusted; 0 uses the address of the peer, which is
+    # the proxy's own when there is one
+    PROXY_HOPS: int = int(os.getenv("PLG_PROXY_HOPS", 0))
+
+
 class Config:
     """Application configuration"""
 
@@ -1,37 +1,232 @@
 import mysql.connector
 import logging
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
-from flask import g
+from flask import g, current_app
 from dotenv import load_dotenv
 import os
 
+from core.config import PoolConfig
+from core.cache import flush_invalidations, discard_invalidations
+from core.events import discard_events, flush_events
+from core.instrumentation import instrument
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of MySQL connections shared by every request.
+
+    Connections are opened lazily up to `size`, handed out LIFO so the
+    warmest ones get reused, pinged when they sat idle for more than
+    `ping_after` seconds and reopened once older than `recycle` seconds.
+    """
+
+    RATE_WINDOW = 60
+
+    def __init__(
+        self,
+        size: int = PoolConfig.SIZE,
+        timeout: float = PoolConfig.TIMEOUT,
+        recycle: float = PoolConfig.RECYCLE,
+        ping_after: float = PoolConfig.PING_AFTER,
+        **connect_args,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._connect_args = connect_args
+        self._cond = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        """Drop every idle connection and start over with empty stats"""
+        with self._cond:
+            idle = getattr(self, "_idle", ())
+            for conn, _, _ in idle:
+                self._close_quietly(conn)
+            self._idle = deque()
+            self._in_use = {}
+            self._opened = 0
+            self._checkouts = 0
+            self._timeouts = 0
+            self._wait_total = 0.0
+            self._wait_max = 0.0
+            self._rate_secs = [0] * self.RATE_WINDOW
+            self._rate_counts = [0] * self.RATE_WINDOW
+
+    def checkout(self):
+        """Borrow a connection, waiting at most `timeout` seconds"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        with self._cond:
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn, created_at, last_used = self._idle.pop()
+            else:
+                conn, created_at, last_used = None, None, None
+                self._opened += 1
+
+            self._record_checkout(start)
+
+        try:
+            if conn is None:
+                conn, created_at = self._connect(), time.monotonic()
+            else:
+                conn, created_at = self._revalidate(conn, created_at, last_used)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use[id(conn)] = created_at
+        return conn
+
+    def checkin(self, conn, discard: bool = False):
+        """Give a connection back, closing it if it is no longer usable"""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                return
+
+            if discard:
+                self._opened -= 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = int(time.monotonic())
+            recent = sum(
+                count
+                for sec, count in zip(self._rate_secs, self._rate_counts)
+                if now - sec < self.RATE_WINDOW
+            )
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": (
+                    self._wait_total / self._checkouts * 1000
+                    if self._checkouts
+                    else 0.0
+                ),
+                "wait_max_ms": self._wait_max * 1000,
+                "checkouts_per_sec": recent / self.RATE_WINDOW,
+            }
+
+    def _record_checkout(self, start: float):
+        now = time.monotonic()
+        waited = now - start
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+        sec = int(now)
+        slot = sec % self.RATE_WINDOW
+        if self._rate_secs[slot] != sec:
+            self._rate_secs[slot] = sec
+            self._rate_counts[slot] = 0
+        self._rate_counts[slot] += 1
+
+    def _connect(self):
+        return mysql.connector.connect(**self._connect_args)
+
+    def _revalidate(self, conn, created_at: float, last_used: float):
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            self._close_quietly(conn)
+            return self._connect(), now
+
+        if now - last_used > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(conn)
+                return self._connect(), now
+
+        return conn, created_at
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def init_db(app):
+    """Create the shared connection pool for this application"""
+    app.extensions["db_pool"] = ConnectionPool(
+        host=os.getenv("PLG_HOST"),
+        user=os.getenv("PLG_USERNAME"),
+        password=os.getenv("PLG_PASSWORD"),
+        database=os.getenv("PLG_DATABASE"),
+        port=os.getenv("PLG_PORT"),
+        charset="utf8mb4",
+        collation="utf8mb4_general_ci",
+    )
+    app.teardown_appcontext(close_db)
+
+
+def get_pool() -> ConnectionPool:
+    return current_app.extensions["db_pool"]
+
 
 def get_db():
     if "db" not in g:
-        g.db = mysql.connector.connect(
-            host=os.getenv("PLG_HOST"),
-            user=os.getenv("PLG_USERNAME"),
-            password=os.getenv("PLG_PASSWORD"),
-            database=os.getenv("PLG_DATABASE"),
-            port=os.getenv("PLG_PORT"),
-            charset="utf8mb4",
-            collation="utf8mb4_general_ci",
-            pool_size=8,
-            pool_reset_session=False,
-        )
-        g.cursor = g.db.cursor(dictionary=True)
+        g.db = get_pool().checkout()
+        g.cursor = instrument(g.db.cursor(dictionary=True))
     return g.db, g.cursor
 
 
 def close_db(e=None):
     db = g.pop("db", None)
     cursor = g.pop("cursor", None)
+    discard_invalidations()
+    discard_events()
     if cursor is not None:
-        cursor.close()
+        try:
+            cursor.close()
+        except Exception:
+            pass
     if db is not None:
-        db.close()
+        get_pool().checkin(db)
 
 
 @contextmanager
@@ -41,9 +236,33 @@ def database_transaction():
     try:
         yield db, cursor
         db.commit()
+        flush_invalidations()
+        flush_events()
     except Exception as e:
-        logging.error(f"db transactions error : {str(e)}")
+        logger.error(f"db transaction error : {str(e)}")
         db.rollback()
         raise
     finally:
         close_db(db)
+
+
+@contextmanager
+def streaming_cursor():
+    """
+    Cursor on a connection of its own, for results that are streamed to the
+    client after the view has returned. The connection is dropped instead of
+    reused when the stream is abandoned halfway.
+    """
+    pool = get_pool()
+    conn = pool.checkout()
+    cursor = instrument(conn.cursor(dictionary=True))
+    finished = False
+    try:
+        yield cursor
+        finished = True
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            finished = False
+        pool.checkin(conn, discard=not finished)
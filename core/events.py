@@ -0,0 +1,300 @@
+"""
+Change events pushed to clients as Server-Sent Events
+
+Routes call publish_on_commit(); the events reach the broker once the
+transaction is committed, and every subscriber streams the ones it has not
+sent yet.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar, Token
+from typing import Iterator, List, Optional, Set, Tuple
+
+from flask import g, has_app_context
+
+from core.config import EventsConfig, SharedStateConfig
+from core.json_provider import dto_default
+from core.versioning import _LockF, data_versions
+
+# Events published by the async transaction of the current task
+_pending_events: ContextVar[Optional[list]] = ContextVar("pending_events", default=None)
+
+
+class TooManySubscribers(Exception):
+    """Raised when the broker already streams to max_subscribers clients"""
+
+
+def _format(event_id: Optional[str], event: str, payload: str) -> str:
+    lines = f"event: {event}\ndata: {payload}\n\n"
+    return f"id: {event_id}\n{lines}" if event_id is not None else lines
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe fan-out of change events.
+
+    Events are kept in a bounded buffer with increasing ids. Subscribers only
+    remember the id of the last event they sent and are woken up when new
+    ones arrive, so publishing costs one append whatever their number.
+
+    With a `directory` events are appended to a file there instead, and a
+    relay thread of each process reads the events of every worker into its
+    buffer; their ids are offsets in that file.
+    """
+
+    FILE_NAME = "events"
+
+    def __init__(
+        self,
+        directory: Optional[str] = SharedStateConfig.DIR,
+        buffer_size: int = EventsConfig.BUFFER_SIZE,
+        max_subscribers: int = EventsConfig.MAX_SUBSCRIBERS,
+    ):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        # (id, event, JSON payload)
+        self._events: deque = deque(maxlen=buffer_size)
+        self._last_id = 0
+        # Id of the last event dropped from the buffer
+        self._dropped_id = 0
+        self._subscribers: Set["Subscription"] = set()
+        self._fd = None
+        self._read_lock = threading.Lock()
+        self._relay: Optional[threading.Thread] = None
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(
+                os.path.join(directory, self.FILE_NAME),
+                os.O_RDWR | os.O_CREAT | os.O_APPEND,
+            )
+            self._last_id = self._dropped_id = os.fstat(self._fd).st_size
+
+    def publish(self, event: str, data) -> None:
+        payload = json.dumps(data, default=dto_default, separators=(",", ":"))
+        if self._fd is None:
+            with self._lock:
+                self._last_id += 1
+                self._append(self._last_id, event, payload)
+        else:
+            with _LockF(self._fd):
+                os.write(self._fd, f"{event} {payload}\n".encode())
+            # Local subscribers need not wait for the relay
+            self._read_new_events()
+        self._wake()
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> "Subscription":
+        return self._subscribe(Subscription, last_event_id)
+
+    def subscribe_async(
+        self, last_event_id: Optional[str] = None
+    ) -> "AsyncSubscription":
+        """Subscription to iterate with `async for`, from the running loop"""
+        return self._subscribe(AsyncSubscription, last_event_id)
+
+    def unsubscribe(self, subscription: "Subscription") -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def events_after(self, last_id: int) -> Tuple[List[Tuple], bool]:
+        """Events with an id above `last_id`, and whether some were dropped"""
+        with self._lock:
+            missed = last_id < self._dropped_id
+            if not self._events or self._events[-1][0] <= last_id:
+                return [], missed
+            return [entry for entry in self._events if entry[0] > last_id], missed
+
+    def event_id(self, last_id: int) -> str:
+        return f"{data_versions.epoch:x}-{last_id}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "buffered": len(self._events),
+                "last_id": self._last_id,
+            }
+
+    def _subscribe(self, kind, last_event_id: Optional[str]):
+        if self._fd is not None:
+            self._start_relay()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            last_id, missed = self._parse_event_id(last_event_id)
+            subscription = kind(self, last_id, missed)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _parse_event_id(self, last_event_id: Optional[str]) -> Tuple[int, bool]:
+        """Id to stream from and whether the client missed events"""
+        if not last_event_id:
+            return self._last_id, False
+        epoch, _, last_id = last_event_id.partition("-")
+        try:
+            if int(epoch, 16) == data_versions.epoch and int(last_id) <= self._last_id:
+                return int(last_id), False
+        except ValueError:
+            pass
+        # From a previous run, or garbage
+        return self._last_id, True
+
+    def _append(self, event_id: int, event: str, payload: str) -> None:
+        if len(self._events) == self._events.maxlen:
+            self._dropped_id = self._events[0][0]
+        self._events.append((event_id, event, payload))
+
+    def _wake(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.wake()
+
+    def _read_new_events(self) -> bool:
+        with self._read_lock:
+            if os.fstat(self._fd).st_size <= self._last_id:
+                return False
+            with _LockF(self._fd):
+                size = os.fstat(self._fd).st_size
+                data = os.pread(self._fd, size - self._last_id, self._last_id)
+            with self._lock:
+                for line in data.splitlines(keepends=True):
+                    self._last_id += len(line)
+                    event, _, payload = line.decode().rstrip("\n").partition(" ")
+                    self._append(self._last_id, event, payload)
+            return True
+
+    def _start_relay(self) -> None:
+        with self._lock:
+            if self._relay is not None and self._relay.is_alive():
+                return
+            # Threads do not survive a fork, the check above restarts it
+            self._relay = threading.Thread(target=self._run_relay, daemon=True)
+            self._relay.start()
+
+    def _run_relay(self) -> None:
+        while True:
+            if self._read_new_events():
+                self._wake()
+            time.sleep(EventsConfig.POLL_INTERVAL)
+
+
+class Subscription:
+    """Events of the broker for one client, iterated as SSE chunks"""
+
+    def __init__(self, broker: EventBroker, last_id: int, missed: bool):
+        self.broker = broker
+        self.last_id = last_id
+        self._missed = missed
+        self._wakeup = threading.Event()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+    def _chunk(self) -> str:
+        """The events not sent yet, a resync event first if some were lost"""
+        events, missed = self.broker.events_after(self.last_id)
+        chunks = []
+        if missed or self._missed:
+            # Clients reload through the REST API
+            chunks.append(_format(None, "resync", "{}"))
+            self._missed = False
+        for event_id, event, payload in events:
+            chunks.append(_format(self.broker.event_id(event_id), event, payload))
+            self.last_id = event_id
+        return "".join(chunks)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            yield f"retry: {EventsConfig.RETRY_MS}\n\n"
+            while True:
+                self._wakeup.clear()
+                chunk = self._chunk()
+                if chunk:
+                    yield chunk
+                elif not self._wakeup.wait(EventsConfig.HEARTBEAT):
+                    # Finds out about clients gone away
+                    yield ": keepalive\n\n"
+        finally:
+            self.close()
+
+
+class AsyncSubscription(Subscription):
+    """Subscription woken up on its event loop, no thread of its own"""
+
+    def __init__(self, broker: EventBroker, last_id: int, missed: bool):
+        super().__init__(broker, last_id, missed)
+        self._loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+
+    def wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+        except RuntimeError:
+            # The loop is closed
+            pass
+
+    async def __aiter__(self):
+        try:
+            yield f"retry: {EventsConfig.RETRY_MS}\n\n"
+            while True:
+                self._async_wakeup.clear()
+                chunk = self._chunk()
+                if chunk:
+                    yield chunk
+                    continue
+                try:
+                    await asyncio.wait_for(
+                        self._async_wakeup.wait(), EventsConfig.HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.close()
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(event: str, data) -> None:
+    """Publish the event once the current transaction is committed"""
+    if has_app_context():
+        g.setdefault("pending_events", []).append((event, data))
+    elif _pending_events.get() is not None:
+        _pending_events.get().append((event, data))
+    else:
+        broker.publish(event, data)
+
+
+def flush_events() -> None:
+    """Called once the transaction is committed"""
+    for event, data in g.pop("pending_events", ()):
+        broker.publish(event, data)
+
+
+def discard_events() -> None:
+    """Called when the transaction is rolled back"""
+    g.pop("pending_events", None)
+
+
+def begin_events() -> Token:
+    """Start collecting the events of an async transaction"""
+    return _pending_events.set([])
+
+
+def end_events(token: Token, committed: bool) -> None:
+    """Publish the collected events if the async transaction committed"""
+    events = _pending_events.get()
+    _pending_events.reset(token)
+    if committed:
+        for event, data in events:
+            broker.publish(event, data)
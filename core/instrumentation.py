@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from flask import g, has_request_context, request
+
+from core.config import QueryLogConfig
+
+logger = logging.getLogger("plg.db")
+
+MAX_STATEMENT_LENGTH = 1000
+
+
+class QueryStats:
+    """Statements run by one request"""
+
+    __slots__ = ("count", "duration", "rows", "slowest", "slowest_duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+        self.slowest: Optional[str] = None
+        self.slowest_duration = 0.0
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        if duration > self.slowest_duration:
+            self.slowest = statement
+            self.slowest_duration = duration
+
+    def to_dict(self) -> Dict:
+        return {
+            "queries": self.count,
+            "db_ms": round(self.duration * 1000, 3),
+            "rows": self.rows,
+            "slowest_ms": round(self.slowest_duration * 1000, 3),
+            "slowest": self.slowest,
+        }
+
+
+class SlowQueryLog:
+    """Ring buffer of the statements slower than `threshold_ms`"""
+
+    def __init__(
+        self,
+        threshold_ms: float = QueryLogConfig.SLOW_QUERY_MS,
+        size: int = QueryLogConfig.SLOW_QUERY_LOG_SIZE,
+    ):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration: float, param_count: int) -> None:
+        duration_ms = duration * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        entry = {
+            "at": time.time(),
+            "duration_ms": round(duration_ms, 3),
+            "statement": statement,
+            "params": param_count,
+            "endpoint": request.endpoint if has_request_context() else None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            f"slow query {duration_ms:.1f} ms endpoint={entry['endpoint']} "
+            f"statement={statement}"
+        )
+
+    def entries(self) -> List[Dict]:
+        """Slow statements, most recent first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def _normalize(statement) -> str:
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode("utf-8", "replace")
+    return " ".join(str(statement).split())[:MAX_STATEMENT_LENGTH]
+
+
+def _param_count(params) -> int:
+    try:
+        return len(params)
+    except TypeError:
+        return 0
+
+
+class InstrumentedCursor:
+    """
+    Cursor wrapper timing every statement and counting the rows fetched
+    into the QueryStats of the current request
+    """
+
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._record(operation, time.perf_counter() - start, params)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._record(operation, time.perf_counter() - start, seq_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _record(self, operation, duration: float, params) -> None:
+        statement = _normalize(operation)
+        self._stats.record(statement, duration)
+        slow_query_log.record(statement, duration, _param_count(params))
+
+
+def instrument(cursor):
+    """Wrap `cursor` so its statements count towards the current request"""
+    if not has_request_context():
+        return InstrumentedCursor(cursor, QueryStats())
+    if "query_stats" not in g:
+        g.query_stats = QueryStats()
+    return InstrumentedCursor(cursor, g.query_stats)
+
+
+def _server_timing(stats: QueryStats) -> str:
+    return (
+        f'db;dur={stats.duration * 1000:.3f};desc="{stats.count} queries, '
+        f'{stats.rows} rows", db-slowest;dur={stats.slowest_duration * 1000:.3f}'
+    )
+
+
+def _log_queries(stats: QueryStats, method: str, endpoint, status: int) -> None:
+    details = dict(stats.to_dict(), method=method, endpoint=endpoint, status=status)
+    level = (
+        logging.WARNING
+        if stats.count > QueryLogConfig.MAX_QUERIES_PER_REQUEST
+        else logging.INFO
+    )
+    logger.log(
+        level,
+        f"{method} {endpoint} {status} "
+        f"queries={stats.count} db_ms={details['db_ms']} rows={stats.rows} "
+        f"slowest_ms={details['slowest_ms']}",
+        extra={"db": details},
+    )
+
+
+def init_instrumentation(app):
+    """Report the statements of every request as Server-Timing and a log line"""
+
+    @app.after_request
+    def report_queries(response):
+        if response.is_streamed:
+            # A streamed body runs its statements after this hook, into the
+            # same stats: they are logged once the response is closed, but the
+            # Server-Timing header only covers the statements run before it
+            stats = g.setdefault("query_stats", QueryStats())
+            method, endpoint = request.method, request.endpoint
+
+            def log_streamed_queries():
+                if stats.count:
+                    _log_queries(stats, method, endpoint, response.status_code)
+
+            response.call_on_close(log_streamed_queries)
+            if not stats.count:
+                return response
+        else:
+            stats = g.pop("query_stats", None)
+            if stats is None:
+                return response
+            _log_queries(stats, request.method, request.endpoint, response.status_code)
+
+        response.headers.add("Server-Timing", _server_timing(stats))
+        return response
@@ -0,0 +1,14 @@
+from flask.json.provider import DefaultJSONProvider
+
+
+def dto_default(o):
+    to_dict = getattr(o, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    return DefaultJSONProvider.default(o)
+
+
+class DTOJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes DTOs through their `to_dict()`"""
+
+    default = staticmethod(dto_default)
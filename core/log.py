@@ -0,0 +1,179 @@
+"""
+Logging through a queue
+
+Request threads only render the message and put the record in a queue, a
+background thread formats it and writes it to stdout. Configured by LogConfig.
+"""
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from flask import has_request_context, request
+
+from core.config import LogConfig
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Attributes of every LogRecord, anything else came through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_exception_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, `extra` fields included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Let one in `every` debug records of each call site through"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counters: Dict = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        if next(counter) % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class RequestContextFilter(logging.Filter):
+    """Add the method, path and endpoint of the current request"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context() and not hasattr(record, "http"):
+            record.http = {
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+            }
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler dropping records rather than waiting on a full queue"""
+
+    def __init__(self):
+        super().__init__(None)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message while its arguments are current, and hand the
+        # writer thread plain strings only
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than lose the records still queued
+        self.queue.put(self._sentinel)
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_output: Optional[logging.Handler] = None
+_listener: Optional[_Listener] = None
+
+
+def _parse_levels(levels: str) -> Dict[str, str]:
+    parsed = {}
+    for entry in levels.split(","):
+        if entry.strip():
+            name, _, level = entry.partition("=")
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def _start_listener() -> None:
+    global _listener
+    _handler.queue = queue.Queue(LogConfig.QUEUE_SIZE)
+    _listener = _Listener(_handler.queue, _output)
+    _listener.start()
+
+
+def init_logging() -> None:
+    """Route every logger through the queue, once per process"""
+    global _handler, _output
+    if _handler is not None:
+        return
+
+    _output = logging.StreamHandler(sys.stdout)
+    _output.setFormatter(
+        JSONFormatter()
+        if LogConfig.FORMAT == "json"
+        else logging.Formatter(TEXT_FORMAT)
+    )
+    _handler = NonBlockingQueueHandler()
+    _handler.addFilter(DebugSampler(LogConfig.DEBUG_SAMPLE))
+    _handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LogConfig.LEVEL)
+    for name, level in _parse_levels(LogConfig.LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _start_listener()
+    atexit.register(shutdown_logging)
+    # The writer thread does not survive a fork (gunicorn workers)
+    os.register_at_fork(after_in_child=_start_listener)
+
+
+def shutdown_logging() -> None:
+    """Write the records still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def log_stats() -> Dict[str, int]:
+    if _handler is None or _handler.queue is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
@@ -0,0 +1,419 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import g, request
+
+from core.config import MetricsConfig, SharedStateConfig
+from core.versioning import _LockF
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SPREAD_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "plg_http_requests_total": (
+        "counter",
+        "HTTP requests by blueprint, endpoint, method and status",
+        None,
+    ),
+    "plg_http_request_duration_seconds": (
+        "histogram",
+        "HTTP request latency by blueprint and endpoint",
+        LATENCY_BUCKETS,
+    ),
+    "plg_generate_teams_duration_seconds": (
+        "histogram",
+        "Time spent balancing players in POST /teams/generate",
+        LATENCY_BUCKETS,
+    ),
+    "plg_generate_teams_spread": (
+        "histogram",
+        "Weight spread (heaviest minus lightest team) of generated teams",
+        SPREAD_BUCKETS,
+    ),
+    "plg_db_pool_connections": (
+        "gauge",
+        "Database connections of the pool by state",
+        None,
+    ),
+    "plg_db_pool_size": ("gauge", "Maximum number of pooled connections", None),
+    "plg_db_pool_checkouts_total": ("counter", "Connection checkouts", None),
+    "plg_db_pool_timeouts_total": (
+        "counter",
+        "Checkouts that gave up waiting for a connection",
+        None,
+    ),
+    "plg_cache_hits_total": ("counter", "Read cache hits", None),
+    "plg_cache_misses_total": ("counter", "Read cache misses", None),
+    "plg_cache_hit_ratio": ("gauge", "Read cache hits over lookups", None),
+    "plg_jwt_cache_hits_total": (
+        "counter",
+        "Requests whose token claims came from the cache",
+        None,
+    ),
+    "plg_jwt_cache_misses_total": (
+        "counter",
+        "Requests whose token had to be verified",
+        None,
+    ),
+    "plg_events_subscribers": ("gauge", "Clients streaming /events", None),
+    "plg_login_throttled_total": (
+        "counter",
+        "Login attempts refused with 429, by the limit they hit",
+        None,
+    ),
+    "plg_log_records_dropped_total": (
+        "counter",
+        "Log records dropped because the log queue was full",
+        None,
+    ),
+}
+
+
+def _labels(labels: Optional[Dict[str, object]]) -> Labels:
+    if not labels:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+    In-process counters and histograms, exposed in the Prometheus text format.
+
+    Updates only take a lock and touch a dict. With a shared state directory
+    every worker process writes its values to a file of its own at most once
+    per flush interval, and the worker answering /metrics adds them all up.
+    Gauges come from collectors that are read when the values are written.
+    The counters of exited workers are folded into a single archive file.
+    """
+
+    ARCHIVE_FILE = "archive.json"
+    LOCK_FILE = "archive.lock"
+
+    def __init__(
+        self,
+        directory: Optional[str] = SharedStateConfig.DIR,
+        flush_interval: float = MetricsConfig.FLUSH_INTERVAL,
+    ):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple]]] = []
+        self.directory = os.path.join(directory, "metrics") if directory else None
+        self.flush_interval = flush_interval
+        self._flushed_at = 0.0
+
+    def inc(self, name: str, labels=None, amount: float = 1) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels=None) -> None:
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(buckets) + 2)
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple]]) -> None:
+        """`collector` returns (name, labels, value) tuples of gauges/totals"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        collected = []
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                collected.append([name, list(_labels(labels)), value])
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [
+                    [name, list(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(values)]
+                    for (name, labels), values in self._histograms.items()
+                ],
+                "collected": collected,
+            }
+
+    def maybe_flush(self) -> None:
+        """Write this process' values for the other workers, now and then"""
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if now - self._flushed_at >= self.flush_interval:
+            self._flushed_at = now
+            self.flush()
+
+    def flush(self) -> None:
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(f"{os.getpid()}.json", self.snapshot())
+
+    def render(self) -> str:
+        """Every process' values in the Prometheus text exposition format"""
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        gauges: Dict[Tuple[str, Labels], float] = {}
+
+        for snapshot, alive in self._snapshots():
+            # Gauges of exited workers no longer mean anything
+            _add_snapshot(snapshot, counters, histograms, gauges if alive else None)
+
+        hits = counters.get(("plg_cache_hits_total", ()), 0)
+        misses = counters.get(("plg_cache_misses_total", ()), 0)
+        gauges[("plg_cache_hit_ratio", ())] = (
+            hits / (hits + misses) if hits + misses else 0.0
+        )
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            if kind == "histogram":
+                series = {k: v for k, v in histograms.items() if k[0] == name}
+            else:
+                source = counters if kind == "counter" else gauges
+                series = {k: v for k, v in source.items() if k[0] == name}
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (_, labels), value in sorted(series.items()):
+                if kind == "histogram":
+                    lines.extend(_histogram_lines(name, labels, buckets, value))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _snapshots(self):
+        """(snapshot, process alive) of this process, every other worker and
+        the archive of the exited ones"""
+        own = self.snapshot()
+        yield own, True
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        exited = []
+        for file_name in os.listdir(self.directory):
+            pid = _file_pid(file_name)
+            if pid is None or pid == own["pid"]:
+                continue
+            if not _is_alive(pid):
+                exited.append(file_name)
+                continue
+            snapshot = self._read(file_name)
+            if snapshot is not None:
+                yield snapshot, True
+        if exited:
+            self._archive(exited)
+        archive = self._read(self.ARCHIVE_FILE)
+        if archive is not None:
+            yield archive, False
+
+    def _archive(self, file_names: List[str]) -> None:
+        """Fold the counters of exited workers into the archive file"""
+        fd = os.open(
+            os.path.join(self.directory, self.LOCK_FILE), os.O_RDWR | os.O_CREAT
+        )
+        try:
+            with _LockF(fd):
+                counters: Dict[Tuple[str, Labels], float] = {}
+                histograms: Dict[Tuple[str, Labels], List[float]] = {}
+                archive = self._read(self.ARCHIVE_FILE)
+                if archive is not None:
+                    _add_snapshot(archive, counters, histograms, None)
+                archived = []
+                for file_name in file_names:
+                    snapshot = self._read(file_name)
+                    # None when another worker archived it first
+                    if snapshot is not None:
+                        _add_snapshot(snapshot, counters, histograms, None)
+                        archived.append(file_name)
+                if not archived:
+                    return
+                self._write(
+                    self.ARCHIVE_FILE,
+                    {
+                        "pid": None,
+                        "counters": [
+                            [name, list(labels), value]
+                            for (name, labels), value in counters.items()
+                        ],
+                        "histograms": [
+                            [name, list(labels), values]
+                            for (name, labels), values in histograms.items()
+                        ],
+                        "collected": [],
+                    },
+                )
+                for file_name in archived:
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except OSError:
+                        pass
+        finally:
+            os.close(fd)
+
+    def _read(self, file_name: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory, file_name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, file_name: str, snapshot: Dict) -> None:
+        path = os.path.join(self.directory, file_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def remove_files(self) -> None:
+        """Forget the values written by the workers of a previous run"""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _add_snapshot(snapshot: Dict, counters, histograms, gauges) -> None:
+    """Add the values of a snapshot to the totals, its gauges when `gauges`"""
+    for name, labels, value in snapshot["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, [0] * len(values))
+        for i, value in enumerate(values):
+            total[i] += value
+    for name, labels, value in snapshot["collected"]:
+        key = (name, tuple(map(tuple, labels)))
+        if METRICS[name][0] == "counter":
+            counters[key] = counters.get(key, 0) + value
+        elif gauges is not None:
+            gauges[key] = gauges.get(key, 0) + value
+
+
+def _file_pid(file_name: str) -> Optional[int]:
+    """Pid of a worker's `<pid>.json` file, None for the other files"""
+    stem, dot, extension = file_name.partition(".")
+    if extension == "json" and stem.isdigit():
+        return int(stem)
+    return None
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = tuple(labels) + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, labels, buckets, values) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, values):
+        cumulative += count
+        bucket_labels = _format_labels(labels, (("le", _number(bound)),))
+        lines.append(f"{name}_bucket{bucket_labels} {_number(cumulative)}")
+    cumulative += values[len(buckets)]
+    bucket_labels = _format_labels(labels, (("le", "+Inf"),))
+    lines.append(f"{name}_bucket{bucket_labels} {_number(cumulative)}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_number(values[-1])}")
+    lines.append(f"{name}_count{_format_labels(labels)} {_number(cumulative)}")
+    return lines
+
+
+metrics = Metrics()
+
+
+def init_metrics(app):
+    """Count and time every request, and collect pool and cache values"""
+    from core.auth import claims_cache
+    from core.cache import read_cache
+    from core.events import broker
+    from core.log import log_stats
+
+    pool = app.extensions["db_pool"]
+
+    def collect():
+        stats = pool.stats()
+        for state in ("in_use", "idle"):
+            yield "plg_db_pool_connections", {"state": state}, stats[state]
+        yield "plg_db_pool_size", None, stats["size"]
+        yield "plg_db_pool_checkouts_total", None, stats["checkouts"]
+        yield "plg_db_pool_timeouts_total", None, stats["timeouts"]
+        cache = read_cache.stats()
+        yield "plg_cache_hits_total", None, cache["hits"]
+        yield "plg_cache_misses_total", None, cache["misses"]
+        yield "plg_events_subscribers", None, broker.stats()["subscribers"]
+        tokens = claims_cache.stats()
+        yield "plg_jwt_cache_hits_total", None, tokens["hits"]
+        yield "plg_jwt_cache_misses_total", None, tokens["misses"]
+        yield "plg_log_records_dropped_total", None, log_stats()["dropped"]
+
+    metrics.add_collector(collect)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        labels = {
+            "blueprint": request.blueprint or "",
+            "endpoint": request.endpoint or "",
+        }
+        metrics.observe(
+            "plg_http_request_duration_seconds",
+            time.perf_counter() - started,
+            labels,
+        )
+        metrics.inc(
+            "plg_http_requests_total",
+            dict(labels, method=request.method, status=response.status_code),
+        )
+        metrics.maybe_flush()
+        return response
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key: `burst` attempts at once, then `rate` (> 0)
+    attempts per second.
+
+    Buckets live in memory, in an LRU bounded by `max_keys`: a key unseen
+    for long has its bucket full again anyway, so forgetting it is free.
+    Limits apply per process.
+    """
+
+    def __init__(self, burst: int, rate: float, max_keys: int = 10000):
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (tokens, monotonic time of the last update)
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: Hashable) -> float:
+        """Take a token for `key`: 0 when allowed, else seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
@@ -0,0 +1,34 @@
+from typing import Callable, Dict, Iterator
+
+from flask import Response, current_app, stream_with_context
+
+from core.config import BatchConfig
+from core.database import streaming_cursor
+
+
+def ndjson_response(
+    rows_for: Callable[..., Iterator[Dict]],
+    batch_size: int = BatchConfig.STREAM_FETCH_SIZE,
+) -> Response:
+    """
+    Stream rows as newline delimited JSON while they are read.
+
+    `rows_for` receives a dedicated cursor and returns an iterator of rows,
+    so memory stays flat and the first bytes go out after the first fetch
+    whatever the size of the table.
+    """
+
+    def generate():
+        with streaming_cursor() as cursor:
+            lines = []
+            for row in rows_for(cursor):
+                lines.append(current_app.json.dumps(row))
+                if len(lines) >= batch_size:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+
+    return Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
@@ -0,0 +1,123 @@
+import fcntl
+import mmap
+import os
+import secrets
+import threading
+import zlib
+from array import array
+from functools import wraps
+from typing import Optional, Tuple
+
+from flask import make_response, request
+
+from core.config import SharedStateConfig
+
+
+class DataVersions:
+    """
+    Write counters per table, bumped after every commit that touched it.
+
+    With a `directory` the counters live in a memory mapped file so every
+    worker process sees the writes of the others; otherwise they are local
+    to this process. The epoch changes whenever the counters start over so
+    versions from a previous run are never mistaken for current ones.
+    """
+
+    TABLES = ("members", "teams", "team_members")
+    FILE_NAME = "data_versions"
+
+    def __init__(self, directory: Optional[str] = SharedStateConfig.DIR):
+        self._lock = threading.Lock()
+        self._fd = None
+        self._slot = {table: i + 1 for i, table in enumerate(self.TABLES)}
+        size = len(self.TABLES) + 1
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(
+                os.path.join(directory, self.FILE_NAME), os.O_RDWR | os.O_CREAT
+            )
+            with self._file_lock():
+                if os.fstat(self._fd).st_size < size * 8:
+                    os.ftruncate(self._fd, size * 8)
+                self._map = mmap.mmap(self._fd, size * 8)
+                self._counters = memoryview(self._map).cast("Q")
+                if self._counters[0] == 0:
+                    self._counters[0] = secrets.randbits(63) or 1
+        else:
+            self._counters = array("Q", [0] * size)
+            self._counters[0] = secrets.randbits(63) or 1
+
+    def bump(self, *tables: str) -> None:
+        with self._lock, self._file_lock():
+            for table in tables:
+                slot = self._slot.get(table)
+                if slot is not None:
+                    self._counters[slot] += 1
+
+    @property
+    def epoch(self) -> int:
+        return self._counters[0]
+
+    def get(self, *tables: str) -> Tuple[int, ...]:
+        return tuple(self._counters[self._slot[table]] for table in tables)
+
+    def etag(self, *tables: str, salt: bytes = b"") -> str:
+        tag = "-".join(
+            [format(self._counters[0], "x")]
+            + [str(version) for version in self.get(*tables)]
+        )
+        if salt:
+            tag += "-" + format(zlib.crc32(salt), "x")
+        return tag
+
+    def _file_lock(self):
+        return _LockF(self._fd)
+
+
+class _LockF:
+    """fcntl.lockf based lock, a no-op without a file"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if self.fd is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+data_versions = DataVersions()
+
+
+def conditional_get(*tables: str):
+    """
+    Answer GET requests with 304 while `tables` are unchanged.
+
+    The ETag is derived from the data versions of `tables` (and the query
+    string), so a matching If-None-Match is answered before the view runs:
+    no database access and no JSON serialization.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+
+            etag = data_versions.etag(*tables, salt=request.query_string)
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,131 @@
+"""
+Production gunicorn settings
+
+    gunicorn -c gunicorn.conf.py app:application
+
+or, for the async variant (requirements-asgi.txt):
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+        gunicorn -c gunicorn.conf.py asgi:application
+
+Every value can be overridden through the environment, see ServerConfig.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from core.config import ServerConfig, SharedStateConfig
+
+cpus = multiprocessing.cpu_count()
+
+bind = ServerConfig.BIND
+worker_class = ServerConfig.WORKER_CLASS
+
+if ServerConfig.WORKERS is not None:
+    workers = ServerConfig.WORKERS
+elif worker_class == "sync":
+    # Sync workers block on MySQL, oversubscribe the CPUs to hide it
+    workers = cpus * 2 + 1
+else:
+    # Threads or greenlets already overlap the waits on MySQL
+    workers = cpus + 1
+
+threads = ServerConfig.THREADS if worker_class == "gthread" else 1
+
+# An event stream holds a thread of a sync or gthread worker as long as the
+# client stays connected: keep at least half of them for requests. The ASGI
+# /events route and gevent workers need no thread per client.
+max_event_streams = threads // 2 if worker_class in ("sync", "gthread") else None
+worker_connections = ServerConfig.WORKER_CONNECTIONS
+
+# Import the app once in the master so workers fork with it already loaded.
+# gevent has to patch the standard library before the app is imported.
+preload_app = worker_class != "gevent"
+
+max_requests = ServerConfig.MAX_REQUESTS
+max_requests_jitter = ServerConfig.MAX_REQUESTS_JITTER
+timeout = ServerConfig.TIMEOUT
+graceful_timeout = ServerConfig.TIMEOUT
+
+# Workers must agree on data versions (ETags, read cache invalidation, team
+# registry), which only happens through a shared directory
+if workers > 1 and not SharedStateConfig.DIR:
+    SharedStateConfig.DIR = tempfile.mkdtemp(prefix="plg-state-")
+    os.environ["PLG_SHARED_STATE_DIR"] = SharedStateConfig.DIR
+
+
+def _db_pool():
+    # The Flask app, also mounted behind the ASGI app of asgi.py
+    from app import application
+
+    return application.extensions["db_pool"]
+
+
+def when_ready(server):
+    from core.metrics import metrics
+
+    # Metrics files of the workers of a previous run
+    metrics.remove_files()
+
+    if max_event_streams == 0:
+        server.log.warning(
+            "%s workers with %d thread(s) leave no thread for /events streams, "
+            "every subscription gets a 503: use gthread with "
+            "GUNICORN_THREADS >= 2, or the ASGI app (asgi.py) for many clients",
+            worker_class,
+            threads,
+        )
+    elif max_event_streams is not None:
+        server.log.info(
+            "/events streams are limited to %d per worker, serve asgi.py for more",
+            max_event_streams,
+        )
+
+    # The preloaded app opened a connection in the master (team registry);
+    # close it before forking so no worker shares its socket
+    if preload_app:
+        _db_pool().reset()
+
+
+def post_worker_init(worker):
+    """Refuse to serve a schema the repositories cannot write to"""
+    from gunicorn.arbiter import Arbiter
+
+    from app import application
+    from core.database import database_transaction
+    from migrations import pending_versions
+
+    with application.app_context():
+        try:
+            with database_transaction() as (db, cursor):
+                pending = pending_versions(cursor)
+        except Exception as e:
+            # Same as the team registry, an unreachable database is not fatal
+            worker.log.warning("schema version not checked at startup : %s", e)
+            return
+
+    if pending:
+        worker.log.error(
+            "pending schema migrations (%s), run `flask --app app db upgrade` "
+            "before starting the server",
+            ", ".join(map(str, pending)),
+        )
+        # A worker that fails to boot stops the whole server
+        sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+
+def post_fork(server, worker):
+    # Without preloading the app is created in the worker, after this hook
+    if not preload_app:
+        return
+    pool = _db_pool()
+    pool.reset()
+    # Every thread of the worker can hold a connection without waiting
+    pool.size = max(pool.size, threads)
+
+    from core.events import broker
+
+    if max_event_streams is not None:
+        broker.max_subscribers = min(broker.max_subscribers, max_event_streams)
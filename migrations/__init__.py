@@ -0,0 +1,89 @@
+"""
+Versioned schema migrations.
+
+Every `mNNNN_*.py` module in this package defines VERSION, DESCRIPTION,
+`up(cursor)` and `down(cursor)`. Applied versions are recorded in the
+`schema_migrations` table.
+"""
+
+import importlib
+import pkgutil
+from typing import List
+
+
+def load_migrations() -> List:
+    modules = [
+        importlib.import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if info.name[0] == "m" and info.name[1:5].isdigit()
+    ]
+    return sorted(modules, key=lambda module: module.VERSION)
+
+
+def ensure_migrations_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        )
+    """
+    )
+
+
+def applied_versions(cursor) -> List[int]:
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row["version"] for row in cursor.fetchall()]
+
+
+def pending_versions(cursor) -> List[int]:
+    """Versions not applied yet, read without creating `schema_migrations`"""
+    cursor.execute("SHOW TABLES LIKE 'schema_migrations'")
+    done = set()
+    if cursor.fetchall():
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row["version"] for row in cursor.fetchall()}
+    return [
+        migration.VERSION
+        for migration in load_migrations()
+        if migration.VERSION not in done
+    ]
+
+
+def upgrade(db, cursor, target: int = None) -> List[int]:
+    """Apply pending migrations up to `target` (the latest by default)"""
+    done = set(applied_versions(cursor))
+    applied = []
+    for migration in load_migrations():
+        if migration.VERSION in done:
+            continue
+        if target is not None and migration.VERSION > target:
+            break
+        migration.up(cursor)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (migration.VERSION, migration.DESCRIPTION),
+        )
+        db.commit()
+        applied.append(migration.VERSION)
+    return applied
+
+
+def downgrade(db, cursor, target: int) -> List[int]:
+    """Revert applied migrations newer than `target`"""
+    done = set(applied_versions(cursor))
+    reverted = []
+    for migration in reversed(load_migrations()):
+        if migration.VERSION <= target or migration.VERSION not in done:
+            continue
+        migration.down(cursor)
+        cursor.execute(
+            "DELETE FROM schema_migrations WHERE version = %s",
+            (migration.VERSION,),
+        )
+        db.commit()
+        reverted.append(migration.VERSION)
+    return reverted
@@ -0,0 +1,148 @@
+"""
+Run EXPLAIN on every repository query and flag full table scans.
+
+The repositories are driven with an ExplainCursor, which prefixes each
+statement with EXPLAIN instead of running it, so the plans are those of
+the exact SQL the application sends. Calls whose writes depend on what they
+read first are given sample rows for those reads.
+"""
+
+from collections import defaultdict
+from typing import Dict, List
+
+from repositories.member import MemberRepository
+from repositories.team import TeamRepository
+from repositories.team_member import TeamMemberRepository
+from repositories.team_stats import TeamStatsRepository
+
+# Queries that read or write every row on purpose
+FULL_SCAN_EXPECTED = {
+    "MemberRepository.get_all_members",
+    "MemberRepository.iter_all_members",
+    "MemberRepository.toggle_connection_all",
+    "MemberRepository.iter_members_with_keys",
+    "TeamRepository.get_all_teams",
+    "TeamRepository.get_teams_and_players",
+    "TeamRepository.iter_teams_with_players",
+    "TeamRepository.get_team_summaries",
+    "TeamStatsRepository.recompute",
+}
+
+
+class ExplainCursor:
+    """Cursor stand-in that records the plan of every statement"""
+
+    def __init__(self, cursor, rows=()):
+        self.cursor = cursor
+        # Returned by every read, in place of the result of the statement
+        self.rows = [defaultdict(int, row) for row in rows]
+        self.plans = []
+        self.rowcount = 0
+        self.lastrowid = 0
+
+    def execute(self, query, params=None):
+        self.cursor.execute("EXPLAIN " + query, params)
+        self.plans.append((" ".join(query.split()), self.cursor.fetchall()))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else defaultdict(int)
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchmany(self, size=1):
+        return []
+
+
+def _calls():
+    sample_member = {
+        "discord_id": "0",
+        "name": "explain",
+        "steam_id": "0",
+        "weight": 1,
+        "smoke_color": "default",
+        "is_logged_in": True,
+    }
+    # Stored members differing from sample_member, in a team, so that the
+    # CASE UPDATE and the team_stats statements are built
+    stored_members = [
+        dict(sample_member, id=member_id, team_id=1, weight=0, is_logged_in=False)
+        for member_id in (1, 2)
+    ]
+    # Existing members and teams for assign_many
+    known_ids = [{"id": 1, "team_id": 1}, {"id": 2, "team_id": 2}]
+    return [
+        (MemberRepository, "get_all_members", ()),
+        (MemberRepository, "iter_all_members", ()),
+        (MemberRepository, "get_member_by_id", (1,)),
+        (MemberRepository, "get_members_by_login_status", (True,)),
+        (MemberRepository, "get_members_page", ()),
+        (MemberRepository, "update_member", (sample_member, 1)),
+        (MemberRepository, "delete_member", (1,)),
+        (
+            MemberRepository,
+            "update_members",
+            ({1: sample_member, 2: sample_member},),
+            stored_members,
+        ),
+        (
+            MemberRepository,
+            "add_members",
+            ([sample_member, sample_member],),
+            [{"step": 1}],
+        ),
+        (MemberRepository, "delete_members", ([1, 2],)),
+        (MemberRepository, "iter_members_with_keys", (["discord_id", "steam_id"],)),
+        (MemberRepository, "toggle_connection_all", (0,)),
+        (TeamRepository, "get_all_teams", ()),
+        (TeamRepository, "get_teams_connected", ()),
+        (TeamRepository, "get_teams_with_players_connected", ()),
+        (TeamRepository, "get_teams_and_players", ()),
+        (TeamRepository, "iter_teams_with_players", ()),
+        (TeamRepository, "get_team_summaries", ()),
+        (TeamRepository, "get_team_by_id", (1,)),
+        (TeamRepository, "get_no_team_id", ()),
+        (TeamRepository, "delete_team", (1,)),
+        (TeamMemberRepository, "update_team_member", (1, 1)),
+        (TeamMemberRepository, "get_team_ids", ([1, 2],)),
+        (TeamMemberRepository, "assign_many", ([(1, 1), (2, 2)],), known_ids),
+        (TeamStatsRepository, "recompute", ()),
+    ]
+
+
+def explain_repository_queries(cursor) -> List[Dict]:
+    """
+    Returns:
+        list: One entry per EXPLAIN row with the query name, table, access
+        type, key used, estimated rows and whether it is a full scan
+    """
+    report = []
+    for repository, method_name, args, *rows in _calls():
+        explain_cursor = ExplainCursor(cursor, *rows)
+        method = getattr(repository, method_name)
+        # Skip the read cache so the query actually runs
+        method = getattr(method, "__wrapped__", method)
+        result = method(repository(explain_cursor), *args)
+        if hasattr(result, "__next__"):
+            list(result)
+
+        name = f"{repository.__name__}.{method_name}"
+        for query, plan in explain_cursor.plans:
+            for row in plan:
+                # The target of an INSERT shows as ALL though nothing is read
+                full_scan = row.get("type") in ("ALL", "index") and (
+                    row.get("select_type") != "INSERT"
+                )
+                report.append(
+                    {
+                        "query": name,
+                        "sql": query,
+                        "table": row.get("table"),
+                        "type": row.get("type"),
+                        "key": row.get("key"),
+                        "rows": row.get("rows"),
+                        "full_scan": full_scan,
+                        "expected": full_scan and name in FULL_SCAN_EXPECTED,
+                    }
+                )
+    return report
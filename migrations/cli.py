@@ -0,0 +1,89 @@
+import click
+from flask.cli import AppGroup
+
+from core.cache import invalidate_on_commit
+from core.database import database_transaction
+from migrations import applied_versions, downgrade, load_migrations, upgrade
+from migrations.check import explain_repository_queries
+from repositories.team_stats import TeamStatsRepository
+
+db_cli = AppGroup("db", help="Schema migrations and query plan checks")
+
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, default=None, help="Target version")
+def upgrade_command(target):
+    """Apply pending migrations"""
+    with database_transaction() as (db, cursor):
+        applied = upgrade(db, cursor, target)
+    if applied:
+        click.echo(f"Applied migrations {', '.join(map(str, applied))}")
+    else:
+        click.echo("Schema is up to date")
+
+
+@db_cli.command("downgrade")
+@click.option("--to", "target", type=int, required=True, help="Target version")
+def downgrade_command(target):
+    """Revert migrations newer than the target version"""
+    with database_transaction() as (db, cursor):
+        reverted = downgrade(db, cursor, target)
+    click.echo(f"Reverted migrations {', '.join(map(str, reverted)) or 'none'}")
+
+
+@db_cli.command("status")
+def status_command():
+    """List migrations and whether they are applied"""
+    with database_transaction() as (db, cursor):
+        done = set(applied_versions(cursor))
+    for migration in load_migrations():
+        state = "applied" if migration.VERSION in done else "pending"
+        click.echo(f"{migration.VERSION:04d} {state:8} {migration.DESCRIPTION}")
+
+
+@db_cli.command("check")
+def check_command():
+    """EXPLAIN every repository query and flag full table scans"""
+    with database_transaction() as (db, cursor):
+        report = explain_repository_queries(cursor)
+
+    unexpected = 0
+    for row in report:
+        if not row["full_scan"]:
+            flag = "ok"
+        elif row["expected"]:
+            flag = "scan (expected)"
+        else:
+            flag = "FULL SCAN"
+            unexpected += 1
+        click.echo(
+            f"{flag:16} {row['query']:45} {row['table'] or '-':14} "
+            f"type={row['type']} key={row['key']} rows={row['rows']}"
+        )
+
+    if unexpected:
+        raise click.ClickException(f"{unexpected} unexpected full scans")
+
+
+@db_cli.command("reconcile-team-stats")
+@click.option("--fix", is_flag=True, help="Rebuild the stats when they drifted")
+def reconcile_team_stats_command(fix):
+    """Compare the team stats with a full recompute"""
+    with database_transaction() as (db, cursor):
+        stats = TeamStatsRepository(cursor)
+        drift = stats.reconcile()
+        if drift and fix:
+            stats.rebuild()
+            invalidate_on_commit("team_members")
+
+    for entry in drift:
+        click.echo(
+            f"team {entry['team_id']}: stored {entry['stored']} "
+            f"expected {entry['expected']}"
+        )
+    if not drift:
+        click.echo("Team stats are consistent")
+    elif fix:
+        click.echo(f"Rebuilt the stats of {len(drift)} drifted teams")
+    else:
+        raise click.ClickException(f"{len(drift)} teams drifted, run with --fix")
@@ -0,0 +1,48 @@
+"""Tables the application reads and writes, as they exist in production"""
+
+VERSION = 1
+DESCRIPTION = "base schema"
+
+
+def up(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS members (
+            id INT NOT NULL AUTO_INCREMENT,
+            discord_id VARCHAR(32) NULL,
+            name VARCHAR(255) NOT NULL,
+            steam_id VARCHAR(32) NULL,
+            weight FLOAT NOT NULL DEFAULT 0,
+            smoke_color VARCHAR(32) NULL,
+            is_logged_in TINYINT(1) NOT NULL DEFAULT 0,
+            PRIMARY KEY (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            team_id INT NOT NULL AUTO_INCREMENT,
+            name VARCHAR(255) NOT NULL,
+            side VARCHAR(32) NULL,
+            channel_id VARCHAR(32) NULL,
+            is_playing TINYINT(1) NOT NULL DEFAULT 0,
+            hostname VARCHAR(255) NULL,
+            PRIMARY KEY (team_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS team_members (
+            member_id INT NOT NULL,
+            team_id INT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """
+    )
+
+
+def down(cursor):
+    cursor.execute("DROP TABLE IF EXISTS team_members")
+    cursor.execute("DROP TABLE IF EXISTS teams")
+    cursor.execute("DROP TABLE IF EXISTS members")
@@ -0,0 +1,51 @@
+"""Indexes behind the lookups the repositories run on every request"""
+
+from migrations.schema import create_index, drop_index
+
+VERSION = 2
+DESCRIPTION = "hot lookup indexes"
+
+INDEXES = [
+    # _member_has_team, delete_member, get_team_ids, assign_many
+    ("team_members", "uq_team_members_member", ("member_id",), True),
+    # delete_team and the teams/players join
+    ("team_members", "ix_team_members_team", ("team_id", "member_id"), False),
+    # get_no_team_id
+    ("teams", "ix_teams_name", ("name",), False),
+    # get_teams_connected, get_teams_with_players_connected
+    ("teams", "ix_teams_is_playing", ("is_playing",), False),
+    # get_members_by_login_status
+    (
+        "members",
+        "ix_members_login_weight",
+        ("is_logged_in", "weight", "steam_id"),
+        False,
+    ),
+    # get_all_members ordering and get_members_page keyset
+    ("members", "ix_members_weight_id", ("weight", "id"), False),
+]
+
+
+def up(cursor):
+    cursor.execute(
+        """
+        SELECT COUNT(*) AS count FROM (
+            SELECT member_id FROM team_members
+            GROUP BY member_id HAVING COUNT(*) > 1
+        ) duplicates
+    """
+    )
+    duplicates = cursor.fetchone()["count"]
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} members belong to several teams, keep a single "
+            "team_members row for each of them before migrating"
+        )
+
+    for table, name, columns, unique in INDEXES:
+        create_index(cursor, table, name, columns, unique)
+
+
+def down(cursor):
+    for table, name, _, _ in reversed(INDEXES):
+        drop_index(cursor, table, name)
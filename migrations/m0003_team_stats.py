@@ -0,0 +1,25 @@
+"""Per team weight sum, player count and connected count, kept up to date"""
+
+from repositories.team_stats import TeamStatsRepository
+
+VERSION = 3
+DESCRIPTION = "team stats"
+
+
+def up(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS team_stats (
+            team_id INT NOT NULL,
+            weight_sum DOUBLE NOT NULL DEFAULT 0,
+            player_count INT NOT NULL DEFAULT 0,
+            connected_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (team_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """
+    )
+    TeamStatsRepository(cursor).rebuild()
+
+
+def down(cursor):
+    cursor.execute("DROP TABLE IF EXISTS team_stats")
@@ -0,0 +1,36 @@
+from typing import Sequence
+
+
+def index_exists(cursor, table: str, name: str) -> bool:
+    cursor.execute(
+        """
+        SELECT COUNT(*) AS count
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+        AND table_name = %s
+        AND index_name = %s
+    """,
+        (table, name),
+    )
+    return cursor.fetchone()["count"] > 0
+
+
+def create_index(
+    cursor, table: str, name: str, columns: Sequence[str], unique: bool = False
+) -> None:
+    """CREATE INDEX unless an index with that name is already there"""
+    if index_exists(cursor, table, name):
+        return
+    cursor.execute(
+        "CREATE {unique}INDEX {name} ON {table} ({columns})".format(
+            unique="UNIQUE " if unique else "",
+            name=name,
+            table=table,
+            columns=", ".join(columns),
+        )
+    )
+
+
+def drop_index(cursor, table: str, name: str) -> None:
+    if index_exists(cursor, table, name):
+        cursor.execute(f"DROP INDEX {name} ON {table}")
@@ -1,15 +1,42 @@
-from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, Optional
 
 
-@dataclass
 class MemberDTO:
-    id: int
-    discord_id: str
-    name: str
-    steam_id: Optional[str]
-    weight: float
-    smoke_color: Optional[str]
-    team_id: Optional[int]
-    team_name: Optional[str]
-    is_logged_in: bool
+    """Member with its team, kept compact with __slots__"""
+
+    __slots__ = (
+        "id",
+        "discord_id",
+        "name",
+        "steam_id",
+        "weight",
+        "smoke_color",
+        "team_id",
+        "team_name",
+        "is_logged_in",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        discord_id: str,
+        name: str,
+        steam_id: Optional[str],
+        weight: float,
+        smoke_color: Optional[str],
+        team_id: Optional[int],
+        team_name: Optional[str],
+        is_logged_in: bool,
+    ):
+        self.id = id
+        self.discord_id = discord_id
+        self.name = name
+        self.steam_id = steam_id
+        self.weight = weight
+        self.smoke_color = smoke_color
+        self.team_id = team_id
+        self.team_name = team_name
+        self.is_logged_in = is_logged_in
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
@@ -1,18 +1,56 @@
-from dataclasses import dataclass, field
-from typing import Optional, Dict, List
+from typing import Dict, List, Optional, Tuple
 
 
-@dataclass
 class TeamDTO:
-    id: int
-    name: str
-    side: Optional[str]
-    is_playing: bool
-    channel_id: Optional[str]
-    hostname: Optional[str]
-    weight: float = 0
-    players: List[Dict] = field(default_factory=list)
+    """Team with its players, kept compact with __slots__"""
 
-    def __post_init__(self):
-        if self.players is None:
-            self.players = []
+    __slots__ = (
+        "id",
+        "name",
+        "side",
+        "is_playing",
+        "channel_id",
+        "hostname",
+        "weight",
+        "players",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        side: Optional[str],
+        is_playing: bool,
+        channel_id: Optional[str],
+        hostname: Optional[str],
+        weight: float = 0,
+        players: Optional[List[Tuple[int, str, float]]] = None,
+    ):
+        self.id = id
+        self.name = name
+        self.side = side
+        self.is_playing = is_playing
+        self.channel_id = channel_id
+        self.hostname = hostname
+        self.weight = weight
+        # (id, name, weight) tuples, turned into dicts only when serialized
+        self.players = players if players is not None else []
+
+    def add_player(self, player_id: int, name: str, weight: float) -> None:
+        self.weight += weight
+        self.players.append((player_id, name, weight))
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "side": self.side,
+            "is_playing": self.is_playing,
+            "channel_id": self.channel_id,
+            "hostname": self.hostname,
+            "weight": self.weight,
+            "players": [
+                {"id": player_id, "name": name, "weight": weight}
+                for player_id, name, weight in self.players
+            ],
+        }
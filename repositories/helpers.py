@@ -0,0 +1,74 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from core.config import BatchConfig
+
+T = TypeVar("T")
+
+
+def chunked(
+    items: Sequence[T], size: int = BatchConfig.CHUNK_SIZE
+) -> Iterator[List[T]]:
+    """Split items into lists of at most `size` elements"""
+    for start in range(0, len(items), size):
+        yield list(items[start : start + size])
+
+
+def placeholders(count: int, width: int = 1) -> str:
+    """Build `%s, %s` (width 1) or `(%s, %s), (%s, %s)` style placeholders"""
+    if width == 1:
+        return ", ".join(["%s"] * count)
+    row = "(" + ", ".join(["%s"] * width) + ")"
+    return ", ".join([row] * count)
+
+
+def changed_columns(
+    values: Dict, columns: Sequence[str], current: Optional[Dict] = None
+) -> Dict:
+    """Entries of `values` for `columns`, those equal in `current` left out"""
+    return {
+        column: values[column]
+        for column in columns
+        if column in values
+        and (current is None or current.get(column) != values[column])
+    }
+
+
+def update_statement(
+    table: str, key_column: str, key, changes: Dict
+) -> Tuple[str, List]:
+    """UPDATE of the `changes` columns only, of the row whose key is `key`"""
+    assignments = ", ".join(f"{column} = %s" for column in changes)
+    return (
+        f"UPDATE {table} SET {assignments} WHERE {key_column} = %s",
+        list(changes.values()) + [key],
+    )
+
+
+def case_update_statement(
+    table: str, key_column: str, rows: Dict[Any, Dict]
+) -> Tuple[str, List]:
+    """
+    One UPDATE of several rows, each with its own columns and values:
+    `column = CASE key WHEN %s THEN %s ... ELSE column END` per column
+
+    Args:
+        rows: key -> columns to write and their value, not empty
+    """
+    columns = list(dict.fromkeys(column for row in rows.values() for column in row))
+    assignments = []
+    params = []
+    for column in columns:
+        whens = []
+        for key, row in rows.items():
+            if column in row:
+                whens.append("WHEN %s THEN %s")
+                params.extend([key, row[column]])
+        assignments.append(
+            f"{column} = CASE {key_column} {' '.join(whens)} ELSE {column} END"
+        )
+    params.extend(rows)
+    return (
+        f"UPDATE {table} SET {', '.join(assignments)} "
+        f"WHERE {key_column} IN ({placeholders(len(rows))})",
+        params,
+    )
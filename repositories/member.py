@@ -1,5 +1,179 @@
-from typing import List, Dict, Optional
-from core.config import TeamConfig
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+from core.config import TeamConfig, BatchConfig, PaginationConfig
+from core.cache import cached_read, invalidate_on_commit
+from repositories.helpers import (
+    case_update_statement,
+    changed_columns,
+    chunked,
+    placeholders,
+    update_statement,
+)
+from repositories.team_stats import TeamStatsRepository
+
+# Public field name -> SELECT expression, for `fields=` projections
+MEMBER_FIELDS = {
+    "id": "m.id",
+    "discord_id": "m.discord_id",
+    "name": "m.name",
+    "steam_id": "m.steam_id",
+    "weight": "m.weight",
+    "smoke_color": "m.smoke_color",
+    "is_logged_in": "m.is_logged_in",
+    "team_id": "t.team_id",
+    "team_name": "t.name AS team_name",
+    "team_channel_id": "t.channel_id AS team_channel_id",
+}
+TEAM_FIELDS = {"team_id", "team_name", "team_channel_id"}
+
+# Columns of members that update_member writes
+MEMBER_COLUMNS = (
+    "discord_id",
+    "name",
+    "steam_id",
+    "weight",
+    "smoke_color",
+    "is_logged_in",
+)
+# Columns counted in team_stats
+STATS_COLUMNS = {"weight", "is_logged_in"}
+
+ALL_MEMBERS_QUERY = """
+    SELECT
+        m.*, t.team_id, t.name as team_name,
+        t.channel_id as team_channel_id
+    FROM members m
+    LEFT JOIN team_members tm ON m.id = tm.member_id
+    LEFT JOIN teams t ON tm.team_id = t.team_id
+    ORDER BY m.weight DESC
+"""
+
+# Columns a roster synchronization matches members on
+SYNC_KEYS = ("discord_id", "steam_id")
+
+# Current columns and team of the given members, for bulk updates
+CURRENT_MEMBERS_QUERY = """
+    SELECT m.*, tm.team_id
+    FROM members m
+    LEFT JOIN team_members tm ON m.id = tm.member_id
+    WHERE m.id IN ({})
+"""
+
+EXISTING_MEMBERS_QUERY = "SELECT id FROM members WHERE id IN ({})"
+
+INSERT_MEMBERS_QUERY = """
+    INSERT INTO members
+    (discord_id, name, steam_id, weight,
+    smoke_color, is_logged_in)
+    VALUES {}
+"""
+
+
+# A multi-row INSERT ... VALUES is a "simple insert": InnoDB allocates the ids
+# of all its rows at once, in every innodb_autoinc_lock_mode, so they follow
+# each other by auto_increment_increment from the id reported for the first
+# row. Ids are never provided by the repository, which would make it a
+# "mixed-mode insert" without that guarantee.
+AUTO_INCREMENT_STEP_QUERY = "SELECT @@SESSION.auto_increment_increment AS step"
+
+
+def _member_values(member_data: Dict) -> Tuple:
+    return (
+        member_data.get("discord_id"),
+        member_data.get("name"),
+        member_data.get("steam_id"),
+        member_data.get("weight", 0),
+        member_data.get("smoke_color"),
+        member_data.get("is_logged_in", False),
+    )
+
+
+def _members_page_query(
+    fields: Optional[List[str]],
+    team_id: Optional[int],
+    is_logged_in: Optional[bool],
+    min_weight: Optional[float],
+    name_prefix: Optional[str],
+    after: Optional[Tuple[float, int]],
+    limit: int,
+) -> Tuple[str, List]:
+    """SELECT of one page of members and its parameters, see get_members_page"""
+    if fields is None:
+        columns = [
+            "m.*",
+            MEMBER_FIELDS["team_id"],
+            MEMBER_FIELDS["team_name"],
+            MEMBER_FIELDS["team_channel_id"],
+        ]
+        needs_team = True
+    else:
+        # The keyset needs weight and id even when they are not requested
+        selected = list(dict.fromkeys(list(fields) + ["weight", "id"]))
+        columns = [MEMBER_FIELDS[field] for field in selected]
+        needs_team = bool(TEAM_FIELDS.intersection(fields))
+
+    joins = ""
+    if needs_team:
+        joins = """
+            LEFT JOIN team_members tm ON m.id = tm.member_id
+            LEFT JOIN teams t ON tm.team_id = t.team_id
+        """
+    elif team_id is not None:
+        joins = "JOIN team_members tm ON m.id = tm.member_id"
+
+    conditions = []
+    params = []
+    if team_id is not None:
+        conditions.append("tm.team_id = %s")
+        params.append(team_id)
+    if is_logged_in is not None:
+        conditions.append("m.is_logged_in = %s")
+        params.append(is_logged_in)
+    if min_weight is not None:
+        conditions.append("m.weight >= %s")
+        params.append(min_weight)
+    if name_prefix:
+        escaped = (
+            name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        conditions.append("m.name LIKE %s")
+        params.append(escaped + "%")
+    if after is not None:
+        # weight is a FLOAT column: compare with the cursor value rounded to
+        # single precision, or rows sharing a weight get skipped at the boundary
+        conditions.append(
+            "(m.weight < CAST(%s AS FLOAT)"
+            " OR (m.weight = CAST(%s AS FLOAT) AND m.id > %s))"
+        )
+        params.extend([after[0], after[0], after[1]])
+
+    query = """
+        SELECT {columns}
+        FROM members m
+        {joins}
+        {where}
+        ORDER BY m.weight DESC, m.id ASC
+        LIMIT %s
+    """.format(
+        columns=", ".join(columns),
+        joins=joins,
+        where="WHERE " + " AND ".join(conditions) if conditions else "",
+    )
+    params.append(limit + 1)
+    return query, params
+
+
+def _members_page_result(
+    rows: List[Dict], fields: Optional[List[str]], limit: int
+) -> Tuple[List[Dict], Optional[Tuple[float, int]]]:
+    """Trim the extra row fetched by _members_page_query into a next keyset"""
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["weight"], rows[-1]["id"])
+
+    if fields is not None:
+        rows = [{field: row[field] for field in fields} for row in rows]
+    return rows, next_after
 
 
 class MemberRepository:
@@ -8,6 +182,8 @@ class MemberRepository:
 
     def delete_member(self, member_id: int) -> bool:
         """Delete a member from the database"""
+        invalidate_on_commit("members", "team_members")
+        TeamStatsRepository(self.cursor).remove_members([member_id])
         # First, remove any team memberships
         team_delete_query = "DELETE FROM team_members WHERE member_id = %s"
         self.cursor.execute(team_delete_query, (member_id,))
@@ -19,46 +195,119 @@ class MemberRepository:
         return self.cursor.rowcount > 0
 
     def toggle_connection_all(self, is_logged_in: int):
+        invalidate_on_commit("members")
         query = """
             UPDATE members SET is_logged_in = %s
         """
 
         self.cursor.execute(query, (is_logged_in,))
+        TeamStatsRepository(self.cursor).set_all_connected(is_logged_in)
 
+    @cached_read("members", "team_members", "teams")
     def get_all_members(self) -> List[Dict]:
-        query = """
-            SELECT
-                m.*, t.team_id, t.name as team_name,
-                t.channel_id as team_channel_id
+        self.cursor.execute(ALL_MEMBERS_QUERY)
+        return self.cursor.fetchall()
+
+    def iter_all_members(
+        self, fetch_size: int = BatchConfig.STREAM_FETCH_SIZE
+    ) -> Iterator[Dict]:
+        """Same rows as get_all_members, fetched `fetch_size` at a time"""
+        self.cursor.execute(ALL_MEMBERS_QUERY)
+        while True:
+            rows = self.cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def iter_members_with_keys(
+        self, keys: List[str], fetch_size: int = BatchConfig.STREAM_FETCH_SIZE
+    ) -> Iterator[Dict]:
+        """
+        Members with a value for any of `keys` (SYNC_KEYS), with their
+        team_id, ordered by id and fetched `fetch_size` at a time
+        """
+        conditions = " OR ".join(f"m.{key} IS NOT NULL" for key in keys)
+        self.cursor.execute(
+            f"""
+            SELECT m.*, tm.team_id
             FROM members m
             LEFT JOIN team_members tm ON m.id = tm.member_id
-            LEFT JOIN teams t ON tm.team_id = t.team_id
-            ORDER BY m.weight DESC
+            WHERE {conditions}
+            ORDER BY m.id
         """
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+        )
+        while True:
+            rows = self.cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def get_members_page(
+        self,
+        fields: Optional[List[str]] = None,
+        team_id: Optional[int] = None,
+        is_logged_in: Optional[bool] = None,
+        min_weight: Optional[float] = None,
+        name_prefix: Optional[str] = None,
+        after: Optional[Tuple[float, int]] = None,
+        limit: int = PaginationConfig.DEFAULT_LIMIT,
+    ) -> Tuple[List[Dict], Optional[Tuple[float, int]]]:
+        """
+        One page of members ordered by weight, using keyset pagination
+
+        Args:
+            fields: Keys of MEMBER_FIELDS to select, every column when None
+            after: (weight, id) of the last member of the previous page
+            limit: Maximum number of members to return
+
+        Returns:
+            tuple: (members, (weight, id) to pass as `after` for the next
+            page or None on the last page)
+        """
+        query, params = _members_page_query(
+            fields, team_id, is_logged_in, min_weight, name_prefix, after, limit
+        )
+        self.cursor.execute(query, params)
+        return _members_page_result(self.cursor.fetchall(), fields, limit)
 
     def add_member(self, member_data: Dict) -> int:
         """Add a new member to the database"""
-        query = """
-            INSERT INTO members
-            (discord_id, name, steam_id, weight,
-            smoke_color, is_logged_in)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
+        invalidate_on_commit("members")
         self.cursor.execute(
-            query,
-            (
-                member_data.get("discord_id"),
-                member_data.get("name"),
-                member_data.get("steam_id"),
-                member_data.get("weight", 0),
-                member_data.get("smoke_color"),
-                member_data.get("is_logged_in", False),
-            ),
+            INSERT_MEMBERS_QUERY.format(placeholders(1, width=6)),
+            _member_values(member_data),
         )
         return self.cursor.lastrowid
 
+    def add_members(
+        self, members: List[Dict], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> List[int]:
+        """
+        Insert many members with multi-row INSERT statements
+
+        Returns:
+            list: Generated ids, in the same order as `members`
+        """
+        if not members:
+            return []
+        invalidate_on_commit("members")
+        self.cursor.execute(AUTO_INCREMENT_STEP_QUERY)
+        step = int(self.cursor.fetchone()["step"])
+        ids = []
+        for chunk in chunked(members, chunk_size):
+            self.cursor.execute(
+                INSERT_MEMBERS_QUERY.format(placeholders(len(chunk), width=6)),
+                [
+                    value
+                    for member_data in chunk
+                    for value in _member_values(member_data)
+                ],
+            )
+            # A multi-row INSERT reports the id of its first row
+            first_id = self.cursor.lastrowid
+            ids.extend(range(first_id, first_id + len(chunk) * step, step))
+        return ids
+
     def get_member_by_id(self, member_id: int) -> Optional[Dict]:
         """Retrieve a member by their ID"""
         query = """
@@ -73,25 +322,122 @@ class MemberRepository:
         self.cursor.execute(query, (member_id,))
         return self.cursor.fetchone()
 
-    def update_member(self, member: Dict, member_id: int) -> None:
-        query = """
-            UPDATE members
-            SET steam_id = %s, weight = %s, smoke_color = %s,
-            is_logged_in = %s, discord_id= %s, name = %s
-            WHERE id = %s
+    def update_member(
+        self, member: Dict, member_id: int, current: Optional[Dict] = None
+    ) -> Dict:
         """
-        self.cursor.execute(
-            query,
-            (
-                member.get("steam_id"),
-                member.get("weight"),
-                member.get("smoke_color"),
-                member.get("is_logged_in"),
-                member.get("discord_id"),
-                member.get("name"),
-                member_id,
-            ),
+        Write the columns present in `member`, leaving the others as they are
+
+        Args:
+            current: The row as read by get_member_by_id; columns whose value
+                is unchanged are then not written, nor is the row at all when
+                nothing changed
+
+        Returns:
+            dict: The columns written and their new value
+        """
+        changes = changed_columns(member, MEMBER_COLUMNS, current)
+        if not changes:
+            return changes
+
+        invalidate_on_commit("members")
+        # The stats of the team only move with the weight or the connection
+        counted = not STATS_COLUMNS.isdisjoint(changes) and (
+            current is None or current.get("team_id") is not None
         )
+        stats = TeamStatsRepository(self.cursor)
+        if counted:
+            stats.remove_members([member_id])
+        self.cursor.execute(*update_statement("members", "id", member_id, changes))
+        if counted:
+            stats.add_members([member_id])
+        return changes
+
+    def update_members(
+        self,
+        updates: Dict[int, Dict],
+        chunk_size: int = BatchConfig.CHUNK_SIZE,
+        current: Optional[Dict[int, Dict]] = None,
+    ) -> Tuple[Dict[int, Dict], List[int]]:
+        """
+        Write the columns of many members with one CASE UPDATE per chunk
+
+        Args:
+            updates: member id -> columns to write, as for update_member;
+                unchanged columns are not written
+            current: member id -> row with the columns and team_id, as read
+                by iter_members_with_keys, to skip reading them again
+
+        Returns:
+            tuple: (member id -> columns written, for every member found,
+            ids of the members not found)
+        """
+        written = {}
+        missing = []
+        for chunk in chunked(list(updates), chunk_size):
+            if current is None:
+                self.cursor.execute(
+                    CURRENT_MEMBERS_QUERY.format(placeholders(len(chunk))), chunk
+                )
+                rows = {row["id"]: row for row in self.cursor.fetchall()}
+            else:
+                rows = {
+                    member_id: current[member_id]
+                    for member_id in chunk
+                    if member_id in current
+                }
+            missing.extend(member_id for member_id in chunk if member_id not in rows)
+
+            changes = {}
+            for member_id, row in rows.items():
+                written[member_id] = changed_columns(
+                    updates[member_id], MEMBER_COLUMNS, row
+                )
+                if written[member_id]:
+                    changes[member_id] = written[member_id]
+            if not changes:
+                continue
+
+            invalidate_on_commit("members")
+            counted = [
+                member_id
+                for member_id, columns in changes.items()
+                if not STATS_COLUMNS.isdisjoint(columns)
+                and rows[member_id]["team_id"] is not None
+            ]
+            stats = TeamStatsRepository(self.cursor)
+            stats.remove_members(counted, chunk_size)
+            self.cursor.execute(*case_update_statement("members", "id", changes))
+            stats.add_members(counted, chunk_size)
+        return written, missing
+
+    def delete_members(
+        self, member_ids: List[int], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> List[int]:
+        """
+        Delete many members and their team memberships, a chunk at a time
+
+        Returns:
+            list: Ids of the members deleted, the others were not found
+        """
+        deleted = []
+        for chunk in chunked(list(dict.fromkeys(member_ids)), chunk_size):
+            self.cursor.execute(
+                EXISTING_MEMBERS_QUERY.format(placeholders(len(chunk))), chunk
+            )
+            found = [row["id"] for row in self.cursor.fetchall()]
+            if not found:
+                continue
+
+            invalidate_on_commit("members", "team_members")
+            TeamStatsRepository(self.cursor).remove_members(found, chunk_size)
+            in_found = placeholders(len(found))
+            self.cursor.execute(
+                f"DELETE FROM team_members WHERE member_id IN ({in_found})", found
+            )
+            self.cursor.execute(f"DELETE FROM members WHERE id IN ({in_found})", found)
+            deleted.extend(found)
+        return deleted
 
     def get_members_by_login_status(self, is_logged_in: bool) -> List[Dict]:
         query = """
@@ -103,3 +449,75 @@ class MemberRepository:
         """
         self.cursor.execute(query, (TeamConfig.MIN_WEIGHT, is_logged_in))
         return self.cursor.fetchall()
+
+
+class AsyncMemberRepository:
+    """MemberRepository for the ASGI app, on an aiomysql DictCursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @cached_read("members", "team_members", "teams")
+    async def get_all_members(self) -> List[Dict]:
+        await self.cursor.execute(ALL_MEMBERS_QUERY)
+        return await self.cursor.fetchall()
+
+    async def iter_all_members(
+        self, fetch_size: int = BatchConfig.STREAM_FETCH_SIZE
+    ) -> AsyncIterator[Dict]:
+        """Same rows as get_all_members, fetched `fetch_size` at a time"""
+        await self.cursor.execute(ALL_MEMBERS_QUERY)
+        while True:
+            rows = await self.cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    async def get_members_page(
+        self,
+        fields: Optional[List[str]] = None,
+        team_id: Optional[int] = None,
+        is_logged_in: Optional[bool] = None,
+        min_weight: Optional[float] = None,
+        name_prefix: Optional[str] = None,
+        after: Optional[Tuple[float, int]] = None,
+        limit: int = PaginationConfig.DEFAULT_LIMIT,
+    ) -> Tuple[List[Dict], Optional[Tuple[float, int]]]:
+        """See MemberRepository.get_members_page"""
+        query, params = _members_page_query(
+            fields, team_id, is_logged_in, min_weight, name_prefix, after, limit
+        )
+        await self.cursor.execute(query, params)
+        return _members_page_result(await self.cursor.fetchall(), fields, limit)
+
+    async def add_member(self, member_data: Dict) -> int:
+        invalidate_on_commit("members")
+        await self.cursor.execute(
+            INSERT_MEMBERS_QUERY.format(placeholders(1, width=6)),
+            _member_values(member_data),
+        )
+        return self.cursor.lastrowid
+
+    async def add_members(
+        self, members: List[Dict], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> List[int]:
+        """See MemberRepository.add_members"""
+        if not members:
+            return []
+        invalidate_on_commit("members")
+        await self.cursor.execute(AUTO_INCREMENT_STEP_QUERY)
+        step = int((await self.cursor.fetchone())["step"])
+        ids = []
+        for chunk in chunked(members, chunk_size):
+            await self.cursor.execute(
+                INSERT_MEMBERS_QUERY.format(placeholders(len(chunk), width=6)),
+                [
+                    value
+                    for member_data in chunk
+                    for value in _member_values(member_data)
+                ],
+            )
+            first_id = self.cursor.lastrowid
+            ids.extend(range(first_id, first_id + len(chunk) * step, step))
+        return ids
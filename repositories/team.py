@@ -1,38 +1,98 @@
+import logging
+
 from models.team import TeamDTO
-from typing import Dict, List, Optional
-from core.config import TeamConfig
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from core.config import TeamConfig, BatchConfig
+from core.cache import cached_read, invalidate_on_commit
+from repositories.helpers import changed_columns, update_statement
+from repositories.team_stats import TeamStatsRepository
 
+logger = logging.getLogger(__name__)
 
-class TeamRepository:
-    def __init__(self, cursor):
-        self.cursor = cursor
 
-    def get_teams_with_players_connected(self):
-        self.cursor.execute(
-            """
-            SELECT team_id, name, channel_id, side, is_playing, hostname
-            FROM teams
-            WHERE is_playing
-            ORDER BY team_id
-        """
-        )
-        teams = self.cursor.fetchall()
+# Teams joined with their players, one row per player (or a single row with
+# NULL player columns for an empty team), ordered so rows of a team follow
+# each other
+TEAMS_WITH_PLAYERS_QUERY = """
+    SELECT
+        t.team_id, t.name, t.channel_id, t.side, t.is_playing, t.hostname,
+        m.id as player_id, m.name as player_name, m.weight as player_weight
+    FROM teams t
+    LEFT JOIN team_members tm ON t.team_id = tm.team_id
+    LEFT JOIN members m ON m.id = tm.member_id
+    {where}
+    ORDER BY t.team_id
+"""
 
-        # Get team players
-        self.cursor.execute(
-            """
-            SELECT
-                t.team_id, t.name, m.id as player_id,
-                m.name as player_name, m.weight as player_weight
-            FROM teams t
-            LEFT JOIN team_members tm ON t.team_id = tm.team_id
-            LEFT JOIN members m ON m.id = tm.member_id
-            WHERE m.name IS NOT NULL
-        """
+
+# Every team with its materialized stats, one row per team whatever its size
+TEAM_SUMMARIES_QUERY = """
+    SELECT
+        t.team_id, t.name, t.side, t.is_playing,
+        COALESCE(s.weight_sum, 0) AS weight_sum,
+        COALESCE(s.player_count, 0) AS player_count,
+        COALESCE(s.connected_count, 0) AS connected_count
+    FROM teams t
+    LEFT JOIN team_stats s ON s.team_id = t.team_id
+    ORDER BY t.team_id
+"""
+
+
+# Columns of teams that update_team writes
+TEAM_COLUMNS = ("name", "side", "channel_id", "hostname", "is_playing")
+
+
+ALL_TEAMS_QUERY = """
+    SELECT team_id, name, channel_id, side, is_playing, hostname
+    FROM teams
+    ORDER BY team_id
+"""
+
+
+def _fold_team_row(
+    team: Optional[TeamDTO], row: Dict
+) -> Tuple[Optional[TeamDTO], TeamDTO]:
+    """
+    Add a TEAMS_WITH_PLAYERS_QUERY row to `team`, or start the next team
+
+    Returns:
+        tuple: (the team that is complete, if the row started a new one,
+        the team the row belongs to)
+    """
+    done = None
+    if team is None or team.id != row["team_id"]:
+        done = team
+        team = TeamDTO(
+            id=row["team_id"],
+            name=row["name"],
+            channel_id=row["channel_id"],
+            side=row["side"],
+            is_playing=row["is_playing"],
+            hostname=row["hostname"],
         )
-        players = self.cursor.fetchall()
+    if row["player_name"] is not None:
+        team.add_player(row["player_id"], row["player_name"], row["player_weight"])
+    return done, team
+
 
-        return self._aggregate_team_data(teams, players)
+def _group_team_rows(rows: Iterable[Dict]) -> Iterator[TeamDTO]:
+    """Fold consecutive rows of the same team into a TeamDTO, in one pass"""
+    team = None
+    for row in rows:
+        done, team = _fold_team_row(team, row)
+        if done is not None:
+            yield done
+    if team is not None:
+        yield team
+
+
+class TeamRepository:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def get_teams_with_players_connected(self) -> List[TeamDTO]:
+        self.cursor.execute(TEAMS_WITH_PLAYERS_QUERY.format(where="WHERE t.is_playing"))
+        return self._aggregate_team_data(self.cursor.fetchall())
 
     def get_teams_connected(self):
         self.cursor.execute(
@@ -47,7 +107,8 @@ class TeamRepository:
         return teams
 
     def add_team(self, team: Dict):
-        print(team)
+        invalidate_on_commit("teams")
+        logger.debug("adding team %s", team)
         query = """
             INSERT INTO teams (name, side, channel_id, is_playing, hostname)
             VALUES (%s, %s, %s, %s, %s)
@@ -66,103 +127,74 @@ class TeamRepository:
 
         return self.cursor.lastrowid
 
-    def update_team(self, team):
-        query = """
-            UPDATE teams
-            SET name = %s, side = %s,
-            channel_id = NULLIF(%s, ''),
-            hostname = NULLIF(%s, ''),
-            is_playing = %s
-            WHERE team_id = %s
+    def update_team(self, team: Dict, current: Optional[Dict] = None) -> Dict:
         """
-        print(team)
+        Write the columns present in `team` for the team `team["id"]`
 
-        self.cursor.execute(
-            query,
-            (
-                team.get("name"),
-                team.get("side"),
-                team.get("channel_id"),
-                team.get("hostname"),
-                team.get("is_playing"),
-                team.get("id"),
-            ),
-        )
+        Args:
+            current: The current row; columns whose value is unchanged are
+                then not written, nor is the row at all when nothing changed
 
-    def get_teams_and_players(self) -> List[TeamDTO]:
-        # Get basic team info
-        self.cursor.execute(
-            """
-            SELECT team_id, name, channel_id, side, is_playing
-            FROM teams
-            ORDER BY team_id
+        Returns:
+            dict: The columns written and their new value
         """
-        )
-        teams = self.cursor.fetchall()
+        values = dict(team)
+        for column in ("channel_id", "hostname"):
+            if column in values:
+                values[column] = values[column] or None
+        changes = changed_columns(values, TEAM_COLUMNS, current)
+        if not changes:
+            return changes
 
-        # Get team players
-        self.cursor.execute(
-            """
-            SELECT
-                t.team_id, t.name, m.id as player_id,
-                m.name as player_name, m.weight as player_weight
-            FROM teams t
-            LEFT JOIN team_members tm ON t.team_id = tm.team_id
-            LEFT JOIN members m ON m.id = tm.member_id
-            WHERE m.name IS NOT NULL
-        """
-        )
-        players = self.cursor.fetchall()
+        invalidate_on_commit("teams")
+        logger.debug("updating team %s with %s", team.get("id"), changes)
+        self.cursor.execute(*update_statement("teams", "team_id", team["id"], changes))
+        return changes
 
-        return self._aggregate_team_data(teams, players)
+    def get_teams_and_players(self) -> List[TeamDTO]:
+        self.cursor.execute(TEAMS_WITH_PLAYERS_QUERY.format(where=""))
+        return self._aggregate_team_data(self.cursor.fetchall())
 
+    @cached_read("teams")
     def get_all_teams(self) -> List[TeamDTO]:
         # Get basic team info
-        self.cursor.execute(
-            """
-            SELECT team_id, name, channel_id, side, is_playing, hostname
-            FROM teams
-            ORDER BY team_id
-        """
-        )
+        self.cursor.execute(ALL_TEAMS_QUERY)
         teams = self.cursor.fetchall()
 
         return teams
 
-    def _aggregate_team_data(
-        self, teams: List[Dict], players: List[Dict]
-    ) -> List[TeamDTO]:
-        team_map = {
-            team["team_id"]: TeamDTO(
-                id=team["team_id"],
-                name=team["name"],
-                channel_id=team["channel_id"],
-                side=team["side"],
-                is_playing=team["is_playing"],
-                hostname=team["hostname"],
-            )
-            for team in teams
-        }
-
-        for player in players:
-            team = team_map.get(player["team_id"])
-            if team:
-                team.weight += player["player_weight"]
-                team.players.append(
-                    {
-                        "id": player["player_id"],
-                        "name": player["player_name"],
-                        "weight": player["player_weight"],
-                    }
-                )
-
-        return list(team_map.values())
+    @cached_read("teams", "team_members", "members")
+    def get_team_summaries(self) -> List[Dict]:
+        """Weight sum, player count and connected count of every team"""
+        self.cursor.execute(TEAM_SUMMARIES_QUERY)
+        return self.cursor.fetchall()
+
+    def iter_teams_with_players(
+        self, fetch_size: int = BatchConfig.STREAM_FETCH_SIZE
+    ) -> Iterator[TeamDTO]:
+        """Every team with its players, built while rows are fetched"""
+        self.cursor.execute(TEAMS_WITH_PLAYERS_QUERY.format(where=""))
+
+        def rows():
+            while True:
+                batch = self.cursor.fetchmany(fetch_size)
+                if not batch:
+                    return
+                yield from batch
+
+        return _group_team_rows(rows())
+
+    def _aggregate_team_data(self, rows: Iterable[Dict]) -> List[TeamDTO]:
+        """Build one TeamDTO per team from TEAMS_WITH_PLAYERS_QUERY rows"""
+        return list(_group_team_rows(rows))
 
     def delete_team(self, team_id: int) -> bool:
         """Delete a member from the database"""
+        invalidate_on_commit("teams", "team_members")
         # First, remove any team memberships
         team_delete_query = "DELETE FROM team_members WHERE team_id = %s"
         self.cursor.execute(team_delete_query, (team_id,))
+        TeamStatsRepository(self.cursor).delete_team(team_id)
 
         # Then delete the member
         query = "DELETE FROM teams WHERE team_id = %s"
@@ -187,3 +219,42 @@ class TeamRepository:
         )
         result = self.cursor.fetchone()
         return result["team_id"]
+
+
+class AsyncTeamRepository:
+    """TeamRepository for the ASGI app, on an aiomysql DictCursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @cached_read("teams")
+    async def get_all_teams(self) -> List[Dict]:
+        await self.cursor.execute(ALL_TEAMS_QUERY)
+        return await self.cursor.fetchall()
+
+    async def get_teams_with_players_connected(self) -> List[TeamDTO]:
+        await self.cursor.execute(
+            TEAMS_WITH_PLAYERS_QUERY.format(where="WHERE t.is_playing")
+        )
+        return list(_group_team_rows(await self.cursor.fetchall()))
+
+    async def get_teams_and_players(self) -> List[TeamDTO]:
+        await self.cursor.execute(TEAMS_WITH_PLAYERS_QUERY.format(where=""))
+        return list(_group_team_rows(await self.cursor.fetchall()))
+
+    async def iter_teams_with_players(
+        self, fetch_size: int = BatchConfig.STREAM_FETCH_SIZE
+    ) -> AsyncIterator[TeamDTO]:
+        """Every team with its players, built while rows are fetched"""
+        await self.cursor.execute(TEAMS_WITH_PLAYERS_QUERY.format(where=""))
+        team = None
+        while True:
+            rows = await self.cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                done, team = _fold_team_row(team, row)
+                if done is not None:
+                    yield done
+        if team is not None:
+            yield team
@@ -1,12 +1,156 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.cache import invalidate_on_commit
+from core.config import BatchConfig
+from repositories.helpers import chunked, placeholders
+from repositories.team_stats import TeamStatsRepository, apply_members_statements
+
+
+EXISTING_MEMBERS_QUERY = "SELECT id FROM members WHERE id IN ({})"
+EXISTING_TEAMS_QUERY = "SELECT team_id FROM teams WHERE team_id IN ({})"
+TEAM_IDS_QUERY = "SELECT member_id, team_id FROM team_members WHERE member_id IN ({})"
+
+
+def _parse_assignments(
+    assignments: Iterable[Tuple[int, int]]
+) -> Tuple[Dict[int, int], List[Dict]]:
+    """member id -> team id of the wanted assignments, the last pair wins"""
+    failed = []
+    wanted = {}
+    for member_id, team_id in assignments:
+        try:
+            wanted[int(member_id)] = int(team_id)
+        except (ValueError, TypeError):
+            failed.append(
+                {
+                    "member_id": member_id,
+                    "team_id": team_id,
+                    "error": "Member ID and team ID must be valid integers",
+                }
+            )
+    return wanted, failed
+
+
+def _check_assignments(
+    wanted: Dict[int, int], known_members: set, known_teams: set, failed: List[Dict]
+) -> List[Tuple[int, int]]:
+    """Pairs whose member and team exist; the others are added to `failed`"""
+    valid = []
+    for member_id, team_id in wanted.items():
+        if member_id not in known_members:
+            error = f"Member with ID {member_id} not found"
+        elif team_id not in known_teams:
+            error = f"Team with ID {team_id} not found"
+        else:
+            valid.append((member_id, team_id))
+            continue
+        failed.append({"member_id": member_id, "team_id": team_id, "error": error})
+    return valid
+
+
+def _assignment_statements(
+    valid: List[Tuple[int, int]], chunk_size: int
+) -> Iterator[Tuple[str, List]]:
+    """
+    DELETE then multi-row INSERT of every chunk of (member_id, team_id), the
+    members taken out of the stats of their old team and added to the new one
+    """
+    for chunk in chunked(valid, chunk_size):
+        member_ids = [member_id for member_id, _ in chunk]
+        yield from apply_members_statements(member_ids, -1, chunk_size)
+        yield (
+            "DELETE FROM team_members WHERE member_id IN ({})".format(
+                placeholders(len(chunk))
+            ),
+            member_ids,
+        )
+        yield (
+            "INSERT INTO team_members (member_id, team_id) VALUES {}".format(
+                placeholders(len(chunk), width=2)
+            ),
+            [value for pair in chunk for value in pair],
+        )
+        yield from apply_members_statements(member_ids, 1, chunk_size)
+
+
 class TeamMemberRepository:
     def __init__(self, cursor):
         self.cursor = cursor
 
-    def update_team_member(self, member_id: int, team_id: int) -> None:
-        if self._member_has_team(member_id):
+    def update_team_member(
+        self, member_id: int, team_id: int, has_team: Optional[bool] = None
+    ) -> None:
+        """
+        Move the member to the team; `has_team` tells whether it is in one
+        already, looked up when None
+        """
+        invalidate_on_commit("team_members")
+        stats = TeamStatsRepository(self.cursor)
+        if has_team is None:
+            has_team = self._member_has_team(member_id)
+        if has_team:
+            stats.remove_members([member_id])
             self._update(member_id, team_id)
         else:
             self._insert(member_id, team_id)
+        stats.add_members([member_id])
+
+    def assign_many(
+        self,
+        assignments: Iterable[Tuple[int, int]],
+        chunk_size: int = BatchConfig.CHUNK_SIZE,
+    ) -> Tuple[List[Tuple[int, int]], List[Dict]]:
+        """
+        Move many members to their teams in a constant number of statements
+
+        Args:
+            assignments: (member_id, team_id) pairs, the last pair wins when a
+                member appears more than once
+            chunk_size: Maximum number of rows per statement
+
+        Returns:
+            tuple: (successful pairs, failed entries with member_id, team_id
+            and error)
+        """
+        wanted, failed = _parse_assignments(assignments)
+        if not wanted:
+            return [], failed
+
+        known_members = self._existing_ids(
+            EXISTING_MEMBERS_QUERY, "id", list(wanted), chunk_size
+        )
+        known_teams = self._existing_ids(
+            EXISTING_TEAMS_QUERY, "team_id", list(set(wanted.values())), chunk_size
+        )
+        valid = _check_assignments(wanted, known_members, known_teams, failed)
+
+        if valid:
+            invalidate_on_commit("team_members")
+        for query, params in _assignment_statements(valid, chunk_size):
+            self.cursor.execute(query, params)
+
+        return valid, failed
+
+    def get_team_ids(
+        self, member_ids: List[int], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> Dict[int, int]:
+        """Current team of each given member that has one"""
+        teams = {}
+        for chunk in chunked(member_ids, chunk_size):
+            self.cursor.execute(TEAM_IDS_QUERY.format(placeholders(len(chunk))), chunk)
+            teams.update(
+                (row["member_id"], row["team_id"]) for row in self.cursor.fetchall()
+            )
+        return teams
+
+    def _existing_ids(
+        self, query: str, column: str, ids: List[int], chunk_size: int
+    ) -> set:
+        found = set()
+        for chunk in chunked(ids, chunk_size):
+            self.cursor.execute(query.format(placeholders(len(chunk))), chunk)
+            found.update(row[column] for row in self.cursor.fetchall())
+        return found
 
     def _member_has_team(self, member_id: int) -> bool:
         self.cursor.execute(
@@ -26,3 +170,59 @@ class TeamMemberRepository:
             "INSERT INTO team_members (member_id, team_id) VALUES (%s, %s)",
             (member_id, team_id),
         )
+
+
+class AsyncTeamMemberRepository:
+    """TeamMemberRepository for the ASGI app, on an aiomysql DictCursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    async def assign_many(
+        self,
+        assignments: Iterable[Tuple[int, int]],
+        chunk_size: int = BatchConfig.CHUNK_SIZE,
+    ) -> Tuple[List[Tuple[int, int]], List[Dict]]:
+        """See TeamMemberRepository.assign_many"""
+        wanted, failed = _parse_assignments(assignments)
+        if not wanted:
+            return [], failed
+
+        known_members = await self._existing_ids(
+            EXISTING_MEMBERS_QUERY, "id", list(wanted), chunk_size
+        )
+        known_teams = await self._existing_ids(
+            EXISTING_TEAMS_QUERY, "team_id", list(set(wanted.values())), chunk_size
+        )
+        valid = _check_assignments(wanted, known_members, known_teams, failed)
+
+        if valid:
+            invalidate_on_commit("team_members")
+        for query, params in _assignment_statements(valid, chunk_size):
+            await self.cursor.execute(query, params)
+
+        return valid, failed
+
+    async def get_team_ids(
+        self, member_ids: List[int], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> Dict[int, int]:
+        """Current team of each given member that has one"""
+        teams = {}
+        for chunk in chunked(member_ids, chunk_size):
+            await self.cursor.execute(
+                TEAM_IDS_QUERY.format(placeholders(len(chunk))), chunk
+            )
+            teams.update(
+                (row["member_id"], row["team_id"])
+                for row in await self.cursor.fetchall()
+            )
+        return teams
+
+    async def _existing_ids(
+        self, query: str, column: str, ids: List[int], chunk_size: int
+    ) -> set:
+        found = set()
+        for chunk in chunked(ids, chunk_size):
+            await self.cursor.execute(query.format(placeholders(len(chunk))), chunk)
+            found.update(row[column] for row in await self.cursor.fetchall())
+        return found
@@ -0,0 +1,141 @@
+from typing import Dict, List
+
+from core.config import BatchConfig
+from repositories.helpers import chunked, placeholders
+
+# Adds (sign 1) or removes (sign -1) the members of the given ids to the
+# stats of the team they are in
+APPLY_MEMBERS_QUERY = """
+    INSERT INTO team_stats (team_id, weight_sum, player_count, connected_count)
+    SELECT tm.team_id, %s * SUM(m.weight), %s * COUNT(*), %s * SUM(m.is_logged_in)
+    FROM team_members tm
+    JOIN members m ON m.id = tm.member_id
+    WHERE tm.member_id IN ({})
+    GROUP BY tm.team_id
+    ON DUPLICATE KEY UPDATE
+        weight_sum = weight_sum + VALUES(weight_sum),
+        player_count = player_count + VALUES(player_count),
+        connected_count = connected_count + VALUES(connected_count)
+"""
+
+# Stats of every team computed from its members
+RECOMPUTE_QUERY = """
+    SELECT
+        t.team_id,
+        COALESCE(SUM(m.weight), 0) AS weight_sum,
+        COUNT(m.id) AS player_count,
+        COALESCE(SUM(m.is_logged_in), 0) AS connected_count
+    FROM teams t
+    LEFT JOIN team_members tm ON tm.team_id = t.team_id
+    LEFT JOIN members m ON m.id = tm.member_id
+    GROUP BY t.team_id
+"""
+
+STATS_FIELDS = ("weight_sum", "player_count", "connected_count")
+
+
+def apply_members_statements(member_ids: List[int], sign: int, chunk_size: int):
+    """APPLY_MEMBERS_QUERY statements for every chunk of `member_ids`"""
+    for chunk in chunked(member_ids, chunk_size):
+        yield (
+            APPLY_MEMBERS_QUERY.format(placeholders(len(chunk))),
+            [sign, sign, sign] + list(chunk),
+        )
+
+
+def _differs(stored: Dict, expected: Dict) -> bool:
+    # Weights are floats summed in a different order, allow rounding
+    if abs(stored["weight_sum"] - expected["weight_sum"]) > 1e-6 * max(
+        1.0, abs(expected["weight_sum"])
+    ):
+        return True
+    return (
+        stored["player_count"] != expected["player_count"]
+        or stored["connected_count"] != expected["connected_count"]
+    )
+
+
+class TeamStatsRepository:
+    """
+    Materialized weight sum, player count and connected count of every team.
+
+    Writers call add_members/remove_members around any change of the team
+    or the weight or connection of members, in the same transaction, so
+    reading the stats of a team costs one row whatever its size.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def add_members(
+        self, member_ids: List[int], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> None:
+        """Count the members in their current team"""
+        for query, params in apply_members_statements(member_ids, 1, chunk_size):
+            self.cursor.execute(query, params)
+
+    def remove_members(
+        self, member_ids: List[int], chunk_size: int = BatchConfig.CHUNK_SIZE
+    ) -> None:
+        """Stop counting the members in their current team"""
+        for query, params in apply_members_statements(member_ids, -1, chunk_size):
+            self.cursor.execute(query, params)
+
+    def set_all_connected(self, is_logged_in: bool) -> None:
+        """Every member was (dis)connected at once"""
+        self.cursor.execute(
+            "UPDATE team_stats SET connected_count = IF(%s, player_count, 0)",
+            (bool(is_logged_in),),
+        )
+
+    def delete_team(self, team_id: int) -> None:
+        self.cursor.execute("DELETE FROM team_stats WHERE team_id = %s", (team_id,))
+
+    def get_stats(self) -> Dict[int, Dict]:
+        """team id -> stored stats"""
+        self.cursor.execute(
+            "SELECT team_id, weight_sum, player_count, connected_count "
+            "FROM team_stats"
+        )
+        return {row["team_id"]: row for row in self.cursor.fetchall()}
+
+    def recompute(self) -> Dict[int, Dict]:
+        """team id -> stats summed from the members, O(members)"""
+        self.cursor.execute(RECOMPUTE_QUERY)
+        return {row["team_id"]: row for row in self.cursor.fetchall()}
+
+    def reconcile(self) -> List[Dict]:
+        """
+        Compare the stored stats with a full recompute
+
+        Returns:
+            list: team_id, stored and expected stats of every team that
+            differs; stored is None for a missing row, expected is None for
+            a row of a deleted team
+        """
+        stored = self.get_stats()
+        expected = self.recompute()
+        zero = dict.fromkeys(STATS_FIELDS, 0)
+        drift = []
+        for team_id, stats in expected.items():
+            if _differs(stored.get(team_id, zero), stats):
+                drift.append(
+                    {
+                        "team_id": team_id,
+                        "stored": stored.get(team_id),
+                        "expected": stats,
+                    }
+                )
+        for team_id in stored.keys() - expected.keys():
+            drift.append(
+                {"team_id": team_id, "stored": stored[team_id], "expected": None}
+            )
+        return sorted(drift, key=lambda entry: entry["team_id"])
+
+    def rebuild(self) -> None:
+        """Replace every stored stat by a full recompute"""
+        self.cursor.execute("DELETE FROM team_stats")
+        self.cursor.execute(
+            "INSERT INTO team_stats (team_id, weight_sum, player_count, "
+            f"connected_count) {RECOMPUTE_QUERY}"
+        )
@@ -0,0 +1,71 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from core.cache import read_cache
+from core.database import get_pool
+from core.events import broker
+from core.instrumentation import slow_query_log
+
+admin_bp = Blueprint("admin", __name__)
+
+
+@admin_bp.route("/pool", methods=["GET"])
+@jwt_required()
+def pool_stats():
+    """
+    GET: Connection pool usage (in use, idle, wait time, checkouts/sec)
+    """
+    return jsonify(
+        {
+            "status": "success",
+            "data": get_pool().stats(),
+        }
+    )
+
+
+@admin_bp.route("/cache", methods=["GET"])
+@jwt_required()
+def cache_stats():
+    """
+    GET: Read cache hit/miss counters
+    """
+    return jsonify(
+        {
+            "status": "success",
+            "data": read_cache.stats(),
+        }
+    )
+
+
+@admin_bp.route("/slow-queries", methods=["GET", "DELETE"])
+@jwt_required()
+def slow_queries():
+    """
+    GET: Most recent statements slower than PLG_SLOW_QUERY_MS, newest first
+    DELETE: Empty the slow query log
+    """
+    if request.method == "DELETE":
+        slow_query_log.clear()
+        return jsonify({"status": "success"})
+
+    return jsonify(
+        {
+            "status": "success",
+            "threshold_ms": slow_query_log.threshold_ms,
+            "data": slow_query_log.entries(),
+        }
+    )
+
+
+@admin_bp.route("/events", methods=["GET"])
+@jwt_required()
+def events_stats():
+    """
+    GET: Event subscribers of this worker and buffered events
+    """
+    return jsonify(
+        {
+            "status": "success",
+            "data": broker.stats(),
+        }
+    )
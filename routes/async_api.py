@@ -0,0 +1,326 @@
+import json
+import logging
+from functools import partial, wraps
+
+import jwt
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_etags
+
+from core.async_database import async_streaming_cursor, async_transaction
+from core.auth import claims_cache, revoked_tokens
+from core.events import TooManySubscribers, broker, publish_on_commit
+from core.config import BatchConfig, EventsConfig
+from core.json_provider import dto_default
+from core.versioning import data_versions
+from repositories.member import AsyncMemberRepository
+from repositories.team import AsyncTeamRepository
+from repositories.team_member import AsyncTeamMemberRepository
+from routes.members import (
+    PAGE_PARAMS,
+    _encode_cursor,
+    _parse_page_args,
+    _validate_member,
+    _validate_members,
+)
+from routes.events import SSE_HEADERS
+from routes.team_members import (
+    _assignment_results,
+    _assignments_event,
+    _requested_pairs,
+    _requested_teams,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(content) -> str:
+    return json.dumps(content, default=dto_default, separators=(",", ":"))
+
+
+class DTOJSONResponse(JSONResponse):
+    """JSONResponse that serializes DTOs through their `to_dict()`"""
+
+    def render(self, content) -> bytes:
+        return _dumps(content).encode("utf-8")
+
+
+def jwt_required(endpoint=None, *, query_string: bool = False):
+    """
+    Accept the access tokens issued by POST /auth/login, also as ?jwt= with
+    `query_string` (EventSource cannot send headers)
+    """
+    if endpoint is None:
+        return partial(jwt_required, query_string=query_string)
+
+    @wraps(endpoint)
+    async def wrapper(request: Request):
+        header = request.headers.get("Authorization", "")
+        if header.startswith("Bearer "):
+            token = header[len("Bearer ") :]
+        elif query_string and request.query_params.get("jwt"):
+            token = request.query_params["jwt"]
+        else:
+            return DTOJSONResponse({"msg": "Missing Authorization Header"}, 401)
+
+        claims = claims_cache.get(token)
+        if claims is None:
+            try:
+                claims = jwt.decode(
+                    token,
+                    request.app.state.jwt_secret,
+                    algorithms=[request.app.state.jwt_algorithm],
+                )
+            except jwt.ExpiredSignatureError:
+                return DTOJSONResponse({"msg": "Token has expired"}, 401)
+            except jwt.InvalidTokenError as e:
+                return DTOJSONResponse({"msg": str(e)}, 422)
+            claims_cache.put(token, claims)
+
+        if claims.get("type") != "access":
+            return DTOJSONResponse({"msg": "Only non-refresh tokens are allowed"}, 422)
+        if revoked_tokens.is_revoked(claims["jti"]):
+            return DTOJSONResponse({"msg": "Token has been revoked"}, 401)
+
+        request.state.jwt = claims
+        return await endpoint(request)
+
+    return wrapper
+
+
+def conditional_get(*tables: str):
+    """Async counterpart of core.versioning.conditional_get"""
+
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(request: Request):
+            if request.method != "GET":
+                return await endpoint(request)
+
+            etag = data_versions.etag(*tables, salt=request.scope["query_string"])
+            if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+                response = Response(status_code=304)
+            else:
+                response = await endpoint(request)
+                if response.status_code != 200:
+                    return response
+            response.headers["ETag"] = f'W/"{etag}"'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _ndjson_response(
+    pool, rows_for, batch_size: int = BatchConfig.STREAM_FETCH_SIZE
+) -> StreamingResponse:
+    """Async counterpart of core.streaming.ndjson_response"""
+
+    async def generate():
+        async with async_streaming_cursor(pool) as cursor:
+            lines = []
+            async for row in rows_for(cursor):
+                lines.append(_dumps(row))
+                if len(lines) >= batch_size:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+async def _json_body(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@jwt_required
+@conditional_get("members", "team_members", "teams")
+async def handle_members(request: Request):
+    """
+    GET: Retrieve all members, one page of them or a ndjson stream
+    POST: Add one or multiple members
+    """
+    pool = request.app.state.db_pool
+    args = request.query_params
+
+    if request.method == "GET":
+        if args.get("stream") == "ndjson":
+            return _ndjson_response(
+                pool, lambda cursor: AsyncMemberRepository(cursor).iter_all_members()
+            )
+
+        if PAGE_PARAMS.intersection(args.keys()):
+            try:
+                fields, limit, filters = _parse_page_args(args)
+            except ValueError as e:
+                return DTOJSONResponse({"status": "error", "error": str(e)}, 400)
+
+            async with async_transaction(pool) as (db, cursor):
+                repo = AsyncMemberRepository(cursor)
+                members, next_after = await repo.get_members_page(
+                    fields=fields, limit=limit, **filters
+                )
+
+            return DTOJSONResponse(
+                {
+                    "status": "success",
+                    "data": members,
+                    "next_cursor": _encode_cursor(next_after) if next_after else None,
+                }
+            )
+
+        async with async_transaction(pool) as (db, cursor):
+            members = await AsyncMemberRepository(cursor).get_all_members()
+
+        return DTOJSONResponse({"status": "success", "data": members})
+
+    # POST method
+    data = await _json_body(request)
+    if not data:
+        return DTOJSONResponse({"status": "error", "error": "No data provided"})
+
+    if isinstance(data, list):
+        accepted, rejected = _validate_members(data)
+        if not accepted:
+            return DTOJSONResponse(
+                {
+                    "status": "error",
+                    "error": "No valid member provided",
+                    "rejected": rejected,
+                }
+            )
+
+        async with async_transaction(pool) as (db, cursor):
+            ids = await AsyncMemberRepository(cursor).add_members(accepted)
+
+        return DTOJSONResponse(
+            {
+                "status": "success",
+                "message": "Members added successfully",
+                "members": ids,
+                "rejected": rejected,
+            }
+        )
+
+    try:
+        member = _validate_member(data)
+    except ValueError as e:
+        return DTOJSONResponse({"error": str(e), "status": "error"})
+
+    async with async_transaction(pool) as (db, cursor):
+        member_id = await AsyncMemberRepository(cursor).add_member(member)
+
+    return DTOJSONResponse(
+        {
+            "status": "success",
+            "message": "Members added successfully",
+            "member": member_id,
+        }
+    )
+
+
+@jwt_required
+@conditional_get("teams")
+async def handle_teams_list(request: Request):
+    """GET: Retrieve all teams"""
+    async with async_transaction(request.app.state.db_pool) as (db, cursor):
+        teams = await AsyncTeamRepository(cursor).get_all_teams()
+
+    return DTOJSONResponse({"status": "success", "data": teams})
+
+
+@jwt_required
+@conditional_get("teams", "team_members", "members")
+async def handle_teams_players(request: Request):
+    """GET: Retrieve all teams with their players, or a ndjson stream"""
+    pool = request.app.state.db_pool
+    if request.query_params.get("stream") == "ndjson":
+        return _ndjson_response(
+            pool, lambda cursor: AsyncTeamRepository(cursor).iter_teams_with_players()
+        )
+
+    async with async_transaction(pool) as (db, cursor):
+        teams = await AsyncTeamRepository(cursor).get_teams_and_players()
+
+    return DTOJSONResponse({"status": "success", "data": teams})
+
+
+@jwt_required
+async def handle_team_members(request: Request):
+    """PATCH: Move members to teams"""
+    data = await _json_body(request)
+    if not data:
+        return DTOJSONResponse({"status": "error", "error": "No data provided"})
+
+    if "teams" not in data:
+        return DTOJSONResponse(
+            {"status": "error", "error": "Invalid request format. 'teams'."}, 400
+        )
+
+    try:
+        async with async_transaction(request.app.state.db_pool) as (db, cursor):
+            requested, invalid = _requested_teams(data["teams"])
+            succeeded, failed = await AsyncTeamMemberRepository(cursor).assign_many(
+                _requested_pairs(requested)
+            )
+            successful_assignments, failed_assignments = _assignment_results(
+                requested, succeeded, failed
+            )
+            if succeeded:
+                publish_on_commit("team_members.changed", _assignments_event(succeeded))
+    except Exception as e:
+        logger.exception("unexpected error")
+        return DTOJSONResponse(
+            {"status": "error", "error": f"Unexpected error: {str(e)}"}, 500
+        )
+
+    return DTOJSONResponse(
+        {
+            "status": "success",
+            "message": "Members teams changed",
+            "successful_assignments": successful_assignments,
+            "failed_assignments": invalid + failed_assignments,
+        }
+    )
+
+
+@jwt_required(query_string=True)
+async def stream_events(request: Request):
+    """GET: Server-Sent Events, as GET /events of the Flask app"""
+    try:
+        subscription = broker.subscribe_async(request.headers.get("Last-Event-ID"))
+    except TooManySubscribers:
+        return DTOJSONResponse(
+            {"status": "error", "error": "Too many event subscribers"},
+            503,
+            {"Retry-After": str(EventsConfig.RETRY_MS // 1000)},
+        )
+    return StreamingResponse(
+        subscription, media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@jwt_required
+async def async_pool_stats(request: Request):
+    """GET: aiomysql pool usage of this worker"""
+    return DTOJSONResponse(
+        {"status": "success", "data": request.app.state.db_pool.stats()}
+    )
+
+
+# Every other route, and other methods of these paths, are served by the
+# Flask app mounted behind them
+async_routes = [
+    Route("/members", handle_members, methods=["GET", "POST"]),
+    Route("/teams", handle_teams_list, methods=["GET"]),
+    Route("/teams/players", handle_teams_players, methods=["GET"]),
+    Route("/team-members", handle_team_members, methods=["PATCH"]),
+    Route("/events", stream_events, methods=["GET"]),
+    Route("/admin/async-pool", async_pool_stats, methods=["GET"]),
+]
@@ -1,35 +1,105 @@
-import os
-from flask import Blueprint, request, jsonify
+import math
+
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import (
     create_access_token,
+    create_refresh_token,
+    decode_token,
+    get_jwt,
     jwt_required,
     get_jwt_identity,
 )
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import InvalidTokenError
+
+from core.auth import revoke_token
+from core.config import LoginConfig
+from core.metrics import metrics
+from core.rate_limit import TokenBucketLimiter
 
 auth_bp = Blueprint("auth", __name__)
 
+ip_limiter = TokenBucketLimiter(
+    LoginConfig.IP_BURST, LoginConfig.IP_RATE, LoginConfig.MAX_CLIENTS
+)
+username_limiter = TokenBucketLimiter(
+    LoginConfig.USER_BURST, LoginConfig.USER_RATE, LoginConfig.MAX_CLIENTS
+)
+
+
+def _too_many_attempts(retry_after: float, limit: str):
+    metrics.inc("plg_login_throttled_total", {"limit": limit})
+    return (
+        jsonify({"msg": "Too many login attempts"}),
+        429,
+        {"Retry-After": str(math.ceil(retry_after))},
+    )
+
 
 @auth_bp.route("/login", methods=["POST"])
 def login():
+    # Throttle before reading the body, let alone hashing the password
+    retry_after = ip_limiter.acquire(request.remote_addr)
+    if retry_after:
+        return _too_many_attempts(retry_after, "ip")
+
     if request.json is None:
         return jsonify({"msg": "No JSON data provided"}), 400
 
     username = request.json.get("username")
     password = request.json.get("password")
 
-    usernam_env = os.getenv("APP_USERNAME")
-    password_env = os.getenv("APP_PASSWORD")
-
-    if username is None or password is None:
+    if not isinstance(username, str) or not isinstance(password, str):
         return jsonify({"msg": "Missing username or password"}), 400
 
-    if username != usernam_env or password != password_env:
+    # Bounded key, the limiter keeps up to MAX_CLIENTS of them
+    retry_after = username_limiter.acquire(username[:256])
+    if retry_after:
+        return _too_many_attempts(retry_after, "username")
+
+    if not current_app.extensions["credentials"].check(username, password):
         return jsonify({"msg": "Bad username or password"}), 401
 
     access_token = create_access_token(identity=username)
+    refresh_token = create_refresh_token(identity=username)
+    return jsonify(access_token=access_token, refresh_token=refresh_token)
+
+
+@auth_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    """Exchange a refresh token for a new access token"""
+    access_token = create_access_token(identity=get_jwt_identity())
     return jsonify(access_token=access_token)
 
 
+@auth_bp.route("/logout", methods=["POST"])
+@jwt_required(verify_type=False)
+def logout():
+    """
+    Revoke the token of the request, and the refresh token given in the
+    body as {"refresh_token": ...} when there is one
+    """
+    claims = get_jwt()
+    refresh_claims = None
+    refresh_token = (request.get_json(silent=True) or {}).get("refresh_token")
+    if refresh_token:
+        try:
+            refresh_claims = decode_token(refresh_token)
+        except (InvalidTokenError, JWTExtendedException):
+            return jsonify({"msg": "Invalid refresh token"}), 422
+        if (
+            refresh_claims["type"] != "refresh"
+            or refresh_claims["sub"] != claims["sub"]
+        ):
+            return jsonify({"msg": "Invalid refresh token"}), 422
+
+    revoke_token(claims)
+    if refresh_claims is not None:
+        revoke_token(refresh_claims)
+    return jsonify(msg="Logged out")
+
+
 @auth_bp.route("/protected", methods=["GET"])
 @jwt_required()
 def protected():
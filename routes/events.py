@@ -0,0 +1,33 @@
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from core.config import EventsConfig
+from core.events import TooManySubscribers, broker
+
+events_bp = Blueprint("events", __name__)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@events_bp.route("", methods=["GET"])
+@jwt_required(locations=["headers", "query_string"])
+def stream_events():
+    """
+    GET: Server-Sent Events of the changes committed from now on, or since
+    the Last-Event-ID header. EventSource clients pass the token as ?jwt=
+    """
+    try:
+        subscription = broker.subscribe(request.headers.get("Last-Event-ID"))
+    except TooManySubscribers:
+        return (
+            jsonify({"status": "error", "error": "Too many event subscribers"}),
+            503,
+            {"Retry-After": str(EventsConfig.RETRY_MS // 1000)},
+        )
+
+    response = Response(
+        iter(subscription), mimetype="text/event-stream", headers=SSE_HEADERS
+    )
+    # Also when the stream is never iterated
+    response.call_on_close(subscription.close)
+    return response
@@ -1,21 +1,42 @@
+import base64
+import binascii
 import json
+import logging
 from flask import Blueprint, request, jsonify, abort
 from flask_jwt_extended import jwt_required
 
 from core.database import database_transaction
-from repositories.member import MemberRepository
+from core.events import publish_on_commit
+from core.versioning import conditional_get
+from core.config import PaginationConfig
+from core.streaming import ndjson_response
+from repositories.member import MemberRepository, MEMBER_FIELDS, SYNC_KEYS
 from repositories.team_member import TeamMemberRepository
+from services.roster_sync import plan_sync
+from services.team_registry import team_registry
 
 members_bp = Blueprint("members", __name__)
 
+logger = logging.getLogger(__name__)
+
+PAGE_PARAMS = {
+    "limit",
+    "cursor",
+    "fields",
+    "team_id",
+    "is_logged_in",
+    "min_weight",
+    "name",
+}
+
 
 @members_bp.errorhandler(404)
 def resource_not_found(e):
     return jsonify(error=str(e)), 404
 
 
-def _validate_and_update_member(repo, player_data):
-    """Helper function to validate and update a single member"""
+def _validate_member(player_data):
+    """Helper function to validate and convert a single member payload"""
     required_fields = ["weight", "smoke_color", "is_logged_in", "name"]
 
     # Check required fields
@@ -44,10 +65,234 @@ def _validate_and_update_member(repo, player_data):
     except (ValueError, TypeError) as e:
         raise ValueError(f"Invalid data format: {str(e)}")
 
-    member_id = repo.add_member(validated_data)
+    return validated_data
+
+
+def _validate_member_changes(player_data):
+    """Validate the fields present in a partial member update"""
+    validated_data = {}
+
+    if "steam_id" in player_data:
+        validated_data["steam_id"] = (
+            str(player_data["steam_id"]) if player_data["steam_id"] else None
+        )
+
+    if "weight" in player_data:
+        try:
+            validated_data["weight"] = float(player_data["weight"])
+        except (ValueError, TypeError):
+            raise ValueError("Weight must be a valid number")
+
+    if "smoke_color" in player_data:
+        validated_data["smoke_color"] = (
+            str(player_data["smoke_color"]) if player_data["smoke_color"] else None
+        )
+
+    if "is_logged_in" in player_data:
+        validated_data["is_logged_in"] = bool(player_data["is_logged_in"])
+
+    if "discord_id" in player_data:
+        validated_data["discord_id"] = (
+            str(player_data["discord_id"]) if player_data["discord_id"] else None
+        )
+
+    if "name" in player_data:
+        validated_data["name"] = str(player_data["name"])
+
+    return validated_data
+
+
+def _validate_member_updates(updates_data):
+    """
+    Validate a list of partial member updates, each with the member `id`
+
+    Returns:
+        tuple: (member id -> validated fields, member id -> team id for the
+        updates moving a member, member id -> index of its update, rejected
+        rows as {"index", "id", "error"})
+    """
+    updates = {}
+    teams = {}
+    indexes = {}
+    rejected = []
+    for index, player_data in enumerate(updates_data):
+        member_id = player_data.get("id") if isinstance(player_data, dict) else None
+        try:
+            if not isinstance(player_data, dict):
+                raise ValueError("Update must be a JSON object")
+            try:
+                member_id = int(player_data["id"])
+            except (KeyError, ValueError, TypeError):
+                raise ValueError("Member ID must be a valid integer")
+            if member_id in updates:
+                raise ValueError(f"Member with ID {member_id} is updated twice")
+            validated_data = _validate_member_changes(player_data)
+            if "team_id" in player_data:
+                try:
+                    teams[member_id] = int(player_data["team_id"])
+                except (ValueError, TypeError):
+                    raise ValueError("Team ID must be a valid integer")
+            updates[member_id] = validated_data
+            indexes[member_id] = index
+        except ValueError as e:
+            rejected.append({"index": index, "id": member_id, "error": str(e)})
+    return updates, teams, indexes, rejected
+
+
+def _validate_member_ids(ids_data):
+    """
+    Validate a list of member ids
+
+    Returns:
+        tuple: (ids, id -> index of its first occurrence, rejected rows as
+        {"index", "id", "error"})
+    """
+    ids = []
+    indexes = {}
+    rejected = []
+    for index, member_id in enumerate(ids_data):
+        try:
+            if isinstance(member_id, bool):
+                raise TypeError()
+            ids.append(int(member_id))
+            indexes.setdefault(ids[-1], index)
+        except (ValueError, TypeError):
+            rejected.append(
+                {
+                    "index": index,
+                    "id": member_id,
+                    "error": "Member ID must be a valid integer",
+                }
+            )
+    return ids, indexes, rejected
+
+
+def _validate_roster(entries, keys):
+    """
+    Validate the entries of a roster, each needs a value for one of `keys`
+
+    Returns:
+        tuple: ((index, validated entry) pairs, rejected rows as
+        {"index", "error"})
+    """
+    roster = []
+    rejected = []
+    for index, player_data in enumerate(entries):
+        try:
+            if not isinstance(player_data, dict):
+                raise ValueError("Member must be a JSON object")
+            validated_data = _validate_member_changes(player_data)
+            if not any(validated_data.get(key) for key in keys):
+                raise ValueError(f"Missing key field: {' or '.join(keys)}")
+            roster.append((index, validated_data))
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+    return roster, rejected
+
+
+def _validate_and_update_member(repo, player_data):
+    """Helper function to validate and update a single member"""
+    member_id = repo.add_member(_validate_member(player_data))
     return member_id
 
 
+def _validate_members(players_data):
+    """
+    Validate a whole list of member payloads up front
+
+    Returns:
+        tuple: (validated members, rejected rows as {"index", "error"})
+    """
+    accepted = []
+    rejected = []
+    for index, player_data in enumerate(players_data):
+        try:
+            if not isinstance(player_data, dict):
+                raise ValueError("Member must be a JSON object")
+            accepted.append(_validate_member(player_data))
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+    return accepted, rejected
+
+
+def _encode_cursor(after):
+    weight, member_id = after
+    raw = json.dumps([float(weight), member_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        weight, member_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(weight), int(member_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def _parse_bool(value):
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
+def _parse_page_args(args):
+    """
+    Read the pagination, filter and projection parameters of GET /members
+
+    Returns:
+        tuple: (fields or None, limit, filters for get_members_page)
+    """
+    limit = int(args.get("limit", PaginationConfig.DEFAULT_LIMIT))
+    if not 0 < limit <= PaginationConfig.MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {PaginationConfig.MAX_LIMIT}")
+
+    fields = None
+    if args.get("fields"):
+        fields = [field.strip() for field in args["fields"].split(",")]
+        unknown = [field for field in fields if field not in MEMBER_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    filters = {
+        "team_id": (int(args["team_id"]) if args.get("team_id") is not None else None),
+        "is_logged_in": (
+            _parse_bool(args["is_logged_in"])
+            if args.get("is_logged_in") is not None
+            else None
+        ),
+        "min_weight": (
+            float(args["min_weight"]) if args.get("min_weight") is not None else None
+        ),
+        "name_prefix": args.get("name"),
+        "after": (_decode_cursor(args["cursor"]) if args.get("cursor") else None),
+    }
+    return fields, limit, filters
+
+
+def _members_page(args):
+    """GET /members with pagination, filters or a `fields=` projection"""
+    try:
+        fields, limit, filters = _parse_page_args(args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+    with database_transaction() as (db, cursor):
+        repo = MemberRepository(cursor)
+        members, next_after = repo.get_members_page(
+            fields=fields, limit=limit, **filters
+        )
+
+    return jsonify(
+        {
+            "status": "success",
+            "data": members,
+            "next_cursor": _encode_cursor(next_after) if next_after else None,
+        }
+    )
+
+
 @members_bp.route("/connection", methods=["PATCH"])
 @jwt_required()
 def handle_connection_members():
@@ -64,6 +309,9 @@ def handle_connection_members():
             with database_transaction() as (db, cursor):
                 repo = MemberRepository(cursor)
                 repo.toggle_connection_all(data["is_logged_in"])
+                publish_on_commit(
+                    "members.connection", {"is_logged_in": data["is_logged_in"]}
+                )
 
                 return jsonify(
                     {
@@ -77,13 +325,23 @@ def handle_connection_members():
 @members_bp.route("", methods=["GET", "POST"])
 @members_bp.route("/", methods=["GET", "POST"])
 @jwt_required()
+@conditional_get("members", "team_members", "teams")
 def handle_members():
-    print(f"Preflight request headers: {request.headers}")
     """
-    GET: Retrieve all members
+    GET: Retrieve all members, or one page of them when any of limit,
+    cursor, fields, team_id, is_logged_in, min_weight or name is given.
+    `stream=ndjson` streams every member as one JSON object per line
     POST: Add one or multiple members
     """
     if request.method == "GET":
+        if request.args.get("stream") == "ndjson":
+            return ndjson_response(
+                lambda cursor: MemberRepository(cursor).iter_all_members()
+            )
+
+        if PAGE_PARAMS.intersection(request.args):
+            return _members_page(request.args)
+
         with database_transaction() as (db, cursor):
             repo = MemberRepository(cursor)
             members = repo.get_all_members()
@@ -105,14 +363,34 @@ def handle_members():
             }
         )
 
+    # Validate the whole batch before opening a transaction
+    if isinstance(data, list):
+        accepted, rejected = _validate_members(data)
+        if not accepted:
+            return jsonify(
+                {
+                    "status": "error",
+                    "error": "No valid member provided",
+                    "rejected": rejected,
+                }
+            )
+
     try:
         with database_transaction() as (db, cursor):
             repo = MemberRepository(cursor)
 
-            # Handle batch updates
+            # Handle batch inserts
             if isinstance(data, list):
-                for player_data in data:
-                    _validate_and_update_member(repo, player_data)
+                ids = repo.add_members(accepted)
+
+                return jsonify(
+                    {
+                        "status": "success",
+                        "message": "Members added successfully",
+                        "members": ids,
+                        "rejected": rejected,
+                    }
+                )
             # Handle single member update
             else:
                 id = _validate_and_update_member(repo, data)
@@ -125,20 +403,240 @@ def handle_members():
                     }
                 )
 
-            return jsonify(
-                {
-                    "status": "success",
-                    "message": "Members added successfully",
-                }
-            )
-
     except json.JSONDecodeError:
         return jsonify({"error": "Invalid JSON data", "status": "error"})
     except ValueError as e:
         return jsonify({"error": str(e), "status": "error"})
 
 
-@members_bp.route("/<int:member_id>", methods=["PUT", "DELETE"])
+@members_bp.route("", methods=["PATCH", "DELETE"])
+@members_bp.route("/", methods=["PATCH", "DELETE"])
+@jwt_required()
+def handle_members_bulk():
+    """
+    PATCH: Update many members, a list of partial updates with their `id`
+    DELETE: Delete many members, a list of ids
+    Both run in one transaction and report the outcome of every member
+    """
+    data = request.get_json()
+    if not data or not isinstance(data, list):
+        return (
+            jsonify({"status": "error", "error": "A list of members is required"}),
+            400,
+        )
+
+    try:
+        if request.method == "DELETE":
+            return _delete_members(data)
+        return _update_members(data)
+    except Exception as e:
+        logger.exception("unexpected error")
+        return (
+            jsonify({"status": "error", "error": f"Unexpected error: {str(e)}"}),
+            500,
+        )
+
+
+def _update_members(data):
+    updates, teams, indexes, rejected = _validate_member_updates(data)
+    if not updates:
+        return jsonify(
+            {
+                "status": "error",
+                "error": "No valid member update provided",
+                "rejected": rejected,
+            }
+        )
+
+    with database_transaction() as (db, cursor):
+        # Unknown teams reject their update before anything is written
+        for member_id, team_id in list(teams.items()):
+            if not team_registry.get(cursor, team_id):
+                rejected.append(
+                    {
+                        "index": indexes[member_id],
+                        "id": member_id,
+                        "error": f"Team with ID {team_id} not found",
+                    }
+                )
+                del updates[member_id], teams[member_id]
+
+        written, missing = MemberRepository(cursor).update_members(updates)
+        for member_id in missing:
+            rejected.append(
+                {
+                    "index": indexes[member_id],
+                    "id": member_id,
+                    "error": f"Member with ID {member_id} not found",
+                }
+            )
+
+        moves = {
+            member_id: team_id
+            for member_id, team_id in teams.items()
+            if member_id in written
+        }
+        if moves:
+            team_member_repo = TeamMemberRepository(cursor)
+            current_teams = team_member_repo.get_team_ids(list(moves))
+            succeeded, failed = team_member_repo.assign_many(
+                (member_id, team_id)
+                for member_id, team_id in moves.items()
+                if current_teams.get(member_id) != team_id
+            )
+            for member_id, team_id in succeeded:
+                written[member_id]["team_id"] = team_id
+            rejected.extend(
+                {
+                    "index": indexes[entry["member_id"]],
+                    "id": entry["member_id"],
+                    "error": entry["error"],
+                }
+                for entry in failed
+            )
+
+        updated = [
+            {"id": member_id, "changes": changes}
+            for member_id, changes in written.items()
+        ]
+        changed = [entry for entry in updated if entry["changes"]]
+        if changed:
+            publish_on_commit("members.updated", {"members": changed})
+
+    return jsonify(
+        {
+            "status": "success",
+            "message": "Members updated successfully",
+            "updated": updated,
+            "rejected": rejected,
+        }
+    )
+
+
+def _delete_members(data):
+    ids, indexes, rejected = _validate_member_ids(data)
+    if not ids:
+        return jsonify(
+            {
+                "status": "error",
+                "error": "No valid member ID provided",
+                "rejected": rejected,
+            }
+        )
+
+    with database_transaction() as (db, cursor):
+        deleted = MemberRepository(cursor).delete_members(ids)
+        if deleted:
+            publish_on_commit("members.deleted", {"ids": deleted})
+
+    found = set(deleted)
+    for member_id, index in indexes.items():
+        if member_id not in found:
+            rejected.append(
+                {
+                    "index": index,
+                    "id": member_id,
+                    "error": f"Member with ID {member_id} not found",
+                }
+            )
+
+    return jsonify(
+        {
+            "status": "success",
+            "message": "Members deleted successfully",
+            "deleted": deleted,
+            "rejected": rejected,
+        }
+    )
+
+
+@members_bp.route("/sync", methods=["POST"])
+@jwt_required()
+def handle_members_sync():
+    """
+    POST: Synchronize the members with a full roster, {"members": [...]}
+
+    Entries are matched with the stored members on `key`, "discord_id"
+    (default), "steam_id" or a list of both tried in order. Only the fields
+    present in an entry are compared and written. Members whose first key
+    is absent from the roster are deleted when `remove_missing` is true.
+    `dry_run` reports the counts without writing anything.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get("members"), list):
+        return (
+            jsonify({"status": "error", "error": "A list of members is required"}),
+            400,
+        )
+
+    keys = data.get("key", "discord_id")
+    if isinstance(keys, str):
+        keys = [keys]
+    if (
+        not isinstance(keys, list)
+        or not keys
+        or any(key not in SYNC_KEYS for key in keys)
+        or len(set(keys)) != len(keys)
+    ):
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": f"key must be one or more of {', '.join(SYNC_KEYS)}",
+                }
+            ),
+            400,
+        )
+    remove_missing = bool(data.get("remove_missing", False))
+    dry_run = bool(data.get("dry_run", False))
+
+    roster, rejected = _validate_roster(data["members"], keys)
+
+    try:
+        with database_transaction() as (db, cursor):
+            repo = MemberRepository(cursor)
+            plan = plan_sync(roster, repo.iter_members_with_keys(keys), keys)
+            rejected.extend(plan.rejected)
+
+            removed = len(plan.missing) if remove_missing else 0
+            if not dry_run:
+                if plan.inserts:
+                    repo.add_members(plan.inserts)
+                if plan.updates:
+                    repo.update_members(plan.updates, current=plan.current)
+                if removed:
+                    removed = len(repo.delete_members(plan.missing))
+
+            counts = {
+                "inserted": len(plan.inserts),
+                "updated": len(plan.updates),
+                "unchanged": plan.unchanged,
+                "removed": removed,
+                "missing": len(plan.missing),
+                "rejected": len(rejected),
+            }
+            if not dry_run and (plan.inserts or plan.updates or removed):
+                publish_on_commit("members.synced", counts)
+
+        return jsonify(
+            {
+                "status": "success",
+                "message": "Members synchronized successfully",
+                "dry_run": dry_run,
+                "counts": counts,
+                "rejected": sorted(rejected, key=lambda entry: entry["index"]),
+            }
+        )
+
+    except Exception as e:
+        logger.exception("unexpected error")
+        return (
+            jsonify({"status": "error", "error": f"Unexpected error: {str(e)}"}),
+            500,
+        )
+
+
+@members_bp.route("/<int:member_id>", methods=["PUT", "PATCH", "DELETE"])
 @jwt_required()
 def route_member_update(member_id):
     """DELETE MEMBER"""
@@ -160,6 +658,7 @@ def route_member_update(member_id):
 
                 # Delete the member
                 result = repo.delete_member(member_id)
+                publish_on_commit("member.deleted", {"id": member_id})
 
                 return jsonify(
                     {
@@ -169,6 +668,7 @@ def route_member_update(member_id):
                 )
 
         except Exception as e:
+            logger.exception("unexpected error")
             return jsonify(
                 {"status": "error", "error": f"Unexpected error: {str(e)}"},
                 500,
@@ -183,7 +683,8 @@ def route_member_update(member_id):
         with database_transaction() as (db, cursor):
             repo = MemberRepository(cursor)
 
-            # Check if member exists before deleting
+            # The current row answers the 404, tells which fields changed and
+            # is the base of the response
             existing_member = repo.get_member_by_id(member_id)
             if not existing_member:
                 return jsonify(
@@ -193,92 +694,56 @@ def route_member_update(member_id):
                     },
                     404,
                 )
-            # Extract and validate fields
-            validated_data = {}
-
-            # Handle fields that can be updated
-            if "steam_id" in data:
-                validated_data["steam_id"] = (
-                    str(data["steam_id"]) if data["steam_id"] else None
-                )
-
-            if "weight" in data:
+            # Extract and validate fields, the others are left as they are
+            try:
+                validated_data = _validate_member_changes(data)
+            except ValueError as e:
+                return jsonify({"status": "error", "error": str(e)}, 422)
+
+            # If team_id is provided, check the team before writing anything
+            team = None
+            if "team_id" in data:
                 try:
-                    validated_data["weight"] = float(data["weight"])
+                    team_id = int(data["team_id"])
                 except (ValueError, TypeError):
                     return jsonify(
                         {
                             "status": "error",
-                            "error": "Weight must be a valid number",
+                            "error": "Team ID must be a valid integer",
                         },
                         422,
                     )
-
-            if "smoke_color" in data:
-                validated_data["smoke_color"] = (
-                    str(data["smoke_color"]) if data["smoke_color"] else None
-                )
-
-            if "is_logged_in" in data:
-                validated_data["is_logged_in"] = bool(data["is_logged_in"])
-
-            # Required field for the existing update_member method
-            if "discord_id" in data:
-                validated_data["discord_id"] = str(data["discord_id"])
-
-            if "name" in data:
-                validated_data["name"] = str(data["name"])
-
-            # If team_id is provided, update team membership
-            if "team_id" in data:
-                team_member_repo = TeamMemberRepository(cursor)
-
-                try:
-                    team_id = int(data["team_id"])
-                    # Check if team exists
-                    cursor.execute(
-                        "SELECT * FROM teams WHERE team_id = %s", (team_id,)
-                    )
-                    if not cursor.fetchone():
-                        return jsonify(
-                            {
-                                "status": "error",
-                                "error": f"Team with ID {team_id} not found",
-                            },
-                            404,
-                        )
-
-                    team_member_repo.update_team_member(member_id, team_id)
-
-                except (ValueError, TypeError):
+                team = team_registry.get(cursor, team_id)
+                if not team:
                     return jsonify(
                         {
                             "status": "error",
-                            "error": "Team ID must be a valid integer",
+                            "error": f"Team with ID {team_id} not found",
                         },
-                        422,
+                        404,
                     )
 
-            print(validated_data)
+            logger.debug("updating member %s", validated_data)
 
-            # Update member data
-            repo = MemberRepository(cursor)
-            repo.update_member(validated_data, member_id)
-
-            # Fetch updated member data to return
-            cursor.execute(
-                """
-                SELECT
-                    m.*, t.team_id, t.name as team_name,
-                    t.channel_id as team_channel_id
-                FROM members m
-                LEFT JOIN team_members tm ON m.id = tm.member_id
-                LEFT JOIN teams t ON tm.team_id = t.team_id
-                WHERE m.id = %s
-            """,
-                (member_id,),
-            )
-            updated_member = cursor.fetchone()
+            # Update member data, only the columns that changed
+            changes = repo.update_member(validated_data, member_id, existing_member)
+            if team is not None and team_id != existing_member["team_id"]:
+                TeamMemberRepository(cursor).update_team_member(
+                    member_id,
+                    team_id,
+                    has_team=existing_member["team_id"] is not None,
+                )
+                changes["team_id"] = team_id
+            if changes:
+                publish_on_commit(
+                    "member.updated", {"id": member_id, "changes": changes}
+                )
+
+            # Build the updated member from the known values, no re-read
+            updated_member = dict(existing_member, **changes)
+            if "team_id" in changes:
+                updated_member["team_name"] = team["name"]
+                updated_member["team_channel_id"] = team["channel_id"]
 
             return jsonify(
                 {
@@ -293,6 +758,5 @@ def route_member_update(member_id):
     except ValueError as e:
         return jsonify({"status": "error", "error": str(e)}, 500)
     except Exception as e:
-        return jsonify(
-            {"status": "error", "error": f"Unexpected error: {str(e)}"}, 500
-        )
+        logger.exception("unexpected error")
+        return jsonify({"status": "error", "error": f"Unexpected error: {str(e)}"}, 500)
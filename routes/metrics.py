@@ -0,0 +1,23 @@
+import hmac
+
+from flask import Blueprint, Response, jsonify, request
+
+from core.config import MetricsConfig
+from core.metrics import metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("", methods=["GET"])
+def export_metrics():
+    """
+    GET: Every worker's metrics in the Prometheus text format
+    """
+    if MetricsConfig.TOKEN:
+        expected = f"Bearer {MetricsConfig.TOKEN}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            return jsonify({"msg": "Bad metrics token"}), 401
+
+    return Response(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
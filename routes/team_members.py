@@ -1,11 +1,138 @@
+import logging
+
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 
 from core.database import database_transaction
+from core.events import publish_on_commit
 from repositories.team_member import TeamMemberRepository
 
 teams_members_bp = Blueprint("teams_members", __name__)
 
+logger = logging.getLogger(__name__)
+
+
+def _normalize(pair):
+    """Compare (member_id, team_id) pairs as integers when possible"""
+    try:
+        return int(pair[0]), int(pair[1])
+    except (ValueError, TypeError):
+        return pair
+
+
+def _is_id(value):
+    """Ids are integers or strings, anything else cannot be compared or hashed"""
+    return isinstance(value, (int, str)) and not isinstance(value, bool)
+
+
+def _requested_teams(teams):
+    """
+    Split the `teams` of a PATCH body into (team_id, members) requests and
+    the failed entries of teams without an id or members, and of member ids
+    that are not integers or strings
+    """
+    requested = []
+    invalid = []
+    for team in teams if isinstance(teams, list) else []:
+        team_id = team.get("id") if isinstance(team, dict) else None
+        members = team.get("members", []) if isinstance(team, dict) else []
+
+        if not team_id or not _is_id(team_id) or not isinstance(members, list):
+            invalid.append(
+                {
+                    "team_id": team_id if _is_id(team_id) else None,
+                    "members": members if isinstance(members, list) else [],
+                    "error": "Invalid team or player list",
+                }
+            )
+            continue
+
+        bad_members = [member_id for member_id in members if not _is_id(member_id)]
+        if bad_members:
+            invalid.append(
+                {
+                    "team_id": team_id,
+                    "members": bad_members,
+                    "error": "Member ID must be an integer or a string",
+                }
+            )
+            members = [member_id for member_id in members if _is_id(member_id)]
+
+        if not members:
+            if not bad_members:
+                invalid.append(
+                    {
+                        "team_id": team_id,
+                        "members": members,
+                        "error": "Invalid team or player list",
+                    }
+                )
+            continue
+
+        requested.append((team_id, members))
+    return requested, invalid
+
+
+def _requested_pairs(requested):
+    return (
+        (member_id, team_id) for team_id, members in requested for member_id in members
+    )
+
+
+def _assignment_results(requested, succeeded, failed):
+    """
+    Per team results of assign_many
+
+    Returns:
+        tuple: (successful assignments, failed assignments)
+    """
+    successful_assignments = []
+    failed_assignments = []
+    succeeded = set(succeeded)
+    errors = {
+        _normalize((entry["member_id"], entry["team_id"])): entry["error"]
+        for entry in failed
+    }
+
+    for team_id, members in requested:
+        team_successful = []
+        team_failed = []
+
+        for member_id in members:
+            key = _normalize((member_id, team_id))
+            if key in errors:
+                team_failed.append({"member_id": member_id, "error": errors[key]})
+            elif key in succeeded:
+                team_successful.append(member_id)
+            else:
+                team_failed.append(
+                    {
+                        "member_id": member_id,
+                        "error": "Member assigned to another team "
+                        "in the same request",
+                    }
+                )
+
+        # Track overall team assignment results
+        if team_failed:
+            failed_assignments.append(
+                {
+                    "team_id": team_id,
+                    "successful_members": team_successful,
+                    "failed_members": team_failed,
+                }
+            )
+        else:
+            successful_assignments.append(
+                {"team_id": team_id, "players": team_successful}
+            )
+    return successful_assignments, failed_assignments
+
+
+def _assignments_event(succeeded):
+    """[member id, team id] pairs of the assignments made"""
+    return {"assignments": [[member_id, team_id] for member_id, team_id in succeeded]}
+
 
 @teams_members_bp.route("", methods=["PATCH"])
 @jwt_required()
@@ -35,50 +162,15 @@ def handle_team_members():
     try:
         with database_transaction() as (db, cursor):
             repo = TeamMemberRepository(cursor)
+            requested, invalid = _requested_teams(data["teams"])
 
-            successful_assignments = []
-            failed_assignments = []
-
-            for team in data["teams"]:
-                print(team)
-                team_id = team.get("id")
-                members = team.get("members", [])
-
-                if not team_id or not members:
-                    failed_assignments.append(
-                        {
-                            "team_id": team_id,
-                            "members": members,
-                            "error": "Invalid team or player list",
-                        }
-                    )
-                    continue
-
-                team_successful = []
-                team_failed = []
-
-                for member_id in members:
-                    try:
-                        repo.update_team_member(member_id, team_id)
-                        team_successful.append(member_id)
-                    except Exception as e:
-                        team_failed.append(
-                            {"member_id": member_id, "error": str(e)}
-                        )
-
-                # Track overall team assignment results
-                if team_failed:
-                    failed_assignments.append(
-                        {
-                            "team_id": team_id,
-                            "successful_members": team_successful,
-                            "failed_members": team_failed,
-                        }
-                    )
-                else:
-                    successful_assignments.append(
-                        {"team_id": team_id, "players": team_successful}
-                    )
+            # Assign every member of every team in one batch
+            succeeded, failed = repo.assign_many(_requested_pairs(requested))
+            successful_assignments, failed_assignments = _assignment_results(
+                requested, succeeded, failed
+            )
+            if succeeded:
+                publish_on_commit("team_members.changed", _assignments_event(succeeded))
 
             db.commit()
 
@@ -86,11 +178,14 @@ def handle_team_members():
             {
                 "status": "success",
                 "message": "Members teams changed",
+                "successful_assignments": successful_assignments,
+                "failed_assignments": invalid + failed_assignments,
             },
             200,
         )
 
     except Exception as e:
+        logger.exception("unexpected error")
         return jsonify(
             {"status": "error", "error": f"Unexpected error: {str(e)}"},
             500,
@@ -2,20 +2,74 @@ from flask import Blueprint, request, jsonify, abort
 from flask_jwt_extended import jwt_required
 
 import json
+import logging
+import math
+import time
 from core.database import database_transaction
+from core.events import publish_on_commit
+from core.metrics import metrics
+from core.versioning import conditional_get
+from core.streaming import ndjson_response
 from repositories.team import TeamRepository
 from repositories.member import MemberRepository
 from repositories.team_member import TeamMemberRepository
 from services.team_balancer import TeamBalancer
-from core.config import TeamConfig
+from services.constrained_balancer import BalanceConstraints
+from services.team_registry import team_registry
+from core.config import TeamConfig, BalancerConfig
 
 teams_bp = Blueprint("teams", __name__)
 
+logger = logging.getLogger(__name__)
 
-@teams_bp.route("/<int:team_id>", methods=["PUT", "DELETE"])
+
+def _parse_pairs(raw, name):
+    pairs = []
+    for pair in raw or []:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            raise ValueError(f"{name} must be a list of [member_id, member_id]")
+        pairs.append((int(pair[0]), int(pair[1])))
+    return pairs
+
+
+def _parse_constraints(raw):
+    """
+    Build BalanceConstraints from the generate request body
+
+    `pinned` may be a {member_id: team_id} object or a list of member ids
+    that keep their current team, which is resolved later.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("constraints must be an object")
+
+    try:
+        pinned = raw.get("pinned") or {}
+        if isinstance(pinned, dict):
+            pinned = {int(member): int(team) for member, team in pinned.items()}
+        else:
+            pinned = {int(member): None for member in pinned}
+
+        return BalanceConstraints(
+            min_players=(
+                int(raw["min_players"]) if raw.get("min_players") is not None else None
+            ),
+            max_players=(
+                int(raw["max_players"]) if raw.get("max_players") is not None else None
+            ),
+            equal_headcount=bool(raw.get("equal_headcount", False)),
+            pinned=pinned,
+            together=_parse_pairs(raw.get("together"), "together"),
+            apart=_parse_pairs(raw.get("apart"), "apart"),
+            balance_sides=bool(raw.get("balance_sides", False)),
+        )
+    except (TypeError, AttributeError):
+        raise ValueError("Invalid constraints format")
+
+
+@teams_bp.route("/<int:team_id>", methods=["PUT", "PATCH", "DELETE"])
 @jwt_required()
 def handle_team(team_id):
-    if request.method == "PUT":
+    if request.method in ("PUT", "PATCH"):
         """UPDATE Team"""
         data = request.get_json()
         if not data:
@@ -25,17 +79,18 @@ def handle_team(team_id):
             with database_transaction() as (db, cursor):
                 repo = TeamRepository(cursor)
 
-                # Check if member exists before deleting
-                existing_team = repo.get_team_by_id(team_id)
+                # The registry row answers the 404 and is the base of the
+                # response, it must not be mutated
+                existing_team = team_registry.get(cursor, team_id)
                 if not existing_team:
                     return jsonify(
                         {
                             "status": "error",
-                            "error": f"Member with ID {data['id']} not found",
+                            "error": f"Team with ID {team_id} not found",
                         },
                         404,
                     )
-                # Extract and validate fields
+                # Extract and validate fields, the others are left as they are
                 validated_data = {}
 
                 # Handle fields that can be updated
@@ -58,18 +113,23 @@ def handle_team(team_id):
 
                 validated_data["id"] = team_id
 
-                print(validated_data)
+                logger.debug("updating team %s", validated_data)
 
-                # Update member data
-                repo.update_team(validated_data)
+                # Update team data, only the columns that changed
+                changes = repo.update_team(validated_data, existing_team)
+                if changes:
+                    publish_on_commit(
+                        "team.updated", {"id": team_id, "changes": changes}
+                    )
 
-                updated_member = repo.get_team_by_id(team_id)
+                # Build the updated team from the known values, no re-read
+                updated_team = dict(existing_team, **changes)
 
                 return jsonify(
                     {
                         "status": "success",
-                        "message": "Member updated successfully",
-                        "data": updated_member,
+                        "message": "Team updated successfully",
+                        "data": updated_team,
                     }
                 )
 
@@ -78,6 +138,7 @@ def handle_team(team_id):
         except ValueError as e:
             return jsonify({"status": "error", "error": str(e)}, 500)
         except Exception as e:
+            logger.exception("unexpected error")
             return jsonify(
                 {"status": "error", "error": f"Unexpected error: {str(e)}"},
                 500,
@@ -89,7 +150,7 @@ def handle_team(team_id):
                 repo = TeamRepository(cursor)
 
                 # Check if member exists before deleting
-                existing_team = repo.get_team_by_id(team_id)
+                existing_team = team_registry.get(cursor, team_id)
                 if not existing_team:
                     return jsonify(
                         {
@@ -101,6 +162,7 @@ def handle_team(team_id):
 
                 # Delete the member
                 repo.delete_team(team_id)
+                publish_on_commit("team.deleted", {"id": team_id})
 
                 return jsonify(
                     {
@@ -110,6 +172,7 @@ def handle_team(team_id):
                 )
 
         except Exception as e:
+            logger.exception("unexpected error")
             return jsonify(
                 {"status": "error", "error": f"Unexpected error: {str(e)}"},
                 500,
@@ -121,7 +184,52 @@ def handle_team(team_id):
 def generate_teams():
     """
     Generate balanced teams by distributing connected players based on weight
+
+    Optional JSON body:
+        strategy: one of TeamBalancer.STRATEGIES
+        time_budget: seconds the balancer may spend refining its result
     """
+    options = request.get_json(silent=True) or {}
+    if not isinstance(options, dict):
+        return (
+            jsonify({"status": "error", "error": "Options must be a JSON object"}),
+            400,
+        )
+    strategy = options.get("strategy", BalancerConfig.DEFAULT_STRATEGY)
+    if strategy not in TeamBalancer.STRATEGIES:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": f"Unknown strategy '{strategy}', expected one of "
+                    f"{', '.join(TeamBalancer.STRATEGIES)}",
+                }
+            ),
+            400,
+        )
+
+    try:
+        time_budget = float(options.get("time_budget", BalancerConfig.TIME_BUDGET))
+        if not math.isfinite(time_budget):
+            # A NaN deadline is never reached
+            raise ValueError()
+    except (ValueError, TypeError):
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "time_budget must be a number of seconds",
+                }
+            ),
+            400,
+        )
+    time_budget = min(max(time_budget, 0), BalancerConfig.MAX_TIME_BUDGET)
+
+    try:
+        constraints = _parse_constraints(options.get("constraints") or {})
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
     try:
         with database_transaction() as (db, cursor):
             team_repo = TeamRepository(cursor)
@@ -131,7 +239,7 @@ def generate_teams():
             # Get all teams that are playing, excluding NoTeam
             playing_teams = [
                 team
-                for team in team_repo.get_teams_connected()
+                for team in team_registry.playing_teams(cursor)
                 if team["name"] != TeamConfig.NO_TEAM_NAME
             ]
 
@@ -146,8 +254,6 @@ def generate_teams():
                     400,
                 )
 
-            print("test 1")
-
             # Get all connected players with weight > MIN_WEIGHT
             connected_players = member_repo.get_members_by_login_status(
                 is_logged_in=True
@@ -167,21 +273,64 @@ def generate_teams():
             # Initialize team balancer with playing teams
             balancer = TeamBalancer(playing_teams)
 
-            # For each player, assign them to the most balanced team
+            # Players pinned without a team keep the one they are in
+            keep_current = [
+                member for member, team in constraints.pinned.items() if team is None
+            ]
+            if keep_current:
+                current_teams = team_member_repo.get_team_ids(keep_current)
+                for member in keep_current:
+                    if member in current_teams:
+                        constraints.pinned[member] = current_teams[member]
+                    else:
+                        del constraints.pinned[member]
+
+            # Split the players between the teams in one go
+            started = time.perf_counter()
+            try:
+                result = balancer.balance(
+                    connected_players, strategy, time_budget, constraints
+                )
+            except ValueError as e:
+                return jsonify({"status": "error", "error": str(e)}), 400
+            metrics.observe(
+                "plg_generate_teams_duration_seconds",
+                time.perf_counter() - started,
+                {"strategy": result.strategy},
+            )
+            metrics.observe(
+                "plg_generate_teams_spread",
+                result.spread,
+                {"strategy": result.strategy},
+            )
+
             assignments = []
             for player in connected_players:
-                team_id = balancer.get_balanced_team(player["weight"])
-                team_member_repo.update_team_member(player["id"], team_id)
                 assignments.append(
                     {
                         "player_id": player["id"],
                         "player_name": player["name"],
                         "weight": player["weight"],
-                        "assigned_team_id": team_id,
+                        "assigned_team_id": result.assignments[player["id"]],
                     }
                 )
 
-            print("test 2")
+            team_member_repo.assign_many(
+                (assignment["player_id"], assignment["assigned_team_id"])
+                for assignment in assignments
+            )
+            publish_on_commit(
+                "teams.generated",
+                {
+                    "strategy": result.strategy,
+                    "spread": result.spread,
+                    # [member id, team id] pairs
+                    "assignments": [
+                        [assignment["player_id"], assignment["assigned_team_id"]]
+                        for assignment in assignments
+                    ],
+                },
+            )
 
             # Get updated team data to return in the response
             updated_teams = team_repo.get_teams_with_players_connected()
@@ -193,20 +342,60 @@ def generate_teams():
                     "data": {
                         "assignments": assignments,
                         "teams": updated_teams,
+                        "strategy": result.strategy,
+                        "spread": result.spread,
                     },
                 }
             )
 
     except Exception as e:
+        logger.exception("unexpected error")
         return (
             jsonify({"status": "error", "error": f"Unexpected error: {str(e)}"}),
             500,
         )
 
 
+@teams_bp.route("/players", methods=["GET"])
+@jwt_required()
+@conditional_get("teams", "team_members", "members")
+def handle_teams_players():
+    """
+    GET: Retrieve all teams with their players, `stream=ndjson` streams them
+    as one JSON object per team and line
+    """
+    if request.args.get("stream") == "ndjson":
+        return ndjson_response(
+            lambda cursor: TeamRepository(cursor).iter_teams_with_players()
+        )
+
+    with database_transaction() as (db, cursor):
+        repo = TeamRepository(cursor)
+        teams = repo.get_teams_and_players()
+
+        return jsonify(
+            {
+                "status": "success",
+                "data": teams,
+            }
+        )
+
+
+@teams_bp.route("/summary", methods=["GET"])
+@jwt_required()
+@conditional_get("teams", "team_members", "members")
+def handle_teams_summary():
+    """GET: Weight sum, player count and connected count of every team"""
+    with database_transaction() as (db, cursor):
+        summaries = TeamRepository(cursor).get_team_summaries()
+
+        return jsonify({"status": "success", "data": summaries})
+
+
 @teams_bp.route("/", methods=["GET", "POST"])
 @teams_bp.route("", methods=["GET", "POST"])
 @jwt_required()
+@conditional_get("teams")
 def handle_teams_list():
     """
     GET: Retrieve all teams
@@ -265,6 +454,7 @@ def handle_teams_list():
 
             try:
                 team_id = repo.add_team(validated_data)
+                publish_on_commit("team.created", dict(validated_data, id=team_id))
 
                 return jsonify(
                     {
@@ -274,6 +464,7 @@ def handle_teams_list():
                     }
                 )
             except Exception as e:
+                logger.exception("unexpected error")
                 return jsonify(
                     {
                         "status": "500",
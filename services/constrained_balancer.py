@@ -0,0 +1,361 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core.config import BalancerConfig
+
+SIDE_SIGNS = {"CounterTerrorist": 1, "Terrorist": -1}
+
+
+class InfeasibleConstraintsError(ValueError):
+    """Raised when no assignment can satisfy the requested constraints"""
+
+
+@dataclass
+class BalanceConstraints:
+    min_players: Optional[int] = None
+    max_players: Optional[int] = None
+    # Team sizes differ by at most one player
+    equal_headcount: bool = False
+    # member id -> team id the member has to stay in
+    pinned: Dict[int, int] = field(default_factory=dict)
+    # member id pairs that must share a team
+    together: List[Tuple[int, int]] = field(default_factory=list)
+    # member id pairs that must not share a team
+    apart: List[Tuple[int, int]] = field(default_factory=list)
+    # Keep CounterTerrorist and Terrorist teams at the same total weight
+    balance_sides: bool = False
+
+    def is_empty(self) -> bool:
+        return (
+            self.min_players is None
+            and self.max_players is None
+            and not self.equal_headcount
+            and not self.pinned
+            and not self.together
+            and not self.apart
+            and not self.balance_sides
+        )
+
+
+class _Problem:
+    """
+    Players merged into units (members that must play together), with
+    bitsets of the units each unit must be kept apart from.
+    """
+
+    def __init__(
+        self,
+        member_ids: Sequence[int],
+        weights: Sequence[float],
+        team_ids: Sequence[int],
+        sides: Sequence[Optional[str]],
+        constraints: BalanceConstraints,
+    ):
+        n = len(member_ids)
+        k = len(team_ids)
+        index_of = {member_id: i for i, member_id in enumerate(member_ids)}
+        slot_of = {team_id: slot for slot, team_id in enumerate(team_ids)}
+
+        parent = list(range(n))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for a, b in constraints.together:
+            if a in index_of and b in index_of:
+                parent[find(index_of[a])] = find(index_of[b])
+
+        roots = {}
+        self.members: List[List[int]] = []
+        for i in range(n):
+            root = find(i)
+            if root not in roots:
+                roots[root] = len(self.members)
+                self.members.append([])
+            self.members[roots[root]].append(i)
+        unit_of = [roots[find(i)] for i in range(n)]
+
+        self.weight = [sum(weights[i] for i in unit) for unit in self.members]
+        self.size = [len(unit) for unit in self.members]
+        self.pin: List[Optional[int]] = [None] * len(self.members)
+
+        for member_id, team_id in constraints.pinned.items():
+            if member_id not in index_of:
+                continue
+            if team_id not in slot_of:
+                raise InfeasibleConstraintsError(
+                    f"Member {member_id} is pinned to team {team_id}, "
+                    "which is not playing"
+                )
+            unit = unit_of[index_of[member_id]]
+            if self.pin[unit] not in (None, slot_of[team_id]):
+                raise InfeasibleConstraintsError(
+                    f"Member {member_id} is pinned to a different team "
+                    "than a member it must play with"
+                )
+            self.pin[unit] = slot_of[team_id]
+
+        self.apart = [0] * len(self.members)
+        for a, b in constraints.apart:
+            if a not in index_of or b not in index_of:
+                continue
+            unit_a, unit_b = unit_of[index_of[a]], unit_of[index_of[b]]
+            if unit_a == unit_b:
+                raise InfeasibleConstraintsError(
+                    f"Members {a} and {b} must be both together and apart"
+                )
+            self.apart[unit_a] |= 1 << unit_b
+            self.apart[unit_b] |= 1 << unit_a
+
+        low = constraints.min_players or 0
+        high = constraints.max_players if constraints.max_players else n
+        if constraints.equal_headcount and k:
+            low = max(low, n // k)
+            high = min(high, -(-n // k))
+        if k == 0 or low > high or low * k > n or high * k < n:
+            raise InfeasibleConstraintsError(
+                f"{n} players cannot be split into {k} teams of "
+                f"{low} to {high} players"
+            )
+        self.low, self.high = low, high
+
+        self.k = k
+        self.signs = [SIDE_SIGNS.get(side, 0) for side in sides]
+        self.balance_sides = (
+            constraints.balance_sides
+            and 1 in self.signs
+            and -1 in self.signs
+        )
+        self.unit_of = unit_of
+
+    def cost(self, sums: List[float]) -> float:
+        cost = max(sums) - min(sums)
+        if self.balance_sides:
+            cost += abs(sum(sign * total for sign, total in zip(self.signs, sums)))
+        return cost
+
+
+def solve(
+    member_ids: Sequence[int],
+    weights: Sequence[float],
+    team_ids: Sequence[int],
+    sides: Sequence[Optional[str]],
+    constraints: BalanceConstraints,
+    deadline: float,
+) -> List[int]:
+    """
+    Assign players to team slots under the given constraints
+
+    A first depth-first descent (lightest team first) gives a feasible
+    assignment, moves and swaps between the heaviest and lightest teams
+    improve it, and small rosters are then solved exactly by branch and
+    bound until the deadline.
+
+    Returns:
+        list: Team slot (index in team_ids) of every player
+    """
+    problem = _Problem(member_ids, weights, team_ids, sides, constraints)
+
+    # A budget too short to find any assignment must not pass for infeasible
+    # constraints, the first search gets at least FEASIBLE_TIME_BUDGET
+    first_deadline = max(
+        deadline, time.monotonic() + BalancerConfig.FEASIBLE_TIME_BUDGET
+    )
+    slots = _search(problem, first_deadline, first_only=True)
+    if slots is None:
+        if time.monotonic() > first_deadline:
+            raise InfeasibleConstraintsError(
+                "No team assignment satisfies the constraints within "
+                f"{BalancerConfig.FEASIBLE_TIME_BUDGET:g} seconds"
+            )
+        raise InfeasibleConstraintsError(
+            "No team assignment satisfies the constraints"
+        )
+
+    slots = _improve(problem, slots, deadline)
+
+    if len(problem.members) <= BalancerConfig.EXACT_MAX_PLAYERS:
+        exact = _search(problem, deadline, incumbent=slots)
+        if exact is not None:
+            slots = exact
+
+    return [slots[unit] for unit in problem.unit_of]
+
+
+def _search(
+    problem: _Problem,
+    deadline: float,
+    first_only: bool = False,
+    incumbent: Optional[List[int]] = None,
+) -> Optional[List[int]]:
+    """Branch and bound over units; returns unit slots or None"""
+    k = problem.k
+    units = sorted(
+        range(len(problem.members)),
+        key=lambda u: (
+            problem.pin[u] is None,
+            -problem.size[u],
+            -problem.weight[u],
+        ),
+    )
+    remaining_size = [0] * (len(units) + 1)
+    remaining_weight = [0.0] * (len(units) + 1)
+    for position in range(len(units) - 1, -1, -1):
+        unit = units[position]
+        remaining_size[position] = remaining_size[position + 1] + problem.size[unit]
+        remaining_weight[position] = (
+            remaining_weight[position + 1] + problem.weight[unit]
+        )
+    average = remaining_weight[0] / k
+
+    sums = [0.0] * k
+    counts = [0] * k
+    masks = [0] * k
+    current = [0] * len(problem.members)
+    best_cost = float("inf")
+    best_slots = None
+    if incumbent is not None:
+        best_cost = problem.cost(_unit_sums(problem, incumbent))
+    nodes = 0
+
+    def search(position: int) -> bool:
+        nonlocal best_cost, best_slots, nodes
+        nodes += 1
+        if nodes % 256 == 0 and time.monotonic() > deadline:
+            return False
+
+        if position == len(units):
+            # The last placement is not covered by the `missing` prune below
+            if min(counts) < problem.low:
+                return True
+            cost = problem.cost(sums)
+            if cost < best_cost:
+                best_cost = cost
+                best_slots = list(current)
+            return not first_only
+
+        missing = sum(max(0, problem.low - count) for count in counts)
+        if missing > remaining_size[position]:
+            return True
+
+        lower_bound = max(max(sums), average) - min(
+            min(sums) + remaining_weight[position], average
+        )
+        if lower_bound >= best_cost:
+            return True
+
+        unit = units[position]
+        if problem.pin[unit] is not None:
+            candidates = [problem.pin[unit]]
+        else:
+            candidates = sorted(range(k), key=sums.__getitem__)
+
+        seen = set()
+        for team in candidates:
+            if counts[team] + problem.size[unit] > problem.high:
+                continue
+            if masks[team] & problem.apart[unit]:
+                continue
+            # Empty-handed teams with the same load and side are interchangeable
+            signature = (sums[team], counts[team], problem.signs[team])
+            if masks[team] == 0:
+                if signature in seen:
+                    continue
+                seen.add(signature)
+
+            sums[team] += problem.weight[unit]
+            counts[team] += problem.size[unit]
+            masks[team] |= 1 << unit
+            current[unit] = team
+            keep_going = search(position + 1)
+            sums[team] -= problem.weight[unit]
+            counts[team] -= problem.size[unit]
+            masks[team] &= ~(1 << unit)
+            if not keep_going:
+                return False
+        return True
+
+    search(0)
+    return best_slots
+
+
+def _unit_sums(problem: _Problem, slots: List[int]) -> List[float]:
+    sums = [0.0] * problem.k
+    for unit, team in enumerate(slots):
+        sums[team] += problem.weight[unit]
+    return sums
+
+
+def _improve(problem: _Problem, slots: List[int], deadline: float) -> List[int]:
+    """Moves and swaps of free units that keep every constraint satisfied"""
+    slots = list(slots)
+    k = problem.k
+    sums = _unit_sums(problem, slots)
+    counts = [0] * k
+    masks = [0] * k
+    for unit, team in enumerate(slots):
+        counts[team] += problem.size[unit]
+        masks[team] |= 1 << unit
+
+    free = [unit for unit in range(len(slots)) if problem.pin[unit] is None]
+
+    while time.monotonic() < deadline:
+        cost = problem.cost(sums)
+        heavy = max(range(k), key=sums.__getitem__)
+        light = min(range(k), key=sums.__getitem__)
+        if heavy == light:
+            break
+
+        heavy_units = [u for u in free if slots[u] == heavy]
+        light_units = [u for u in free if slots[u] == light] + [None]
+        best = None
+
+        for u in heavy_units:
+            for v in light_units:
+                size_v = problem.size[v] if v is not None else 0
+                weight_v = problem.weight[v] if v is not None else 0.0
+                bit_v = 1 << v if v is not None else 0
+                heavy_count = counts[heavy] - problem.size[u] + size_v
+                light_count = counts[light] + problem.size[u] - size_v
+                if not (
+                    problem.low <= heavy_count <= problem.high
+                    and problem.low <= light_count <= problem.high
+                ):
+                    continue
+                if problem.apart[u] & (masks[light] & ~bit_v):
+                    continue
+                if v is not None and problem.apart[v] & (
+                    masks[heavy] & ~(1 << u)
+                ):
+                    continue
+
+                candidate = list(sums)
+                candidate[heavy] += weight_v - problem.weight[u]
+                candidate[light] += problem.weight[u] - weight_v
+                candidate_cost = problem.cost(candidate)
+                if candidate_cost < cost and (
+                    best is None or candidate_cost < best[0]
+                ):
+                    best = (candidate_cost, u, v, candidate)
+
+        if best is None:
+            break
+
+        _, u, v, sums = best
+        slots[u] = light
+        counts[heavy] -= problem.size[u]
+        counts[light] += problem.size[u]
+        masks[heavy] &= ~(1 << u)
+        masks[light] |= 1 << u
+        if v is not None:
+            slots[v] = heavy
+            counts[light] -= problem.size[v]
+            counts[heavy] += problem.size[v]
+            masks[light] &= ~(1 << v)
+            masks[heavy] |= 1 << v
+
+    return slots
@@ -0,0 +1,107 @@
+"""
+Roster synchronization: the members of a full roster are matched with the
+stored ones on key columns, and only the difference is written
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from repositories.helpers import changed_columns
+from repositories.member import MEMBER_COLUMNS
+
+
+@dataclass
+class SyncPlan:
+    # Roster entries without a stored member, to insert
+    inserts: List[Dict] = field(default_factory=list)
+    # member id -> columns that differ from the roster entry
+    updates: Dict[int, Dict] = field(default_factory=dict)
+    # Number of matched members equal to their roster entry
+    unchanged: int = 0
+    # Ids of stored members not matched whose first key is absent from the
+    # roster
+    missing: List[int] = field(default_factory=list)
+    # Entries left out, as {"index", "error"}
+    rejected: List[Dict] = field(default_factory=list)
+    # member id -> stored row of every member read
+    current: Dict[int, Dict] = field(default_factory=dict)
+
+
+def plan_sync(
+    roster: Iterable[Tuple[int, Dict]], existing: Iterable[Dict], keys: Sequence[str]
+) -> SyncPlan:
+    """
+    Compare a roster with the stored members in one pass over each
+
+    The stored members are indexed by every key in hash tables, so each
+    entry is matched with a lookup per key, tried in the order of `keys`.
+    When stored members share a key value the one with the lowest id is
+    matched.
+
+    Args:
+        roster: (index in the request, validated entry) pairs, each entry
+            with a value for at least one of `keys`
+        existing: Stored members with a value for any of `keys`, by id
+        keys: Key columns, the first one decides which members are missing
+    """
+    plan = SyncPlan()
+    index = {key: {} for key in keys}
+    for row in existing:
+        plan.current[row["id"]] = row
+        for key in keys:
+            if row[key] is not None:
+                index[key].setdefault(row[key], row["id"])
+
+    seen = {key: set() for key in keys}
+    matched = set()
+    for position, entry in roster:
+        entry_keys = [key for key in keys if entry.get(key) is not None]
+        duplicate = next((key for key in entry_keys if entry[key] in seen[key]), None)
+        if duplicate is not None:
+            plan.rejected.append(
+                {
+                    "index": position,
+                    "error": f"Duplicate {duplicate} {entry[duplicate]}",
+                }
+            )
+            continue
+        for key in entry_keys:
+            seen[key].add(entry[key])
+
+        member_id = next(
+            (index[key][entry[key]] for key in entry_keys if entry[key] in index[key]),
+            None,
+        )
+        if member_id is None:
+            if not entry.get("name"):
+                plan.rejected.append(
+                    {"index": position, "error": "Missing required field: name"}
+                )
+            else:
+                plan.inserts.append(entry)
+        elif member_id in matched:
+            plan.rejected.append(
+                {
+                    "index": position,
+                    "error": f"Member with ID {member_id} matches another entry",
+                }
+            )
+        else:
+            matched.add(member_id)
+            changes = changed_columns(entry, MEMBER_COLUMNS, plan.current[member_id])
+            if changes:
+                plan.updates[member_id] = changes
+            else:
+                plan.unchanged += 1
+
+    # Matched members stay even when matched on another key, or when their
+    # first key changes; unmatched ones sharing a roster key are kept too
+    first = keys[0]
+    plan.missing = [
+        member_id
+        for member_id, row in plan.current.items()
+        if member_id not in matched
+        and row[first] is not None
+        and row[first] not in seen[first]
+    ]
+    return plan
@@ -1,14 +1,41 @@
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from core.config import BalancerConfig
+from services.constrained_balancer import BalanceConstraints, solve
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BalanceResult:
+    strategy: str
+    # member id -> team id
+    assignments: Dict[int, int] = field(default_factory=dict)
+    # team id -> total weight
+    team_weights: Dict[int, float] = field(default_factory=dict)
+    # max - min team weight
+    spread: float = 0
+
+
 class TeamBalancer:
+    STRATEGIES = ("greedy", "karmarkar_karp", "local_search")
+
     def __init__(self, teams):
         self.teams_balance = []
         for team in teams:
-            print(team)
+            logger.debug("balancing team %s", team)
             self.teams_balance.append(
                 {
                     "weight": 0,
                     "id": team["team_id"],
+                    "side": team.get("side"),
                 }
             )
+        self._heap = [(0, index) for index in range(len(self.teams_balance))]
 
     def get_balanced_team(self, member_weight: float) -> int:
         """
@@ -20,6 +47,279 @@ class TeamBalancer:
         Returns:
             int: Team ID of the balanced team
         """
-        minTeam = min(self.teams_balance, key=lambda x: x["weight"])
+        _, index = self._heap[0]
+        minTeam = self.teams_balance[index]
         minTeam["weight"] += member_weight
+        heapq.heapreplace(self._heap, (minTeam["weight"], index))
         return minTeam["id"]
+
+    def balance(
+        self,
+        players: Sequence[Dict],
+        strategy: str = BalancerConfig.DEFAULT_STRATEGY,
+        time_budget: float = BalancerConfig.TIME_BUDGET,
+        constraints: Optional[BalanceConstraints] = None,
+    ) -> BalanceResult:
+        """
+        Split players between the teams so their weights are as close as
+        possible
+
+        Args:
+            players: Rows with at least "id" and "weight"
+            strategy: One of TeamBalancer.STRATEGIES
+            time_budget: Seconds "local_search" may spend refining
+            constraints: Team sizes, pinned players and pairs to respect.
+                When given, the constrained solver replaces `strategy`
+
+        Returns:
+            BalanceResult: Assignments, team weights and final spread
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(
+                f"Unknown strategy '{strategy}', "
+                f"expected one of {', '.join(self.STRATEGIES)}"
+            )
+
+        weights = [float(player["weight"]) for player in players]
+        team_count = len(self.teams_balance)
+
+        if constraints is not None and not constraints.is_empty():
+            strategy = "constrained"
+            slots = solve(
+                [player["id"] for player in players],
+                weights,
+                [team["id"] for team in self.teams_balance],
+                [team["side"] for team in self.teams_balance],
+                constraints,
+                time.monotonic() + time_budget,
+            )
+        elif strategy == "greedy":
+            slots = _greedy(weights, team_count)
+        elif strategy == "karmarkar_karp":
+            slots = _karmarkar_karp(weights, team_count)
+        else:
+            slots = _local_search(
+                weights, team_count, time.monotonic() + time_budget
+            )
+
+        sums = _team_sums(weights, slots, team_count)
+        team_ids = [team["id"] for team in self.teams_balance]
+        for team, weight in zip(self.teams_balance, sums):
+            team["weight"] = weight
+
+        return BalanceResult(
+            strategy=strategy,
+            assignments={
+                player["id"]: team_ids[slot]
+                for player, slot in zip(players, slots)
+            },
+            team_weights=dict(zip(team_ids, sums)),
+            spread=max(sums) - min(sums) if sums else 0,
+        )
+
+
+def _team_sums(weights: List[float], slots: List[int], k: int) -> List[float]:
+    sums = [0.0] * k
+    for weight, slot in zip(weights, slots):
+        sums[slot] += weight
+    return sums
+
+
+def _greedy(weights: List[float], k: int) -> List[int]:
+    """Heaviest player first to the lightest team, O(N log N + N log K)"""
+    slots = [0] * len(weights)
+    heap = [(0.0, team) for team in range(k)]
+    for index in sorted(range(len(weights)), key=lambda i: -weights[i]):
+        total, team = heap[0]
+        slots[index] = team
+        heapq.heapreplace(heap, (total + weights[index], team))
+    return slots
+
+
+def _karmarkar_karp(weights: List[float], k: int) -> List[int]:
+    """
+    K-way largest differencing method.
+
+    Every player starts as a k-tuple of subsets where only one is filled.
+    The two tuples with the largest spread are merged by pairing the
+    heaviest subset of one with the lightest subset of the other until a
+    single tuple is left.
+    """
+    slots = [0] * len(weights)
+    if not weights:
+        return slots
+
+    heap = []
+    for index, weight in enumerate(weights):
+        subsets = [(weight, [index])] + [(0.0, []) for _ in range(k - 1)]
+        heapq.heappush(heap, (-weight, index, subsets))
+
+    while len(heap) > 1:
+        _, order, first = heapq.heappop(heap)
+        _, _, second = heapq.heappop(heap)
+        first.sort(key=lambda subset: -subset[0])
+        second.sort(key=lambda subset: subset[0])
+        merged = [
+            (a[0] + b[0], a[1] + b[1]) for a, b in zip(first, second)
+        ]
+        lightest = min(subset[0] for subset in merged)
+        merged = [(total - lightest, members) for total, members in merged]
+        spread = max(subset[0] for subset in merged)
+        heapq.heappush(heap, (-spread, order, merged))
+
+    for team, (_, members) in enumerate(heap[0][2]):
+        for index in members:
+            slots[index] = team
+    return slots
+
+
+def _local_search(weights: List[float], k: int, deadline: float) -> List[int]:
+    """
+    Start from the better of greedy and Karmarkar-Karp, then improve with
+    moves and swaps between the heaviest and lightest teams until nothing
+    improves or the deadline is hit. Small rosters finish with an exact
+    branch and bound search.
+    """
+    candidates = [_greedy(weights, k), _karmarkar_karp(weights, k)]
+    slots = min(candidates, key=lambda s: _spread(_team_sums(weights, s, k)))
+
+    if k < 2 or not weights:
+        return slots
+
+    slots = _improve(weights, slots, k, deadline)
+
+    if len(weights) <= BalancerConfig.EXACT_MAX_PLAYERS:
+        exact = _branch_and_bound(weights, k, slots, deadline)
+        if exact is not None:
+            slots = exact
+    return slots
+
+
+def _spread(sums: List[float]) -> float:
+    return max(sums) - min(sums)
+
+
+def _improve(
+    weights: List[float], slots: List[int], k: int, deadline: float
+) -> List[int]:
+    slots = list(slots)
+    sums = _team_sums(weights, slots, k)
+
+    while time.monotonic() < deadline:
+        best = _spread(sums)
+        heavy = max(range(k), key=sums.__getitem__)
+        light = min(range(k), key=sums.__getitem__)
+        gap = sums[heavy] - sums[light]
+        if gap <= 0:
+            break
+
+        # Best single move or swap between the heaviest and lightest teams:
+        # shifting `delta` from heavy to light is ideal at gap / 2
+        best_move = None
+        best_delta_error = gap / 2
+        heavy_players = [i for i, s in enumerate(slots) if s == heavy]
+        light_players = [i for i, s in enumerate(slots) if s == light]
+
+        for i in heavy_players:
+            error = abs(gap / 2 - weights[i])
+            if 0 < weights[i] < gap and error < best_delta_error:
+                best_move, best_delta_error = (i, None), error
+            for j in light_players:
+                delta = weights[i] - weights[j]
+                error = abs(gap / 2 - delta)
+                if 0 < delta < gap and error < best_delta_error:
+                    best_move, best_delta_error = (i, j), error
+
+        if best_move is None:
+            break
+
+        i, j = best_move
+        candidate = list(sums)
+        candidate[heavy] -= weights[i]
+        candidate[light] += weights[i]
+        if j is not None:
+            candidate[light] -= weights[j]
+            candidate[heavy] += weights[j]
+        if _spread(candidate) >= best:
+            break
+
+        slots[i] = light
+        if j is not None:
+            slots[j] = heavy
+        sums = candidate
+
+    return slots
+
+
+def _branch_and_bound(
+    weights: List[float], k: int, incumbent: List[int], deadline: float
+) -> Optional[List[int]]:
+    """
+    Exact search for the minimum spread, seeded with `incumbent`.
+
+    Returns None when the deadline is hit before a better assignment than
+    the incumbent is found.
+    """
+    order = sorted(range(len(weights)), key=lambda i: -weights[i])
+    sorted_weights = [weights[i] for i in order]
+    remaining = [0.0] * (len(order) + 1)
+    for position in range(len(order) - 1, -1, -1):
+        remaining[position] = remaining[position + 1] + sorted_weights[position]
+    average = remaining[0] / k
+    # Integer weights that do not split evenly can never reach 0
+    floor = 0
+    if all(weight == int(weight) for weight in weights) and remaining[0] % k:
+        floor = 1
+
+    best_spread = _spread(_team_sums(weights, incumbent, k))
+    best_slots = None
+    if best_spread <= floor:
+        return None
+    sums = [0.0] * k
+    current = [0] * len(order)
+    nodes = 0
+
+    def search(position: int) -> bool:
+        nonlocal best_spread, best_slots, nodes
+        nodes += 1
+        if nodes % 1024 == 0 and time.monotonic() > deadline:
+            return False
+
+        if position == len(order):
+            spread = _spread(sums)
+            if spread < best_spread:
+                best_spread = spread
+                best_slots = list(current)
+            return True
+
+        lower_bound = max(max(sums), average) - min(
+            min(sums) + remaining[position], average
+        )
+        if lower_bound >= best_spread:
+            return True
+
+        seen = set()
+        for team in sorted(range(k), key=sums.__getitem__):
+            # Teams with the same weight are interchangeable
+            if sums[team] in seen:
+                continue
+            seen.add(sums[team])
+
+            sums[team] += sorted_weights[position]
+            current[position] = team
+            finished = search(position + 1)
+            sums[team] -= sorted_weights[position]
+            if not finished:
+                return False
+            if best_spread <= floor:
+                return True
+        return True
+
+    search(0)
+
+    if best_slots is None:
+        return None
+    slots = [0] * len(weights)
+    for position, index in enumerate(order):
+        slots[index] = best_slots[position]
+    return slots
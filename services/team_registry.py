@@ -0,0 +1,71 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from core.config import TeamConfig
+from core.database import database_transaction
+from core.versioning import data_versions
+from repositories.team import TeamRepository
+
+logger = logging.getLogger(__name__)
+
+
+class TeamRegistry:
+    """
+    In-process view of the teams table: id -> team, name -> id and the
+    playing teams.
+
+    Every committed team write bumps the "teams" data version, in this
+    worker or another one, and the registry reloads itself the next time it
+    is used after such a write. Reads in between never touch the database.
+    Callers must not mutate the returned rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_id: Dict[int, Dict] = {}
+        self._id_by_name: Dict[str, int] = {}
+        self._playing: List[Dict] = []
+
+    def load(self, cursor) -> None:
+        version = data_versions.get("teams")
+        teams = TeamRepository(cursor).get_all_teams()
+        with self._lock:
+            self._by_id = {team["team_id"]: team for team in teams}
+            self._id_by_name = {team["name"]: team["team_id"] for team in teams}
+            self._playing = [team for team in teams if team["is_playing"]]
+            self._version = version
+
+    def get(self, cursor, team_id: int) -> Optional[Dict]:
+        self._refresh(cursor)
+        return self._by_id.get(team_id)
+
+    def id_for_name(self, cursor, name: str) -> Optional[int]:
+        self._refresh(cursor)
+        return self._id_by_name.get(name)
+
+    def playing_teams(self, cursor) -> List[Dict]:
+        """Teams flagged is_playing, ordered by id"""
+        self._refresh(cursor)
+        return self._playing
+
+    def no_team_id(self, cursor) -> Optional[int]:
+        return self.id_for_name(cursor, TeamConfig.NO_TEAM_NAME)
+
+    def _refresh(self, cursor) -> None:
+        if self._version != data_versions.get("teams"):
+            self.load(cursor)
+
+
+team_registry = TeamRegistry()
+
+
+def init_team_registry(app) -> None:
+    """Load the registry at startup; it is loaded lazily if the DB is down"""
+    with app.app_context():
+        try:
+            with database_transaction() as (db, cursor):
+                team_registry.load(cursor)
+        except Exception as e:
+            logger.warning(f"team registry not loaded at startup : {str(e)}")
@@ -0,0 +1,69 @@
+import random
+import time
+
+import pytest
+
+from services.constrained_balancer import (
+    BalanceConstraints,
+    InfeasibleConstraintsError,
+    solve,
+)
+
+
+def _team_sizes(slots, team_count):
+    sizes = [0] * team_count
+    for slot in slots:
+        sizes[slot] += 1
+    return sizes
+
+
+def test_last_placement_respects_min_players():
+    constraints = BalanceConstraints(
+        min_players=1, together=[(101, 102)], pinned={100: 1}
+    )
+    with pytest.raises(InfeasibleConstraintsError) as error:
+        solve(
+            [100, 101, 102],
+            [4, 20, 19],
+            [1, 2, 3],
+            [None] * 3,
+            constraints,
+            time.monotonic() + 1,
+        )
+    # The search finished, the error does not blame the time budget
+    assert "seconds" not in str(error.value)
+
+
+def test_team_sizes_stay_within_bounds():
+    rng = random.Random(5)
+    for _ in range(300):
+        player_count = rng.randint(2, 9)
+        team_count = rng.randint(2, 4)
+        member_ids = list(range(100, 100 + player_count))
+        team_ids = list(range(1, team_count + 1))
+        min_players = rng.randint(0, 3) or None
+        max_players = rng.choice([None, rng.randint(2, 5)])
+        together = [tuple(rng.sample(member_ids, 2)) for _ in range(rng.randint(0, 2))]
+        pinned = {
+            member_id: rng.choice(team_ids)
+            for member_id in rng.sample(member_ids, rng.randint(0, 2))
+        }
+        constraints = BalanceConstraints(
+            min_players=min_players,
+            max_players=max_players,
+            together=together,
+            pinned=pinned,
+        )
+        try:
+            slots = solve(
+                member_ids,
+                [rng.randint(1, 50) for _ in member_ids],
+                team_ids,
+                [None] * team_count,
+                constraints,
+                time.monotonic() + 0.05,
+            )
+        except InfeasibleConstraintsError:
+            continue
+        for size in _team_sizes(slots, team_count):
+            assert (min_players or 0) <= size <= (max_players or player_count)
@@ -0,0 +1,36 @@
+from services.roster_sync import plan_sync
+
+KEYS = ["discord_id", "steam_id"]
+
+
+def _member(member_id, discord_id, steam_id, name="player"):
+    return {
+        "id": member_id,
+        "discord_id": discord_id,
+        "steam_id": steam_id,
+        "name": name,
+        "weight": 1.0,
+        "smoke_color": None,
+        "is_logged_in": 0,
+        "team_id": None,
+    }
+
+
+def test_member_matched_by_second_key_is_not_missing():
+    existing = [_member(1, "1", "S")]
+    roster = [(0, {"discord_id": "2", "steam_id": "S"})]
+
+    plan = plan_sync(roster, existing, KEYS)
+
+    assert plan.updates == {1: {"discord_id": "2"}}
+    assert plan.missing == []
+
+
+def test_unmatched_member_is_missing():
+    existing = [_member(1, "1", None), _member(2, "2", None)]
+    roster = [(0, {"discord_id": "1", "name": "player"})]
+
+    plan = plan_sync(roster, existing, KEYS)
+
+    assert plan.unchanged == 1
+    assert plan.missing == [2]